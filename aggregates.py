@@ -0,0 +1,222 @@
+from collections import Counter
+import heapq
+import json
+import math
+import os
+import tempfile
+import columnar_storage
+import file_manager as fm
+import query
+from indexes import value_order_key
+
+# Single-column aggregates.
+# Every aggregate is computed from the value counts of one field: {value: number of records}.
+# On a columnar database those come from that field's column file alone (vectorized when NumPy
+# is installed); on the other formats they come from one streaming scan of the records.
+#
+# min and max order values the same way queries and sorted indexes do, skipping empty values.
+# sum adds up the values that are numbers and ignores the rest.
+#
+# GROUP BY uses hash aggregation: one streaming scan keeps a running partial aggregate per
+# group in a dict. If the dict grows past the memory budget it is sorted and written to a
+# temporary run file and emptied; at the end the runs are merged in key order and partial
+# aggregates of the same group are combined, so memory use is bounded by the budget.
+
+AGGREGATES = ("count", "min", "max", "sum", "distinct", "value_counts")
+GROUP_FUNCTIONS = ("count", "min", "max", "sum", "avg")
+GROUP_MEMORY_LIMIT = 100000  # Groups held in memory before partial aggregates spill to disk
+
+def parse_number(value):
+    """Returns the value as a finite float, or None if it is not a number."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def summarize(value_counts, operation):
+    """Computes one aggregate from a {value: count} mapping."""
+    if operation == "count":
+        return sum(value_counts.values())
+    if operation in ("min", "max"):
+        values = [value for value in value_counts if value != ""]
+        if not values:
+            return None
+        pick = min if operation == "min" else max
+        return pick(values, key=value_order_key)
+    if operation == "sum":
+        total = 0.0
+        for value, count in value_counts.items():
+            number = parse_number(value)
+            if number is not None:
+                total += number * count
+        return total
+    if operation == "distinct":
+        return sorted(value_counts, key=value_order_key)
+    # value_counts: most common first, ties in value order
+    return sorted(value_counts.items(), key=lambda item: (-item[1], value_order_key(item[0])))
+
+def value_counts(db_name, field):
+    """Returns {value: number of live records} for one field."""
+    db = fm.open_database(db_name)
+    if db.storage == "columnar":
+        return columnar_storage.column_value_counts(db_name, db.fields, field)
+    return dict(Counter(str(record.get(field) or "") for _, record in db.iter_records()))
+
+def aggregate(db_name, field, operation):
+    """
+    Computes `operation` (one of AGGREGATES) over every live value of `field`.
+    Raises ValueError if the database, field or operation does not exist.
+    """
+    if operation not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{operation}'. Use one of: {', '.join(AGGREGATES)}")
+    db = fm.open_database(db_name)
+    fields = db.fields
+    if fields is None:
+        raise ValueError(f"Database '{db_name}' does not exist.")
+    if field not in fields:
+        raise ValueError(f"Field '{field}' does not exist.")
+
+    # A numeric column can be reduced as one array without building value counts
+    if db.storage == "columnar" and operation in ("count", "min", "max", "sum"):
+        numbers = columnar_storage.column_numbers(db_name, fields, field)
+        if numbers is not None and len(numbers):
+            if operation == "count":
+                return len(numbers)
+            if operation == "sum":
+                return float(numbers.sum())
+            # Return the stored text of the extreme value, like the scan path does
+            position = numbers.argmin() if operation == "min" else numbers.argmax()
+            return columnar_storage.live_value(db_name, fields, field, int(position))
+
+    return summarize(value_counts(db_name, field), operation)
+
+def parse_group_function(text):
+    """
+    Parses an aggregate such as "count", "count:lname", "sum:roll" or "avg:roll".
+    A bare "count" counts records; with a field it counts the non-empty values of that field.
+    Returns a (function, field or None) tuple. Raises ValueError if the text is not valid.
+    """
+    function, _, field = text.strip().partition(":")
+    function, field = function.strip().lower(), field.strip() or None
+    if function not in GROUP_FUNCTIONS:
+        raise ValueError(f"Unknown aggregate '{text}'. Use one of: {', '.join(GROUP_FUNCTIONS)}")
+    if field is None and function != "count":
+        raise ValueError(f"Aggregate '{function}' needs a field, e.g. '{function}:roll'.")
+    return function, field
+
+def group_function_label(function, field):
+    """Column heading for an aggregate, e.g. "avg(roll)" or "count(*)"."""
+    return f"{function}({field or '*'})"
+
+def value_state(function, value):
+    """The partial aggregate of a single value, or None if the value does not count."""
+    if function == "count":
+        return 1 if value is None or value != "" else 0
+    if function in ("min", "max"):
+        return value if value != "" else None
+    number = parse_number(value)  # sum and avg keep [total, how many numbers]
+    return None if number is None else [number, 1]
+
+def merge_state(function, state, other):
+    """Combines two partial aggregates of the same group."""
+    if state is None:
+        return other
+    if other is None:
+        return state
+    if function == "count":
+        return state + other
+    if function in ("min", "max"):
+        pick = min if function == "min" else max
+        return pick(state, other, key=value_order_key)
+    return [state[0] + other[0], state[1] + other[1]]
+
+def finish_state(function, state):
+    """Turns a partial aggregate into the final value."""
+    if function == "count":
+        return state or 0
+    if function in ("min", "max") or state is None:
+        return state
+    total, count = state
+    return total if function == "sum" else total / count
+
+def finish_states(functions, states):
+    return [finish_state(function, state) for (function, _), state in zip(functions, states)]
+
+def group_order_key(key):
+    """Orders groups by their values like sorted indexes do, with the raw text breaking ties."""
+    return tuple((value_order_key(value), value) for value in key)
+
+def spill_groups(groups, directory, run_number):
+    """Writes the groups to a run file, sorted by key, and returns its path."""
+    path = os.path.join(directory, f"run{run_number}.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        for key in sorted(groups, key=group_order_key):
+            f.write(json.dumps([key, groups[key]]) + "\n")
+    return path
+
+def read_run(path):
+    """Yields (key, partial aggregates) from a run file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            key, states = json.loads(line)
+            yield tuple(key), states
+
+def group_by(db_name, group_fields, functions, conditions=(), memory_limit=GROUP_MEMORY_LIMIT):
+    """
+    Groups the records matching `conditions` by the values of `group_fields` and computes the
+    `functions` ((function, field) pairs, see parse_group_function) for each group.
+    With no group fields every matching record falls into one group.
+    Yields (group key tuple, [aggregate values]) in group order. At most `memory_limit` groups are
+    kept in memory; beyond that partial aggregates are spilled to temporary files and merged.
+    Raises ValueError if the database or a field does not exist.
+    """
+    fields = fm.open_database(db_name).fields
+    if fields is None:
+        raise ValueError(f"Database '{db_name}' does not exist.")
+    group_fields = list(group_fields)
+    functions = list(functions)
+    for field in group_fields + [field for _, field in functions if field is not None]:
+        if field not in fields:
+            raise ValueError(f"Field '{field}' does not exist.")
+
+    def text(record, field):
+        value = record.get(field)
+        return "" if value is None else str(value)
+
+    with tempfile.TemporaryDirectory(prefix="dbms_group_") as directory:
+        groups = {}
+        runs = []
+        for _, record in query.select(db_name, conditions):
+            key = tuple(text(record, field) for field in group_fields)
+            states = groups.get(key)
+            if states is None:
+                if len(groups) >= memory_limit:
+                    runs.append(spill_groups(groups, directory, len(runs)))
+                    groups = {}
+                states = groups[key] = [None] * len(functions)
+            for i, (function, field) in enumerate(functions):
+                value = None if field is None else text(record, field)
+                states[i] = merge_state(function, states[i], value_state(function, value))
+
+        if not runs:
+            # Everything fit in memory
+            if not groups and not group_fields:
+                groups[()] = [None] * len(functions)  # An empty table still has one overall row
+            for key in sorted(groups, key=group_order_key):
+                yield key, finish_states(functions, groups[key])
+            return
+
+        runs.append(spill_groups(groups, directory, len(runs)))
+        groups = None
+        merged = heapq.merge(*[read_run(path) for path in runs], key=lambda row: group_order_key(row[0]))
+        current_key, current = None, None
+        for key, states in merged:
+            if current is not None and key == current_key:
+                current = [merge_state(function, a, b) for (function, _), a, b in zip(functions, current, states)]
+                continue
+            if current is not None:
+                yield current_key, finish_states(functions, current)
+            current_key, current = key, states
+        if current is not None:
+            yield current_key, finish_states(functions, current)
@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import file_manager as fm
+import query
+
+# asyncio front end for the storage layer.
+# Every call runs the blocking file work of file_manager in an executor thread, so the event
+# loop keeps running while the disk is busy. Nothing here prompts or prints; errors are raised.
+#
+#   db = await async_api.open_database("students")
+#   record = await db.get(3)
+#   await db.insert({"fname": "Ali", "roll": "7"})
+#   async for index, record in db.scan([("roll", ">=", "5")]):
+#       ...
+#
+# Point reads are coalesced: every get() and get_by_id() made while the loop is busy with the
+# current step is collected and served by one get_many() call in a single executor job, and
+# callers asking for the same record share one read. open_database() hands every caller on the
+# same event loop the same AsyncDatabase, so reads made through different opens coalesce too.
+
+SCAN_CHUNK_SIZE = 500  # Records fetched per executor job while scanning
+
+class AsyncDatabase:
+    """Async handle on one database. Create it with open_database()."""
+
+    def __init__(self, db, executor=None):
+        self.db = db
+        self.name = db.name
+        self.executor = executor
+        self.pending = {}      # ("index", record index) or ("id", record ID) -> future of a read waiting for the next batch
+        self.batch_scheduled = False
+        self.read_batches = 0  # executor jobs used for point reads, to see how well they coalesce
+
+    async def run(self, function, *args):
+        """Runs a blocking function in the executor and waits for its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def get(self, index):
+        """Returns the record at `index`, or None if there is no such record."""
+        return await self.read(("index", index))
+
+    async def get_by_id(self, record_id):
+        """Returns the record with the given ID, or None if there is no such record."""
+        return await self.read(("id", record_id))
+
+    async def read(self, key):
+        """Waits for the next read batch to fetch the record under `key` (see `pending`)."""
+        future = self.pending.get(key)
+        if future is None:
+            future = self.pending[key] = asyncio.get_running_loop().create_future()
+            if not self.batch_scheduled:
+                self.batch_scheduled = True
+                asyncio.get_running_loop().call_soon(self.start_read_batch)
+        record = await asyncio.shield(future)
+        return None if record is None else dict(record)  # Callers sharing a read get their own copy
+
+    def start_read_batch(self):
+        self.batch_scheduled = False
+        pending, self.pending = self.pending, {}
+        asyncio.ensure_future(self.read_batch(pending))
+
+    async def read_batch(self, pending):
+        """Serves every collected read with one get_many() call."""
+        self.read_batches += 1
+        try:
+            found = await self.run(self.read_records, list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+    def read_records(self, keys):
+        """Returns {key: record} for the keys of a read batch, looking IDs up in the record ID map first."""
+        with self.db.lock:
+            id_map = self.db.record_ids()
+            positions = {key: key[1] if key[0] == "index" else id_map.location(key[1]) for key in keys}
+            found = dict(self.db.get_many(sorted({position for position in positions.values() if position is not None})))
+        return {key: found.get(position) for key, position in positions.items()}
+
+    async def get_many(self, positions):
+        """Returns the records at the given indexes as a list, None where there is no record."""
+        return await asyncio.gather(*(self.get(position) for position in positions))
+
+    def check_record(self, record):
+        """
+        Returns a copy of `record` checked against the schema, as the interactive prompts check
+        what they read. Raises ValueError if it is not a dict of the schema's fields, or a
+        value is too long.
+        """
+        if not isinstance(record, dict):
+            raise ValueError("A record must be an object of field values.")
+        return fm.validate_record(record, self.db.fields)
+
+    async def insert(self, record):
+        """
+        Adds a record and returns its ID. Raises ValueError if it does not fit the schema
+        or its primary key is missing or already taken.
+        """
+        record = self.check_record(record)
+        return await self.run(self.db.add, record)
+
+    async def insert_many(self, records):
+        """
+        Adds several records with one write and returns their IDs.
+        Nothing is stored if any of them is rejected.
+        """
+        records = [self.check_record(record) for record in records]
+        return await self.run(self.db.add_many, records)
+
+    async def update(self, index, record):
+        """
+        Replaces the record at `index`. Raises IndexError if there is none, and ValueError if
+        the record does not fit the schema or clashes with another key.
+        """
+        record = self.check_record(record)
+        await self.run(self.db.update, index, record)
+
+    async def delete(self, index):
+        """Deletes the record at `index`. Raises IndexError if there is none."""
+        await self.run(self.db.remove, index)
+
+    async def update_by_id(self, record_id, record):
+        """Replaces the record with the given ID. Raises IndexError if there is none, ValueError as update() does."""
+        record = self.check_record(record)
+        await self.run(self.db.update_by_id, record_id, record)
+
+    async def delete_by_id(self, record_id):
+        """Deletes the record with the given ID. Raises IndexError if there is none."""
+        await self.run(self.db.remove_by_id, record_id)
+
+    async def count(self):
+        """Returns the number of live records."""
+        def count_records():
+            with self.db.lock:
+                return self.db.slot_count() - self.db.dead_count()
+        return await self.run(count_records)
+
+    async def scan(self, conditions=(), fields=None, order_by=None, descending=False, limit=None,
+                   chunk_size=SCAN_CHUNK_SIZE):
+        """
+        Async iterator over (index, record) pairs of a query; the arguments are those of
+        query.select(). Records are fetched `chunk_size` at a time in the executor, so a scan of
+        a large table neither blocks the loop nor loads the table into memory.
+        """
+        rows = await self.run(query.select, self.name, list(conditions), fields, order_by, descending, limit)
+        try:
+            while True:
+                chunk = await self.run(lambda: list(itertools.islice(rows, chunk_size)))
+                if not chunk:
+                    return
+                for row in chunk:
+                    yield row
+        finally:
+            close = getattr(rows, "close", None)
+            if close is not None:
+                await self.run(close)  # Let a generator clean up its files and temporary runs
+
+_open_databases = {}  # (database name, event loop) -> task opening its shared AsyncDatabase
+
+async def open_database(db_name, executor=None):
+    """
+    Opens the specified database without blocking the event loop and returns an AsyncDatabase.
+    Every call for the same database on the same event loop returns the same handle, so their
+    point reads are batched together; the handle keeps the executor of the call that opened it.
+    `executor` is the concurrent.futures executor to run disk work in (the loop's default if None).
+    Raises ValueError if the database does not exist.
+    """
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _open_databases if key[1].is_closed()]:
+        del _open_databases[key]
+    key = (db_name, loop)
+    # The task is cached before it is awaited, so callers racing to open the database share it
+    opening = _open_databases.get(key)
+    if opening is None:
+        opening = _open_databases[key] = asyncio.ensure_future(open_handle(db_name, executor))
+    try:
+        return await asyncio.shield(opening)
+    except Exception:
+        if _open_databases.get(key) is opening:
+            del _open_databases[key]  # Let a later call try again
+        raise
+
+async def open_handle(db_name, executor):
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(executor, fm.database_exists, db_name):
+        raise ValueError(f"Database '{db_name}' does not exist.")
+    db = await loop.run_in_executor(executor, fm.open_database, db_name)
+    return AsyncDatabase(db, executor)
@@ -0,0 +1,205 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import file_manager as fm
+import query
+
+# Bulk import and export of records as CSV or JSON Lines files.
+# Imports stream the input and check it in batches; every row that passes is then stored with
+# a single append to the database, so loading N rows costs one write instead of N rewrites.
+# Exports stream records out of storage and write them in fixed-size chunks, so memory use
+# does not grow with the size of the table.
+
+FILE_FORMATS = ("csv", "jsonl")
+IMPORT_BATCH_SIZE = 1000  # Rows read and validated together
+EXPORT_CHUNK_SIZE = 1000  # Records formatted and written together
+
+def guess_format(path):
+    """Returns the file format implied by the file extension, or None if it is not recognised."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    return None
+
+def read_csv_rows(f):
+    """
+    Yields (line number, row dict or None, error) for each data row of a CSV file.
+    The first line must be a header naming the fields.
+    """
+    reader = csv.DictReader(f)
+    for row in reader:
+        if None in row:
+            yield reader.line_num, None, "more values than header columns"
+            continue
+        yield reader.line_num, row, None
+
+def read_jsonl_rows(f):
+    """Yields (line number, row dict or None, error) for each non-blank line of a JSON Lines file."""
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"invalid JSON ({e.msg})"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "not a JSON object"
+            continue
+        yield line_number, row, None
+
+def validate_row(row, fields):
+    """
+    Turns an input row into a record that fits the schema.
+    Returns (record, None), or (None, reason) if the row has to be rejected.
+    """
+    try:
+        return fm.validate_record(row, fields), None
+    except ValueError as e:
+        return None, str(e)
+
+def import_file(db_name, path, file_format=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Imports every valid row of a CSV or JSON Lines file into the specified database.
+    Rows are validated against the field lengths (and the primary key, if any) one batch at a
+    time; the accepted rows are then stored with a single write.
+    Returns (number of rows imported, list of (line number, reason) for the rejected rows).
+    Raises ValueError if the format is unknown or the database does not exist.
+    """
+    file_format = file_format or guess_format(path)
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"Unknown import format for '{path}'. Use one of: {', '.join(FILE_FORMATS)}")
+    db = fm.open_database(db_name)
+    fields = db.fields
+    if fields is None:
+        raise ValueError(f"Database '{db_name}' does not exist.")
+
+    key_index = db.key_index()
+    seen_keys = set()
+    accepted = []
+    rejected = []
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        rows = read_csv_rows(f) if file_format == "csv" else read_jsonl_rows(f)
+        for batch in query.iter_chunks(rows, batch_size):
+            for line_number, row, error in batch:
+                record = None
+                if error is None:
+                    record, error = validate_row(row, fields)
+                if error is None and key_index is not None:
+                    key = record[key_index.field]
+                    if key == "":
+                        error = f"primary key '{key_index.field}' is empty"
+                    elif key in seen_keys or key_index.lookup(key) is not None:
+                        error = f"duplicate {key_index.field} '{key}'"
+                    else:
+                        seen_keys.add(key)
+                if error is None:
+                    accepted.append(record)
+                else:
+                    rejected.append((line_number, error))
+
+    db.add_many(accepted)
+    return len(accepted), rejected
+
+def export_records(db_name, out, file_format="csv", fields=None, conditions=(), order_by=None, descending=False,
+                   chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Writes the records of the specified database to the open text file `out` as CSV or JSON Lines.
+    `fields` limits the output to some fields and `conditions` are query conditions that every
+    exported record must meet. Records are read lazily and written `chunk_size` at a time.
+    `order_by` sorts the output on one field; without an index on it the records are sorted with
+    an external merge sort, so the export still fits in memory.
+    Returns the number of records written. Raises ValueError for an unknown format or field.
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"Unknown export format '{file_format}'. Use one of: {', '.join(FILE_FORMATS)}")
+    schema = fm.open_database(db_name).fields
+    if schema is None:
+        raise ValueError(f"Database '{db_name}' does not exist.")
+    fields = list(fields or schema)
+    for field in fields + [condition[0] for condition in conditions] + ([order_by] if order_by else []):
+        if field not in schema:
+            raise ValueError(f"Field '{field}' does not exist.")
+
+    records = (record for _, record in query.select(db_name, conditions, fields, order_by, descending))
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore', lineterminator='\n')
+    if file_format == "csv":
+        writer.writeheader()
+
+    count = 0
+    for chunk in query.iter_chunks(records, chunk_size):
+        if file_format == "csv":
+            writer.writerows(chunk)
+        else:
+            for record in chunk:
+                buffer.write(json.dumps(record) + "\n")
+        # Hand the finished chunk to the output and start the next one empty
+        out.write(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+        count += len(chunk)
+    out.write(buffer.getvalue())  # The CSV header, if nothing else was written
+    out.flush()
+    return count
+
+def export_file(db_name, path, file_format=None, fields=None, conditions=(), order_by=None, descending=False):
+    """
+    Exports records to the file at `path`, or to standard output if `path` is None or "-".
+    Returns the number of records written.
+    """
+    if path in (None, "-"):
+        return export_records(db_name, sys.stdout, file_format or "csv", fields, conditions, order_by, descending)
+    file_format = file_format or guess_format(path) or "csv"
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        return export_records(db_name, f, file_format, fields, conditions, order_by, descending)
+
+def main(argv=None):
+    """Command-line entry point, so imports and exports can be scripted and piped."""
+    parser = argparse.ArgumentParser(description="Import or export database records as CSV or JSON Lines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="load records from a file")
+    importer.add_argument("db_name")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=FILE_FORMATS)
+
+    exporter = commands.add_parser("export", help="write records to a file or standard output")
+    exporter.add_argument("db_name")
+    exporter.add_argument("-o", "--output", default="-", help="output file (default: standard output)")
+    exporter.add_argument("--format", choices=FILE_FORMATS)
+    exporter.add_argument("--fields", help="comma-separated fields to include")
+    exporter.add_argument("--where", action="append", default=[],
+                          help="condition such as 'roll >= 5' (may be repeated)")
+    exporter.add_argument("--order-by", help="field to sort on; prefix with '-' for descending, e.g. --order-by=-roll")
+
+    args = parser.parse_args(argv)
+    if not fm.database_exists(args.db_name):
+        print(f"Database '{args.db_name}' does not exist.", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "import":
+            imported, rejected = import_file(args.db_name, args.path, args.format)
+            for line_number, reason in rejected:
+                print(f"Line {line_number}: {reason}", file=sys.stderr)
+            print(f"Imported {imported} records, rejected {len(rejected)}.", file=sys.stderr)
+        else:
+            fields = [field.strip() for field in args.fields.split(",")] if args.fields else None
+            conditions = [query.parse_condition(text) for text in args.where]
+            order_by = args.order_by.lstrip("-") if args.order_by else None
+            descending = bool(args.order_by) and args.order_by.startswith("-")
+            count = export_file(args.db_name, args.output, args.format, fields, conditions, order_by, descending)
+            print(f"Exported {count} records.", file=sys.stderr)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import json
+import os
+import time
+
+# Catalog of the databases in the working directory.
+# One small JSON file maps each database name to its schema, storage format, file paths,
+# record count, size on disk and the time the entry was last refreshed, so listing databases
+# is a single read instead of a scan of the whole directory. file_manager keeps it up to date
+# when databases are created, deleted, converted or compacted; if it goes missing or drifts
+# from the files on disk it can be rebuilt with file_manager.rebuild_catalog().
+
+CATALOG_FILE = "dbms_catalog.json"
+
+def load_catalog():
+    """Returns the catalog as {name: entry}, or None if there is no readable catalog file."""
+    try:
+        with open(CATALOG_FILE, 'r') as f:
+            catalog = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return catalog if isinstance(catalog, dict) else None
+
+def save_catalog(catalog):
+    """Writes the catalog atomically, so readers never see half of it."""
+    temp_file = f"{CATALOG_FILE}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(catalog, f, indent=4, sort_keys=True)
+    os.replace(temp_file, CATALOG_FILE)
+
+def make_entry(fields, storage, paths, record_count, size):
+    """Builds the catalog entry of one database."""
+    return {
+        "fields": fields,
+        "storage": storage,
+        "paths": paths,
+        "records": record_count,
+        "size": size,
+        "modified": time.time(),
+    }
+
+def update_entry(name, entry):
+    """Adds or replaces the entry of one database."""
+    catalog = load_catalog() or {}
+    catalog[name] = entry
+    save_catalog(catalog)
+
+def remove_entry(name):
+    """Drops one database from the catalog, if it is listed."""
+    catalog = load_catalog()
+    if catalog is not None and name in catalog:
+        del catalog[name]
+        save_catalog(catalog)
@@ -1,21 +1,35 @@
+import argparse
+import csv
+import json
+import sys
+import aggregates
+import compressed_storage
 import file_manager as fm
 import database_operations as db_ops
-import os
+import query
 
 def main_menu():
     print("\nSimple DBMS Main Menu")
     print("1. Create a new database")
     print("2. Open an existing database")
     print("3. Delete a database")
-    print("4. Exit")
+    print("4. Rebuild the database catalog")
+    print("5. Exit")
 
 def database_menu(db_name):
     print(f"\nDatabase Menu - {db_name}")
     print("1. Add a record")
     print("2. Edit a record")
     print("3. Delete a record")
-    print("4. Display all records")
-    print("5. Back to Main Menu")
+    print("4. Browse records, a page at a time")
+    print("5. Open a record by key")
+    print("6. Query records")
+    print("7. Create an index")
+    print("8. Import records from a CSV/JSONL file")
+    print("9. Export records to a CSV/JSONL file")
+    print("10. Compact the database (drop deleted records)")
+    print("11. Group and aggregate records")
+    print("12. Back to Main Menu")
 
 
 
@@ -55,8 +69,18 @@ def create_database():
             print("Please enter a valid integer for field length.")
 
     if fields:
+        storage = input("Storage format - json, fixed (fixed-width binary), columnar (one file per field) or compressed [json]: ").strip().lower() or "json"
+        if storage not in fm.STORAGE_FORMATS:
+            print(f"Unknown storage format '{storage}'. Using json.")
+            storage = "json"
+
+        primary_key = input("Primary key field (leave blank for none): ").strip() or None
+        if primary_key is not None and primary_key not in fields:
+            print(f"Field '{primary_key}' does not exist. Creating the database without a primary key.")
+            primary_key = None
+
         # Ensure the message is printed only after the database is created successfully
-        success = fm.create_database_files(db_name, fields)
+        success = fm.create_database_files(db_name, fields, storage, primary_key)
         if success:
             print(f"Database '{db_name}' created successfully with fields: {fields}")
         else:
@@ -67,15 +91,16 @@ def create_database():
 
 def display_databases():
     """
-    Lists all available databases in the current directory by filtering for system files.
+    Lists all available databases from the catalog, with their storage format and size.
     """
-    databases = [file.replace('_system.json', '') for file in os.listdir() if file.endswith('_system.json')]
+    databases = fm.list_databases()
     if not databases:
         print("No databases found.")
     else:
         print("Available Databases:")
-        for i, db in enumerate(databases, start=1):
-            print(f"{i}. {db}")
+        for i, name in enumerate(sorted(databases), start=1):
+            entry = databases[name]
+            print(f"{i}. {name} ({entry['records']} records, {entry['storage']}, {entry['size']} bytes)")
 
 
 
@@ -87,8 +112,8 @@ def open_database():
     Opens an existing database by allowing the user to select from available databases.
     If no databases exist, the function informs the user and returns to the main menu.
     """
-    # Retrieve a list of available databases by identifying files ending with '_system.json'.
-    databases = [file.replace('_system.json', '') for file in os.listdir() if file.endswith('_system.json')]
+    # Retrieve the list of available databases from the catalog.
+    databases = fm.list_databases()
     
     # Check if there are any databases available.
     if not databases:
@@ -106,8 +131,8 @@ def open_database():
         print(f"Database '{db_name}' does not exist.")
         return
 
-    # Load the database records only, as fields are not used.
-    records = fm.load_data_file(db_name)
+    # Open the shared handle once; every operation below reuses its cached schema and records.
+    db = fm.open_database(db_name)
 
     # Enter the database menu for further operations.
     while True:
@@ -120,29 +145,53 @@ def open_database():
             db_ops.add_record(db_name)
         elif choice == "2":
             # Edit an existing record.
-            if not records:
+            if next(db.iter_records(), None) is None:
                 print("No records found. Please add a record first.")
                 continue
             try:
-                record_index = int(input("Enter the index of the record to edit: ")) - 1
-                db_ops.edit_record(db_name, record_index)
+                record_id = int(input("Enter the ID of the record to edit: "))
+                db_ops.edit_record(db_name, record_id)
             except ValueError:
-                print("Invalid input. Please enter a valid record index.")
+                print("Invalid input. Please enter a valid record ID.")
         elif choice == "3":
             # Delete an existing record.
-            if not records:
+            if next(db.iter_records(), None) is None:
                 print("No records found. Please add a record first.")
                 continue
             try:
-                record_index = int(input("Enter the index of the record to delete: ")) - 1
-                db_ops.delete_record(db_name, record_index)
+                record_id = int(input("Enter the ID of the record to delete: "))
+                db_ops.delete_record(db_name, record_id)
             except ValueError:
-                print("Invalid input. Please enter a valid record index.")
+                print("Invalid input. Please enter a valid record ID.")
         elif choice == "4":
-            # Display all records in the database.
-            db_ops.view_records(db_name)
+            # Browse the records a page at a time, optionally sorted on one field.
+            order_by = input("Order by field (prefix with '-' for descending, blank for record order): ").strip() or None
+            descending = order_by is not None and order_by.startswith("-")
+            db_ops.view_records(db_name, order_by and order_by.lstrip("-"), descending)
         elif choice == "5":
+            # Look up a record through the primary-key index.
+            db_ops.open_record_by_key(db_name)
+        elif choice == "6":
+            # Select records by condition, with optional fields, ordering and limit.
+            db_ops.query_records(db_name)
+        elif choice == "7":
+            # Build a sorted index that queries can use instead of a full scan.
+            db_ops.create_index(db_name)
+        elif choice == "8":
+            # Load many records at once from a file.
+            db_ops.import_records(db_name)
+        elif choice == "9":
+            # Write records out for use in other tools.
+            db_ops.export_records(db_name)
+        elif choice == "10":
+            # Reclaim the space left by deleted records.
+            db_ops.vacuum_database(db_name)
+        elif choice == "11":
+            # Count, sum or average records per group of field values.
+            db_ops.group_records(db_name)
+        elif choice == "12":
             # Exit the database menu and return to the main menu.
+            fm.refresh_catalog_entry(db_name)  # Record the new record count and size
             break
         else:
             # Handle invalid menu options.
@@ -155,7 +204,7 @@ def delete_database():
     Allows the user to delete an existing database.
     If no databases exist, informs the user and returns to the main menu.
     """
-    databases = [file.replace('_system.json', '') for file in os.listdir() if file.endswith('_system.json')]
+    databases = fm.list_databases()
     if not databases:
         print("No databases found. Returning to the main menu.")
         return
@@ -179,6 +228,136 @@ def delete_database():
 
 
 
+def apply_changes(db_name, path):
+    """
+    Applies a file of changes to a database in one batch, without prompting.
+    The file holds one JSON object per line:
+        {"op": "add", "record": {...}}
+        {"op": "update", "id": 3, "record": {...}}
+        {"op": "delete", "id": 3}
+    IDs are the record IDs shown in the record tables; records added by earlier lines have
+    IDs too. Either every change is stored or, if any line is invalid, none is.
+    Returns True on success.
+    """
+    if not fm.database_exists(db_name):
+        print(f"Database '{db_name}' does not exist.")
+        return False
+    db = fm.open_database(db_name)
+    line_number = 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f, db.batch() as batch:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                change = json.loads(line)
+                op = change.get("op")
+                if op == "add":
+                    batch.add(change["record"])
+                elif op in ("update", "delete"):
+                    index = batch.locate(int(change["id"]))
+                    if op == "update":
+                        batch.update(index, change["record"])
+                    else:
+                        batch.remove(index)
+                else:
+                    raise ValueError(f"Unknown operation '{op}'.")
+            count = len(batch.entries)
+            line_number = 0  # Errors from here on come from storing the batch
+    except OSError as e:
+        print(f"Error: {e}")
+        return False
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+        where = f"Line {line_number}: " if line_number else ""
+        print(f"{where}Error: {e!s} - no changes were stored.")
+        return False
+    fm.refresh_catalog_entry(db_name)
+    print(f"Applied {count} changes to '{db_name}'.")
+    return True
+
+def print_groups(db_name, group_fields, functions, conditions):
+    """Prints the result of a GROUP BY as CSV. Returns True on success."""
+    if not fm.database_exists(db_name):
+        print(f"Database '{db_name}' does not exist.", file=sys.stderr)
+        return False
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(group_fields + [aggregates.group_function_label(function, field) for function, field in functions])
+    try:
+        for key, values in aggregates.group_by(db_name, group_fields, functions, conditions):
+            writer.writerow(list(key) + values)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return False
+    return True
+
+def convert_storage(db_name, storage, codec=None):
+    """
+    Rewrites a database in another storage format and reports the size before and after,
+    plus the compression ratio for compressed storage. Returns True on success.
+    """
+    if not fm.database_exists(db_name):
+        print(f"Database '{db_name}' does not exist.")
+        return False
+    db = fm.open_database(db_name)
+    bytes_before = db.storage_size()
+    old_storage = db.storage
+    if not fm.convert_database(db_name, storage, codec):
+        return False
+    bytes_after = db.storage_size()
+    print(f"Converted '{db_name}' from {old_storage} to {storage} storage: {bytes_before} -> {bytes_after} bytes.")
+    if storage == "compressed":
+        raw, compressed = compressed_storage.compression_ratio(db_name, db.fields)
+        codec = compressed_storage.current_codec(db_name)
+        ratio = raw / compressed if compressed else 1.0
+        print(f"{codec} compressed {raw} bytes of records to {compressed} bytes (ratio {ratio:.1f}:1).")
+    return True
+
+def run_command(argv):
+    """
+    Entry point for scripted use, e.g. `python cli.py apply students changes.jsonl` or
+    `python cli.py group students --by lname --agg count --agg avg:roll` or
+    `python cli.py convert students compressed --codec lzma`.
+    """
+    parser = argparse.ArgumentParser(description="Simple DBMS. Run without arguments for the interactive menu.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    apply_parser = commands.add_parser("apply", help="apply a JSON Lines file of changes as one batch")
+    apply_parser.add_argument("db_name")
+    apply_parser.add_argument("path")
+    group_parser = commands.add_parser("group", help="count, sum or average records per group, as CSV")
+    group_parser.add_argument("db_name")
+    group_parser.add_argument("--by", action="append", default=[], help="field to group by (may be repeated)")
+    group_parser.add_argument("--agg", action="append", default=[],
+                              help="aggregate such as 'count' or 'avg:roll' (may be repeated, default: count)")
+    group_parser.add_argument("--where", action="append", default=[],
+                              help="condition such as 'roll >= 5' (may be repeated)")
+    convert_parser = commands.add_parser("convert", help="rewrite a database in another storage format")
+    convert_parser.add_argument("db_name")
+    convert_parser.add_argument("storage", choices=fm.STORAGE_FORMATS)
+    convert_parser.add_argument("--codec", choices=list(compressed_storage.CODECS),
+                                help="compression for compressed storage (default: zlib)")
+    catalog_parser = commands.add_parser("catalog", help="list the databases in the catalog")
+    catalog_parser.add_argument("--rebuild", action="store_true",
+                                help="rebuild the catalog from the files first")
+    args = parser.parse_args(argv)
+    if args.command == "catalog":
+        databases = fm.rebuild_catalog() if args.rebuild else fm.list_databases()
+        for name in sorted(databases):
+            entry = databases[name]
+            print(f"{name}\t{entry['storage']}\t{entry['records']} records\t{entry['size']} bytes")
+        return 0
+    if args.command == "apply":
+        return 0 if apply_changes(args.db_name, args.path) else 1
+    if args.command == "group":
+        try:
+            functions = [aggregates.parse_group_function(text) for text in args.agg or ["count"]]
+            conditions = [query.parse_condition(text) for text in args.where]
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0 if print_groups(args.db_name, args.by, functions, conditions) else 1
+    if args.command == "convert":
+        return 0 if convert_storage(args.db_name, args.storage, args.codec) else 1
+    return 1
+
 def run_cli():
     while True:
         main_menu()
@@ -191,10 +370,15 @@ def run_cli():
         elif option == '3':
             delete_database()
         elif option == '4':
+            databases = fm.rebuild_catalog()
+            print(f"Catalog rebuilt: {len(databases)} databases found.")
+        elif option == '5':
             print("Exiting the program.")
             break
         else:
             print("Invalid option, please try again.")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_command(sys.argv[1:]))
     run_cli()
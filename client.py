@@ -0,0 +1,178 @@
+import contextlib
+import itertools
+import queue
+import socket
+import threading
+import protocol
+from protocol import DEFAULT_HOST, DEFAULT_PORT
+
+# Client for server.py.
+# A Client keeps a pool of open connections that threads borrow one request (or one pipeline)
+# at a time, so connecting is paid once per connection rather than once per call:
+#
+#   client = Client()
+#   client.add("students", {"fname": "Ali", "roll": "7"})
+#   record = client.get("students", 3)
+#   rows = client.query("students", ["roll >= 5"], order_by="roll", limit=10)
+#
+# pipeline() sends a list of requests in one write and then reads all the responses, so a
+# batch of calls costs one round trip instead of one each:
+#
+#   records = client.pipeline([("get", "students", {"index": i}) for i in range(100)])
+
+POOL_SIZE = 4  # Connections kept open per client
+CONNECT_TIMEOUT = 5.0  # Seconds
+
+class Connection:
+    """One blocking connection to the server. Not shared between threads at the same time."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.ids = itertools.count(1)
+
+    def send_all(self, requests):
+        """Sends the requests in one write and returns their ids, in order."""
+        ids = []
+        frames = []
+        for request in requests:
+            request = dict(request, id=next(self.ids))
+            ids.append(request["id"])
+            frames.append(protocol.encode_frame(request))
+        self.sock.sendall(b"".join(frames))
+        return ids
+
+    def receive_all(self, ids):
+        """Reads the responses to the given request ids and returns them in the same order."""
+        responses = {}
+        while len(responses) < len(ids):
+            response = protocol.read_frame(self.sock)
+            responses[response.get("id")] = response
+        return [responses[request_id] for request_id in ids]
+
+    def pipeline(self, requests):
+        """Sends every request before reading any response. Returns the responses in request order."""
+        return self.receive_all(self.send_all(requests))
+
+    def close(self):
+        self.sock.close()
+
+class ConnectionPool:
+    """Hands out up to `size` connections to threads, opening them as they are first needed."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, size=POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.closed = False
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrows a connection; it goes back to the pool unless the request on it failed."""
+        self.slots.acquire()
+        try:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                connection = Connection(self.host, self.port)
+            try:
+                yield connection
+            except BaseException:
+                # The connection may hold half a frame; drop it instead of reusing it
+                connection.close()
+                raise
+            if self.closed:
+                connection.close()
+            else:
+                self.idle.put(connection)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        """Closes the idle connections; borrowed ones are closed as they come back."""
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+class Client:
+    """Calls the server's operations; see server.py for what each one returns."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, pool_size=POOL_SIZE):
+        self.pool = ConnectionPool(host, port, pool_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    def request(self, op, db_name=None, **arguments):
+        """Sends one request and returns its result. Raises the error the server reported."""
+        return self.pipeline([(op, db_name, arguments)])[0]
+
+    def pipeline(self, calls):
+        """
+        Sends several (op, db_name, arguments) calls on one connection without waiting for each
+        answer, then returns their results in order. Raises the first error the server reported.
+        """
+        requests = [dict(arguments, op=op, db=db_name) for op, db_name, arguments in calls]
+        if not requests:
+            return []
+        with self.pool.connection() as connection:
+            responses = connection.pipeline(requests)
+        for response in responses:
+            if not response.get("ok"):
+                protocol.raise_error(response)
+        return [response.get("result") for response in responses]
+
+    def ping(self):
+        return self.request("ping")
+
+    def add(self, db_name, record):
+        """Adds a record and returns its ID."""
+        return self.request("add", db_name, record=record)
+
+    def add_many(self, db_name, records):
+        """Adds several records and returns their IDs."""
+        return self.request("add_many", db_name, records=list(records))
+
+    def get(self, db_name, index):
+        return self.request("get", db_name, index=index)
+
+    def get_many(self, db_name, indexes):
+        return self.request("get_many", db_name, indexes=list(indexes))
+
+    def edit(self, db_name, index, record):
+        self.request("edit", db_name, index=index, record=record)
+
+    def delete(self, db_name, index):
+        self.request("delete", db_name, index=index)
+
+    def get_by_id(self, db_name, record_id):
+        return self.request("get", db_name, record_id=record_id)
+
+    def edit_by_id(self, db_name, record_id, record):
+        self.request("edit", db_name, record_id=record_id, record=record)
+
+    def delete_by_id(self, db_name, record_id):
+        self.request("delete", db_name, record_id=record_id)
+
+    def count(self, db_name):
+        return self.request("count", db_name)
+
+    def query(self, db_name, conditions=(), fields=None, order_by=None, descending=False, limit=None):
+        """
+        Returns (index, record) pairs of a query. Conditions are (field, operator, value) tuples or
+        strings such as "roll >= 5".
+        """
+        rows = self.request("query", db_name, conditions=list(conditions), fields=fields,
+                            order_by=order_by, descending=descending, limit=limit)
+        return [(index, record) for index, record in rows]
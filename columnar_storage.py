@@ -0,0 +1,323 @@
+import mmap
+import os
+import shutil
+from collections import Counter
+from fixed_storage import BYTES_PER_CHAR, SLOT_LIVE, SLOT_DELETED
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the aggregates fall back to plain Python
+    np = None
+
+# Columnar storage.
+# Each field is kept in its own file of fixed-width, null-padded UTF-8 values, one per record
+# slot, next to a status file holding one live/deleted byte per slot:
+#
+#   <db>_columns/_status.bin     one byte per slot
+#   <db>_columns/col_<n>.bin     max_length * BYTES_PER_CHAR bytes per slot, for field number n
+#
+# Column files are named by the field's position in the schema, not its name, so a field
+# called "status" or one with a "/" in it cannot clash with another file or leave the directory.
+#
+# Value N of every file belongs to record N, so a whole record can still be read or patched in
+# place, while an aggregate over one field only reads that field's file. With NumPy installed
+# a column is memory-mapped as an array of fixed-width byte strings and aggregated vectorized.
+
+def data_file_path(db_name):
+    """Returns the path of the directory holding the column files of the specified database."""
+    return f"{db_name}_columns"
+
+def status_file_path(directory):
+    return os.path.join(directory, "_status.bin")
+
+def column_file_path(directory, fields, field):
+    return os.path.join(directory, f"col_{list(fields).index(field)}.bin")
+
+def column_width(max_length):
+    return max_length * BYTES_PER_CHAR
+
+def encode_value(field, max_length, value):
+    """Encodes a value as a null-padded column cell, raising ValueError if it is too long."""
+    encoded = b"" if value is None else str(value).encode("utf-8")
+    width = column_width(max_length)
+    if len(encoded) > width:
+        raise ValueError(f"Value for '{field}' exceeds maximum length of {max_length}.")
+    return encoded.ljust(width, b"\0")
+
+def decode_value(cell):
+    return bytes(cell).rstrip(b"\0").decode("utf-8")
+
+class MappedColumns:
+    """
+    Memory-mapped view over the status file and some or all of the column files.
+    Passing `columns` maps only those fields, which is all an aggregate needs.
+    """
+
+    def __init__(self, db_name, fields, columns=None, writable=False):
+        self.fields = fields
+        self.columns = list(fields if columns is None else columns)
+        self.directory = data_file_path(db_name)
+        self.access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self.files = []
+        self.status = self.open_map(status_file_path(self.directory), writable)
+        self.slot_count = len(self.status) if self.status is not None else 0
+        self.maps = {field: self.open_map(column_file_path(self.directory, fields, field), writable)
+                     for field in self.columns}
+
+    def open_map(self, path, writable):
+        f = open(path, 'r+b' if writable else 'rb')
+        self.files.append(f)
+        # An empty file cannot be mapped; it simply has no slots
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=self.access)
+
+    def __len__(self):
+        return self.slot_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for column_map in [self.status] + list(self.maps.values()):
+            if column_map is not None:
+                column_map.close()
+        for f in self.files:
+            f.close()
+        self.status = None
+        self.maps = {}
+        self.files = []
+
+    def cell(self, field, index):
+        width = column_width(self.fields[field])
+        return self.maps[field][index * width:(index + 1) * width]
+
+    def read(self, index):
+        """Returns the record in slot `index`, or None if it is out of range or deleted."""
+        if index < 0 or index >= self.slot_count or self.status[index] != SLOT_LIVE:
+            return None
+        return {field: decode_value(self.cell(field, index)) for field in self.columns}
+
+    def check_index(self, index):
+        if index < 0 or index >= self.slot_count:
+            raise IndexError(f"Record index {index} is out of range.")
+
+    def write(self, index, record):
+        """Patches slot `index` in place in every column."""
+        self.check_index(index)
+        cells = {field: encode_value(field, self.fields[field], record.get(field)) for field in self.columns}
+        for field, cell in cells.items():
+            width = column_width(self.fields[field])
+            self.maps[field][index * width:(index + 1) * width] = cell
+        self.status[index] = SLOT_LIVE
+
+    def delete(self, index):
+        """Marks slot `index` as deleted by flipping its status byte."""
+        self.check_index(index)
+        self.status[index] = SLOT_DELETED
+
+    def flush(self):
+        for column_map in [self.status] + list(self.maps.values()):
+            if column_map is not None:
+                column_map.flush()
+
+    def __iter__(self):
+        """Yields (index, record) for every live slot."""
+        for index in range(self.slot_count):
+            record = self.read(index)
+            if record is not None:
+                yield index, record
+
+    def values(self, field):
+        """Yields the value of `field` for every live slot, reading only that column."""
+        width = column_width(self.fields[field])
+        column_map = self.maps[field]
+        for index in range(self.slot_count):
+            if self.status[index] == SLOT_LIVE:
+                yield column_map[index * width:(index + 1) * width].rstrip(b"\0").decode("utf-8")
+
+def write_columns(directory, fields, records):
+    """Writes the given records (None for a deleted slot) as a fresh set of column files."""
+    os.makedirs(directory, exist_ok=True)
+    files = {field: open(column_file_path(directory, fields, field), 'wb') for field in fields}
+    try:
+        with open(status_file_path(directory), 'wb') as status:
+            for record in records:
+                cells = {field: encode_value(field, max_length, None if record is None else record.get(field))
+                         for field, max_length in fields.items()}
+                status.write(bytes([SLOT_DELETED if record is None else SLOT_LIVE]))
+                for field, cell in cells.items():
+                    files[field].write(cell)
+    finally:
+        for f in files.values():
+            f.close()
+
+def recover(db_name, fields):
+    """
+    Finishes or undoes a write_all() that was interrupted between its two renames, and cuts
+    every column file back to the slots in the status file, dropping the cells of an append
+    that crashed before its status bytes were written.
+    """
+    directory = data_file_path(db_name)
+    if not os.path.exists(directory) and os.path.exists(f"{directory}.old"):
+        os.replace(f"{directory}.old", directory)
+    for leftover in (f"{directory}.old", f"{directory}.tmp"):
+        if os.path.exists(leftover):
+            shutil.rmtree(leftover)
+    if not os.path.exists(directory):
+        return
+    slots = record_count(db_name, fields)
+    for field, max_length in fields.items():
+        path = column_file_path(directory, fields, field)
+        if os.path.exists(path) and os.path.getsize(path) > slots * column_width(max_length):
+            os.truncate(path, slots * column_width(max_length))
+
+def record_count(db_name, fields):
+    """Returns the number of slots (live or deleted)."""
+    return os.path.getsize(status_file_path(data_file_path(db_name)))
+
+def read_record(db_name, fields, index):
+    with MappedColumns(db_name, fields) as columns:
+        return columns.read(index)
+
+def read_many(db_name, fields, positions):
+    """Yields (index, record) for each live slot among `positions`, in the order given."""
+    with MappedColumns(db_name, fields) as columns:
+        for position in positions:
+            record = columns.read(position)
+            if record is not None:
+                yield position, record
+
+def read_slots(db_name, fields):
+    """Returns every slot as a list, with None for deleted slots."""
+    with MappedColumns(db_name, fields) as columns:
+        return [columns.read(index) for index in range(len(columns))]
+
+def write_record(db_name, fields, index, record):
+    write_records(db_name, fields, [(index, record)])
+
+def write_records(db_name, fields, records_by_index):
+    """Overwrites several existing slots in place."""
+    with MappedColumns(db_name, fields, writable=True) as columns:
+        for index, record in records_by_index:
+            columns.write(index, record)
+        columns.flush()
+
+def delete_record(db_name, fields, index):
+    with MappedColumns(db_name, fields, columns=[], writable=True) as columns:
+        columns.delete(index)
+        columns.flush()
+
+def append_records(db_name, fields, records):
+    """
+    Appends records in new slots after the last one in the status file and returns the first
+    new index. Each column is written at that slot's offset rather than at the end of its file,
+    so cells left behind by an append that crashed halfway are overwritten, not built upon.
+    """
+    directory = data_file_path(db_name)
+    records = list(records)
+    columns = {field: b"".join(encode_value(field, max_length, record.get(field)) for record in records)
+               for field, max_length in fields.items()}
+    index = record_count(db_name, fields)
+    for field, data in columns.items():
+        with open(column_file_path(directory, fields, field), 'r+b') as f:
+            f.seek(index * column_width(fields[field]))
+            f.write(data)
+    # The status file goes last: until it grows, the new cells do not belong to any slot
+    with open(status_file_path(directory), 'r+b') as f:
+        f.seek(index)
+        f.write(bytes([SLOT_LIVE]) * len(records))
+    return index
+
+def iter_records(db_name, fields):
+    """Yields (index, record) for every live slot."""
+    with MappedColumns(db_name, fields) as columns:
+        yield from columns
+
+def deleted_slots(db_name, fields):
+    """Returns the positions of the deleted slots, reading only the status file."""
+    with open(status_file_path(data_file_path(db_name)), 'rb') as f:
+        status = f.read()
+    return [index for index, value in enumerate(status) if value != SLOT_LIVE]
+
+def write_all(db_name, fields, records):
+    """
+    Rewrites every column file with the given records (None for a deleted slot).
+    The new files are built in a separate directory that then replaces the old one.
+    """
+    directory = data_file_path(db_name)
+    temp_directory = f"{directory}.tmp"
+    if os.path.exists(temp_directory):
+        shutil.rmtree(temp_directory)
+    write_columns(temp_directory, fields, records)
+    if os.path.exists(directory):
+        os.replace(directory, f"{directory}.old")
+    os.replace(temp_directory, directory)
+    shutil.rmtree(f"{directory}.old", ignore_errors=True)
+
+def storage_size(db_name):
+    """Total bytes used by the status file and the column files."""
+    directory = data_file_path(db_name)
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def column_value_counts(db_name, fields, field):
+    """
+    Returns {value: number of live records} for one field, reading only that field's column.
+    With NumPy the column is memory-mapped and counted with np.unique; otherwise it is scanned.
+    """
+    if np is not None:
+        live, values = column_array(db_name, fields, field)
+        if values is None:
+            return {}
+        unique, counts = np.unique(values[live], return_counts=True)
+        return {value.decode("utf-8"): int(count) for value, count in zip(unique.tolist(), counts.tolist())}
+    with MappedColumns(db_name, fields, columns=[field]) as columns:
+        if columns.slot_count == 0:
+            return {}
+        return dict(Counter(columns.values(field)))
+
+def column_array(db_name, fields, field):
+    """
+    Memory-maps one column as a NumPy array of fixed-width byte strings.
+    Returns (mask of live slots, values), or (None, None) if the database has no slots.
+    Requires NumPy.
+    """
+    directory = data_file_path(db_name)
+    slot_count = record_count(db_name, fields)
+    if slot_count == 0:
+        return None, None
+    status = np.memmap(status_file_path(directory), dtype=np.uint8, mode='r', shape=(slot_count,))
+    values = np.memmap(column_file_path(directory, fields, field), dtype=f"S{column_width(fields[field])}",
+                       mode='r', shape=(slot_count,))
+    return status == SLOT_LIVE, values
+
+def column_numbers(db_name, fields, field):
+    """
+    Returns the live values of one field as a NumPy float array if NumPy is available and every
+    value is a finite number, otherwise None. Lets sum/min/max skip Python-level loops.
+    """
+    if np is None:
+        return None
+    live, values = column_array(db_name, fields, field)
+    if values is None:
+        return None
+    try:
+        numbers = values[live].astype(np.float64)
+    except ValueError:
+        return None  # Some value is empty or not a number
+    if not np.isfinite(numbers).all():
+        return None
+    return numbers
+
+def live_value(db_name, fields, field, position):
+    """
+    Returns the stored text of the `position`-th live value of one field, counting from 0 in
+    slot order, e.g. the value at the argmin of column_numbers(). Requires NumPy.
+    """
+    live, values = column_array(db_name, fields, field)
+    if values is None:
+        raise IndexError(f"Live value {position} is out of range.")
+    return decode_value(values[live][position])
@@ -0,0 +1,303 @@
+import json
+import lzma
+import os
+import shutil
+import zlib
+
+# Block-compressed storage.
+# Records are kept in numbered slots like the fixed-width format, but the slots are grouped
+# into blocks of BLOCK_RECORDS and each block is stored as one compressed JSON array of rows
+# (a list of values in schema order, or null for a deleted slot), so field names are not
+# repeated and similar neighbouring records compress well:
+#
+#   <db>_blocks/blocks.bin    compressed blocks, one after another
+#   <db>_blocks/index.json    codec, plus [offset, compressed size, raw size, slots] per block
+#
+# Slot N lives in block N // BLOCK_RECORDS, so reading or editing one record only decompresses
+# that block. A changed block is appended to blocks.bin and the index is then swapped to point
+# at it; the old copy becomes garbage that is dropped once it outweighs the live blocks.
+
+CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+DEFAULT_CODEC = "zlib"
+BLOCK_RECORDS = 256  # Slots per compressed block
+COMPACT_MIN_BYTES = 1024 * 1024  # Never rewrite blocks.bin to drop garbage below this size
+
+def data_file_path(db_name):
+    """Returns the path of the directory holding the compressed blocks of the specified database."""
+    return f"{db_name}_blocks"
+
+def blocks_file_path(directory):
+    return os.path.join(directory, "blocks.bin")
+
+def index_file_path(directory):
+    return os.path.join(directory, "index.json")
+
+def encode_record(fields, record):
+    """Turns a record dict into a row of values in schema order, or None for a deleted slot."""
+    if record is None:
+        return None
+    row = []
+    for field, max_length in fields.items():
+        value = record.get(field)
+        value = "" if value is None else str(value)
+        if len(value) > max_length:
+            raise ValueError(f"Value for '{field}' exceeds maximum length of {max_length}.")
+        row.append(value)
+    return row
+
+def decode_record(fields, row):
+    if row is None:
+        return None
+    return dict(zip(fields, row))
+
+class BlockFile:
+    """
+    Open handle on the blocks of one database. Keeps the last decompressed block, so reading
+    neighbouring slots decompresses each block once.
+    """
+
+    def __init__(self, db_name, fields, writable=False):
+        self.fields = fields
+        self.directory = data_file_path(db_name)
+        with open(index_file_path(self.directory), 'r') as f:
+            index = json.load(f)
+        self.codec = index["codec"]
+        self.compress, self.decompress = CODECS[self.codec]
+        self.blocks = index["blocks"]
+        self.slot_count = sum(block[3] for block in self.blocks)
+        self.file = open(blocks_file_path(self.directory), 'r+b' if writable else 'rb')
+        self.cached_number = None
+        self.cached_rows = None
+        self.changed = False
+
+    def __len__(self):
+        return self.slot_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.changed:
+            self.save_index()
+        self.file.close()
+
+    def read_block(self, number):
+        """Returns the rows of block `number` as a list (shared with the cache)."""
+        if number != self.cached_number:
+            offset, length, _, _ = self.blocks[number]
+            self.file.seek(offset)
+            self.cached_rows = json.loads(self.decompress(self.file.read(length)))
+            self.cached_number = number
+        return self.cached_rows
+
+    def write_block(self, number, rows):
+        """Compresses the rows and appends them as the new version of block `number`."""
+        raw = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+        data = self.compress(raw)
+        self.file.seek(0, os.SEEK_END)
+        entry = [self.file.tell(), len(data), len(raw), len(rows)]
+        self.file.write(data)
+        if number == len(self.blocks):
+            self.blocks.append(entry)
+        else:
+            self.blocks[number] = entry
+        self.slot_count = sum(block[3] for block in self.blocks)
+        self.cached_number, self.cached_rows = number, rows
+        self.changed = True
+
+    def save_index(self):
+        """Points the index at the current blocks, after they have reached the file."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        write_index(self.directory, self.codec, self.blocks)
+        self.changed = False
+
+    def read(self, index):
+        """Returns the record in slot `index`, or None if it is out of range or deleted."""
+        if index < 0 or index >= self.slot_count:
+            return None
+        rows = self.read_block(index // BLOCK_RECORDS)
+        return decode_record(self.fields, rows[index % BLOCK_RECORDS])
+
+    def write_rows(self, rows_by_index):
+        """Sets several existing slots to the given rows, recompressing each touched block once."""
+        by_block = {}
+        for index, row in rows_by_index:
+            if index < 0 or index >= self.slot_count:
+                raise IndexError(f"Record index {index} is out of range.")
+            by_block.setdefault(index // BLOCK_RECORDS, []).append((index % BLOCK_RECORDS, row))
+        for number, changes in by_block.items():
+            rows = list(self.read_block(number))
+            for position, row in changes:
+                rows[position] = row
+            self.write_block(number, rows)
+
+    def append_rows(self, rows):
+        """Adds rows in new slots, topping up the last block first. Returns the first new index."""
+        first = self.slot_count
+        rows = list(rows)
+        if self.blocks and self.blocks[-1][3] < BLOCK_RECORDS:
+            number = len(self.blocks) - 1
+            room = BLOCK_RECORDS - self.blocks[-1][3]
+            self.write_block(number, self.read_block(number) + rows[:room])
+            rows = rows[room:]
+        for start in range(0, len(rows), BLOCK_RECORDS):
+            self.write_block(len(self.blocks), rows[start:start + BLOCK_RECORDS])
+        return first
+
+    def __iter__(self):
+        """Yields (index, record) for every live slot, decompressing one block at a time."""
+        for number in range(len(self.blocks)):
+            for position, row in enumerate(self.read_block(number)):
+                if row is not None:
+                    yield number * BLOCK_RECORDS + position, decode_record(self.fields, row)
+
+    def live_bytes(self):
+        return sum(block[1] for block in self.blocks)
+
+def write_index(directory, codec, blocks):
+    """Writes the block index atomically."""
+    path = index_file_path(directory)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump({"codec": codec, "block_records": BLOCK_RECORDS, "blocks": blocks}, f)
+    os.replace(f"{path}.tmp", path)
+
+def write_blocks(directory, fields, records, codec):
+    """Writes the given records (None for a deleted slot) as a fresh blocks file and index."""
+    os.makedirs(directory, exist_ok=True)
+    compress = CODECS[codec][0]
+    blocks = []
+    rows = []
+
+    def flush_block(f):
+        raw = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+        data = compress(raw)
+        blocks.append([f.tell(), len(data), len(raw), len(rows)])
+        f.write(data)
+
+    with open(blocks_file_path(directory), 'wb') as f:
+        for record in records:
+            rows.append(encode_record(fields, record))
+            if len(rows) == BLOCK_RECORDS:
+                flush_block(f)
+                rows = []
+        if rows:
+            flush_block(f)
+    write_index(directory, codec, blocks)
+
+def current_codec(db_name):
+    """Returns the codec the database is compressed with, or None if it has no blocks yet."""
+    try:
+        with open(index_file_path(data_file_path(db_name)), 'r') as f:
+            return json.load(f)["codec"]
+    except FileNotFoundError:
+        return None
+
+def write_all(db_name, fields, records, codec=None):
+    """
+    Rewrites every block with the given records (None for a deleted slot), using `codec` or
+    else the database's current codec. The new files are built in a separate directory that
+    then replaces the old one.
+    """
+    codec = codec or current_codec(db_name) or DEFAULT_CODEC
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec '{codec}'. Use one of: {', '.join(CODECS)}")
+    directory = data_file_path(db_name)
+    temp_directory = f"{directory}.tmp"
+    if os.path.exists(temp_directory):
+        shutil.rmtree(temp_directory)
+    write_blocks(temp_directory, fields, records, codec)
+    if os.path.exists(directory):
+        os.replace(directory, f"{directory}.old")
+    os.replace(temp_directory, directory)
+    shutil.rmtree(f"{directory}.old", ignore_errors=True)
+
+def recover(db_name, fields):
+    """Finishes or undoes a write_all() that was interrupted between its two renames."""
+    directory = data_file_path(db_name)
+    if not os.path.exists(directory) and os.path.exists(f"{directory}.old"):
+        os.replace(f"{directory}.old", directory)
+    for leftover in (f"{directory}.old", f"{directory}.tmp"):
+        if os.path.exists(leftover):
+            shutil.rmtree(leftover)
+
+def compact(db_name, fields):
+    """Rewrites blocks.bin without the superseded copies of blocks once they outweigh the live ones."""
+    directory = data_file_path(db_name)
+    size = os.path.getsize(blocks_file_path(directory))
+    with BlockFile(db_name, fields) as blocks:
+        if size < COMPACT_MIN_BYTES or size < 2 * blocks.live_bytes():
+            return
+    write_all(db_name, fields, read_slots(db_name, fields))
+
+def record_count(db_name, fields):
+    """Returns the number of slots (live or deleted)."""
+    with BlockFile(db_name, fields) as blocks:
+        return len(blocks)
+
+def read_record(db_name, fields, index):
+    with BlockFile(db_name, fields) as blocks:
+        return blocks.read(index)
+
+def read_many(db_name, fields, positions):
+    """Yields (index, record) for each live slot among `positions`, in the order given."""
+    with BlockFile(db_name, fields) as blocks:
+        for position in positions:
+            record = blocks.read(position)
+            if record is not None:
+                yield position, record
+
+def read_slots(db_name, fields):
+    """Returns every slot as a list, with None for deleted slots."""
+    with BlockFile(db_name, fields) as blocks:
+        return [decode_record(fields, row) for number in range(len(blocks.blocks)) for row in blocks.read_block(number)]
+
+def iter_records(db_name, fields):
+    """Yields (index, record) for every live slot."""
+    with BlockFile(db_name, fields) as blocks:
+        yield from blocks
+
+def deleted_slots(db_name, fields):
+    """Returns the positions of the deleted slots."""
+    with BlockFile(db_name, fields) as blocks:
+        return [number * BLOCK_RECORDS + position
+                for number in range(len(blocks.blocks))
+                for position, row in enumerate(blocks.read_block(number)) if row is None]
+
+def write_record(db_name, fields, index, record):
+    write_records(db_name, fields, [(index, record)])
+
+def write_records(db_name, fields, records_by_index):
+    """Overwrites several existing slots; each block they fall in is decompressed and rewritten once."""
+    with BlockFile(db_name, fields, writable=True) as blocks:
+        blocks.write_rows((index, encode_record(fields, record)) for index, record in records_by_index)
+    compact(db_name, fields)
+
+def delete_record(db_name, fields, index):
+    with BlockFile(db_name, fields, writable=True) as blocks:
+        blocks.write_rows([(index, None)])
+    compact(db_name, fields)
+
+def append_records(db_name, fields, records):
+    """Appends records in new slots and returns the first new index."""
+    rows = [encode_record(fields, record) for record in records]
+    with BlockFile(db_name, fields, writable=True) as blocks:
+        first = blocks.append_rows(rows)
+    compact(db_name, fields)
+    return first
+
+def storage_size(db_name):
+    """Total bytes used by the blocks file and the block index."""
+    directory = data_file_path(db_name)
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def compression_ratio(db_name, fields):
+    """Returns (uncompressed bytes, compressed bytes) of the live blocks."""
+    with BlockFile(db_name, fields) as blocks:
+        return sum(block[2] for block in blocks.blocks), blocks.live_bytes()
@@ -32,21 +32,16 @@ def load_system_file(db_name):
         return json.load(f)
 
 def load_data_file(db_name):
-    """Loads the data file for the specified database."""
-    data_file = f"{db_name}_data.json"
-    if not os.path.exists(data_file):
-        print(f"Data file for database '{db_name}' not found.")
-        return None
-    with open(data_file, 'r') as f:
-        return json.load(f)
+    """Loads the data file for the specified database, including records appended to its log."""
+    return fm.load_data_file(db_name)
 
 def save_data_file(db_name, records):
     """Saves the records to the data file for the specified database."""
-    data_file = f"{db_name}_data.json"
-    with open(data_file, 'w') as f:
-        json.dump(records, f, indent=4)
+    fm.save_data_file(db_name, records)
 
-import file_manager as fm
+import query
+import bulk_io
+import aggregates
 
 def add_record(db_name):
     fields = fm.load_system_file(db_name)
@@ -59,12 +54,12 @@ def add_record(db_name):
             return
         record[field] = value
 
-    # Load existing records
-    records = fm.load_data_file(db_name)
-    # Append the new record to the records list
-    records.append(record)
-    # Save the updated records back to the data file
-    fm.save_data_file(db_name, records)
+    # Append only the new record to the log instead of rewriting the whole data file
+    try:
+        fm.append_record(db_name, record)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
 
     print("Record added successfully.")
 
@@ -77,71 +72,287 @@ def add_record(db_name):
 
 
 
-def view_records(db_name):
+def view_records(db_name, order_by=None, descending=False, page_size=query.PAGE_SIZE):
     """
-    Displays all records in the specified database in a tabular format with symmetrical alignment.
+    Displays the records of the specified database a page at a time, in a table whose columns
+    are as wide as the schema allows, and lets the user move to the next or previous page.
+    The first column shows the ID to use when editing or deleting a record.
+    Records come in ID order, or sorted on `order_by`. Each page is read on its own from a
+    cursor, so even a very large table is neither scanned to measure it nor held in memory.
     """
-    # Load records from the database
-    records = fm.load_data_file(db_name)
-    if not records:
+    fields = fm.load_system_file(db_name) or {}
+    if order_by is not None and order_by not in fields:
+        print(f"Error: field '{order_by}' does not exist.")
+        return
+
+    page = query.read_page(db_name, None, page_size, order_by, descending)
+    if not page["rows"]:
         print("No records found.")
         return
+    id_width = len(str(fm.record_id_map(db_name).next_id - 1))
+    while True:
+        print_page(fields, page["rows"], id_width)
+        moves = []
+        if page["next"]:
+            moves.append("n = next page")
+        if page["prev"]:
+            moves.append("p = previous page")
+        if not moves:
+            return
+        action = input(f"{', '.join(moves)}, blank to go back: ").strip().lower()
+        if action == 'n' and page["next"]:
+            page = query.read_page(db_name, page["next"], page_size)
+        elif action == 'p' and page["prev"]:
+            page = query.read_page(db_name, page["prev"], page_size)
+        elif not action:
+            return
+        else:
+            print("Invalid choice.")
+
+
+def print_page(fields, rows, id_width=0):
+    """
+    Prints (record ID, record) rows as a table. Each column is as wide as its field's maximum
+    length in the schema, so the widths are known without reading any other record.
+    """
+    widths = [max(len("ID"), id_width)] + [max(len(field), max_length) for field, max_length in fields.items()]
+    separator = "+-" + "-+-".join("-" * width for width in widths) + "-+"
+    print(separator)
+    print("| " + " | ".join(text.ljust(width) for text, width in zip(["ID"] + list(fields), widths)) + " |")
+    print(separator)
+    for record_id, record in rows:
+        values = [str(record_id)] + [str(record.get(field, "")) for field in fields]
+        print("| " + " | ".join(value.ljust(width) for value, width in zip(values, widths)) + " |")
+    print(separator)
+
+
+def print_table(headers, make_rows, ids=None):
+    """
+    Prints (index, record) rows as a table with the given headers.
+    `make_rows` is called once to measure the column widths and once more to print,
+    so rows can be streamed from storage instead of kept in memory.
+    With `ids`, a record ID map, the first column shows each record's ID instead of a row number.
+    """
+    def label(index):
+        return str(ids.id_at(index)) if ids is not None else str(index + 1)
 
     # Extract field names (headers) and calculate column widths
-    headers = list(records[0].keys())
     column_widths = {header: len(header) for header in headers}
+    index_header = "ID" if ids is not None else "#"
+    index_width = len(index_header)
+    record_count = 0
 
     # Update column widths based on the longest value in each column
-    for record in records:
-        for field, value in record.items():
-            column_widths[field] = max(column_widths[field], len(str(value)))
+    for index, record in make_rows():
+        record_count += 1
+        index_width = max(index_width, len(label(index)))
+        for field in headers:
+            column_widths[field] = max(column_widths[field], len(str(record.get(field, ""))))
+
+    if not record_count:
+        print("No records found.")
+        return
 
     # Create the header row and separator
-    header_row = " | ".join(header.ljust(column_widths[header]) for header in headers)
-    separator = "+-" + "-+-".join("-" * column_widths[header] for header in headers) + "-+"
+    header_row = " | ".join([index_header.ljust(index_width)] + [header.ljust(column_widths[header]) for header in headers])
+    separator = "+-" + "-+-".join(["-" * index_width] + ["-" * column_widths[header] for header in headers]) + "-+"
 
     # Print the table
     print(separator)
     print(f"| {header_row} |")
     print(separator)
-    for record in records:
-        row = " | ".join(str(record[field]).ljust(column_widths[field]) for field in headers)
+    for index, record in make_rows():
+        row = " | ".join([label(index).ljust(index_width)] + [str(record.get(field, "")).ljust(column_widths[field]) for field in headers])
         print(f"| {row} |")
     print(separator)
 
 
-def delete_record(db_name, record_index):
-    """Deletes a record by its index from the specified database."""
-    records = load_data_file(db_name)
-    if records is None:
+def query_records(db_name):
+    """
+    Prompts for conditions, fields, ordering and a limit, then prints the matching records.
+    """
+    fields = fm.load_system_file(db_name)
+    print("Conditions look like 'roll >= 5', 'lname startswith k' or 'roll between 3 7'.")
+    print(f"Operators: {', '.join(query.OPERATORS)}")
+
+    conditions = []
+    for text in input("Conditions, separated by ';' (blank for all records): ").split(";"):
+        if not text.strip():
+            continue
+        try:
+            condition = query.parse_condition(text)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if condition[0] not in fields:
+            print(f"Error: field '{condition[0]}' does not exist.")
+            return
+        conditions.append(condition)
+
+    selected = [field.strip() for field in input("Fields to show, separated by ',' (blank for all): ").split(",") if field.strip()]
+    for field in selected:
+        if field not in fields:
+            print(f"Error: field '{field}' does not exist.")
+            return
+
+    order_by = input("Order by field (prefix with '-' for descending, blank for none): ").strip() or None
+    descending = False
+    if order_by is not None:
+        descending = order_by.startswith("-")
+        order_by = order_by.lstrip("-")
+        if order_by not in fields:
+            print(f"Error: field '{order_by}' does not exist.")
+            return
+
+    limit = input("Maximum number of records (blank for no limit): ").strip()
+    try:
+        limit = int(limit) if limit else None
+    except ValueError:
+        print("Error: the limit must be a whole number.")
         return
 
-    # Validate the record index
-    if record_index < 0 or record_index >= len(records):
-        print("Invalid record index.")
+    description, _, _ = query.plan(db_name, conditions, order_by, descending)
+    print(f"Reading records using {description}.")
+
+    # The limit keeps the result small, so it is collected once and printed from memory
+    results = list(query.select(db_name, conditions, selected or None, order_by, descending, limit))
+    print_table(selected or list(fields), lambda: iter(results), fm.record_id_map(db_name))
+
+
+def create_index(db_name):
+    """Prompts for a field and builds a sorted index on it for faster queries."""
+    fields = fm.load_system_file(db_name)
+    indexed = fm.load_system_options(db_name)["indexes"]
+    if indexed:
+        print(f"Indexed fields: {', '.join(indexed)}")
+    field = input("Enter the field to index: ").strip()
+    if field not in fields:
+        print(f"Field '{field}' does not exist.")
+        return
+    if fm.create_index(db_name, field):
+        print(f"Index on '{field}' created successfully.")
+
+
+def import_records(db_name):
+    """Prompts for a CSV or JSON Lines file and imports its rows into the database."""
+    path = input("Enter the path of the CSV or JSONL file to import: ").strip()
+    if not os.path.exists(path):
+        print(f"File '{path}' not found.")
+        return
+    file_format = bulk_io.guess_format(path)
+    if file_format is None:
+        file_format = input(f"File format ({'/'.join(bulk_io.FILE_FORMATS)}): ").strip().lower()
+    try:
+        imported, rejected = bulk_io.import_file(db_name, path, file_format)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    # Report the first few rejected rows by line number
+    for line_number, reason in rejected[:20]:
+        print(f"Line {line_number}: {reason}")
+    if len(rejected) > 20:
+        print(f"... and {len(rejected) - 20} more rejected rows.")
+    print(f"Imported {imported} records, rejected {len(rejected)}.")
+
+
+def export_records(db_name):
+    """Prompts for an output file, format, fields and conditions, then exports the matching records."""
+    fields = fm.load_system_file(db_name)
+    path = input("Enter the file to export to (blank to print here): ").strip() or None
+    file_format = bulk_io.guess_format(path) if path else None
+    if file_format is None:
+        file_format = input(f"File format ({'/'.join(bulk_io.FILE_FORMATS)}, blank for csv): ").strip().lower() or "csv"
+    selected = [field.strip() for field in input("Fields to export, separated by ',' (blank for all): ").split(",") if field.strip()]
+    order_by = input("Order by field (prefix with '-' for descending, blank for record order): ").strip() or None
+    descending = order_by is not None and order_by.startswith("-")
+    if order_by is not None:
+        order_by = order_by.lstrip("-")
+
+    conditions = []
+    for text in input("Conditions, separated by ';' (blank for all records): ").split(";"):
+        if not text.strip():
+            continue
+        try:
+            conditions.append(query.parse_condition(text))
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+
+    try:
+        count = bulk_io.export_file(db_name, path, file_format, selected or None, conditions, order_by, descending)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        return
+    print(f"Exported {count} records" + (f" to '{path}'." if path else "."))
+
+
+def group_records(db_name):
+    """Prompts for group fields, aggregates and conditions, then prints one row per group."""
+    fields = fm.load_system_file(db_name)
+    group_fields = [field.strip() for field in input("Group by fields, separated by ',' (blank for the whole table): ").split(",") if field.strip()]
+    print(f"Aggregates look like 'count', 'count:lname' or 'avg:roll'. Functions: {', '.join(aggregates.GROUP_FUNCTIONS)}")
+    try:
+        functions = [aggregates.parse_group_function(text)
+                     for text in (input("Aggregates, separated by ',' (blank for count): ") or "count").split(",") if text.strip()]
+        conditions = [query.parse_condition(text)
+                      for text in input("Conditions, separated by ';' (blank for all records): ").split(";") if text.strip()]
+        for field in group_fields + [condition[0] for condition in conditions]:
+            if field not in fields:
+                raise ValueError(f"Field '{field}' does not exist.")
+        results = list(aggregates.group_by(db_name, group_fields, functions, conditions))
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    headers = group_fields + [aggregates.group_function_label(function, field) for function, field in functions]
+    rows = [(i, dict(zip(headers, list(key) + values))) for i, (key, values) in enumerate(results)]
+    print_table(headers, lambda: iter(rows))
+
+
+def vacuum_database(db_name):
+    """Rewrites the database without its deleted records and reports the space reclaimed."""
+    db = fm.open_database(db_name)
+    dead, slots = db.dead_count(), db.slot_count()
+    print(f"{dead} of {slots} record slots are deleted.")
+    if not dead:
+        return
+    confirm = input("Compact the database now? Record IDs stay the same. (yes/no): ").strip().lower()
+    if confirm != 'yes':
+        print("Compaction canceled.")
+        return
+    report = db.vacuum()
+    print(f"Removed {report['removed']} deleted records and reclaimed {report['bytes_reclaimed']} bytes "
+          f"({report['bytes_before']} -> {report['bytes_after']}) in {report['seconds']:.3f} seconds.")
+
+
+def delete_record(db_name, record_id):
+    """Deletes a record by its ID from the specified database."""
+    # Validate the record ID
+    if fm.get_record_by_id(db_name, record_id) is None:
+        print("Invalid record ID.")
         return
 
     # Confirm deletion
-    confirm = input(f"Are you sure you want to delete record {record_index + 1}? (yes/no): ").strip().lower()
+    confirm = input(f"Are you sure you want to delete record {record_id}? (yes/no): ").strip().lower()
     if confirm == 'yes':
-        records.pop(record_index)
-        save_data_file(db_name, records)
-        print(f"Record {record_index + 1} deleted successfully.")
+        fm.remove_record_by_id(db_name, record_id)
+        print(f"Record {record_id} deleted successfully.")
     else:
         print("Deletion canceled.")
 
-def edit_record(db_name, record_index):
-    """Edits an existing record in the specified database."""
-    fields, records = fm.load_database_files(db_name)
+def edit_record(db_name, record_id):
+    """Edits an existing record, chosen by its ID, in the specified database."""
+    fields = fm.load_system_file(db_name)
 
-    # Check if the record index is within the range of existing records
-    if record_index < 0 or record_index >= len(records):
-        print("Invalid record index. Please enter a valid index.")
+    # Check if the record ID refers to an existing record
+    record = fm.get_record_by_id(db_name, record_id)
+    if record is None:
+        print("Invalid record ID. Please enter a valid ID.")
         return
     
     # Display the current values of the record and prompt for new values
-    record = records[record_index]
-    print(f"Editing record {record_index + 1}:")
+    print(f"Editing record {record_id}:")
     for field in fields:
         current_value = record.get(field, "")
         
@@ -159,6 +370,36 @@ def edit_record(db_name, record_index):
                 print(f"Error: '{field}' value exceeds maximum length of {fields[field]}")
                 return
     
-    # Save the updated records
-    fm.save_data_file(db_name, records)
+    # Save the updated record
+    try:
+        fm.update_record_by_id(db_name, record_id, record)
+    except (ValueError, IndexError) as e:
+        print(f"Error: {e}")
+        return
     print("Record updated successfully.")
+
+def open_record_by_key(db_name):
+    """
+    Finds a record through the primary-key index and lets the user edit or delete it.
+    """
+    primary_key = fm.load_system_options(db_name)["primary_key"]
+    if primary_key is None:
+        print(f"Database '{db_name}' has no primary key.")
+        return
+
+    key = input(f"Enter the {primary_key} of the record to open: ").strip()
+    record_index, record = fm.find_record(db_name, key)
+    if record is None:
+        print(f"No record found with {primary_key} '{key}'.")
+        return
+
+    record_id = fm.open_database(db_name).record_id(record_index)
+    print(f"Record {record_id}:")
+    for field, value in record.items():
+        print(f"  {field}: {value}")
+
+    action = input("Edit, delete or go back? (e/d/b): ").strip().lower()
+    if action == 'e':
+        edit_record(db_name, record_id)
+    elif action == 'd':
+        delete_record(db_name, record_id)
@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import simpledialog, messagebox
 import file_manager as fm  # Assuming this contains your file handling functions
+import query
+import record_grid
 
 class SimpleDBMS:
     def __init__(self, master):
@@ -35,8 +37,9 @@ class SimpleDBMS:
 
         # Record Management Buttons
         self.record_buttons = []  # Store the record management buttons
-        self.records = []  # Initialize records
+        self.db = None  # Shared handle on the open database; caches its schema and records
         self.current_db_name = None  # Keep track of the current database name
+        self.record_grid = None  # Grid of the records window, while it is open
 
     def create_database(self):
         db_name = simpledialog.askstring("Input", "Enter the name of the new database:")
@@ -100,7 +103,8 @@ class SimpleDBMS:
             messagebox.showwarning("Warning", f"Database '{db_name}' does not exist.")
             return
 
-        fields, self.records = fm.load_database_files(db_name)  # Assuming this function exists
+        self.db = fm.open_database(db_name)
+        fields = self.db.fields
         self.display_all_records(fields)  # Call to display_all_records
 
         # Inform the user that they are now working in this database
@@ -115,7 +119,7 @@ class SimpleDBMS:
             widget.pack_forget()  # Hide main menu buttons
 
     def show_record_management_buttons(self, fields):
-        self.add_record_button = tk.Button(self.master, text="Add Record", command=lambda: self.add_record(self.current_db_name, fields), bg="#FFC107")
+        self.add_record_button = tk.Button(self.master, text="Add Record", command=lambda: self.add_record(fields), bg="#FFC107")
         self.add_record_button.pack(pady=5)
         self.record_buttons.append(self.add_record_button)
 
@@ -127,6 +131,10 @@ class SimpleDBMS:
         self.delete_record_button.pack(pady=5)
         self.record_buttons.append(self.delete_record_button)
 
+        self.find_record_button = tk.Button(self.master, text="Open Record by Key", command=lambda: self.open_record_by_key(fields), bg="#03A9F4")
+        self.find_record_button.pack(pady=5)
+        self.record_buttons.append(self.find_record_button)
+
         self.display_all_button = tk.Button(self.master, text="Display All Records", command=lambda: self.display_all_records(fields), bg="#4CAF50")
         self.display_all_button.pack(pady=5)
         self.record_buttons.append(self.display_all_button)
@@ -146,7 +154,7 @@ class SimpleDBMS:
         self.delete_db_button.pack(pady=5)
         self.exit_button.pack(pady=5)
 
-    def add_record(self, db_name, fields):
+    def add_record(self, fields):
         """Adds a new record to the opened database."""
         record = {}
         for field, max_length in fields.items():
@@ -156,30 +164,28 @@ class SimpleDBMS:
                 return
             record[field] = value
 
-        # Load existing records
-        records = fm.load_data_file(db_name) or []
-        
-        # Append the new record to the list of records
-        records.append(record)
-        
-        # Save the updated records back to the data file
-        fm.save_data_file(db_name, records)
+        # Append only the new record to the log instead of rewriting the data file
+        try:
+            self.db.add(record)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        self.refresh_records()
         messagebox.showinfo("Success", "Record added successfully.")
 
     def edit_record(self, fields):
         """Edits an existing record in the opened database."""
-        if not self.records:  # Check if records are available
+        if next(self.db.iter_records(), None) is None:  # Check if records are available
             messagebox.showwarning("Warning", "No records available to edit.")
             return
 
-        # Prompt user to enter the index of the record to edit
-        record_index = simpledialog.askinteger("Input", f"Enter the index of the record to edit (0 to {len(self.records) - 1}):")
-        if record_index is None or record_index < 0 or record_index >= len(self.records):
-            messagebox.showwarning("Warning", "Invalid record index.")
+        # Prompt user to enter the ID of the record to edit, as shown in the record list
+        record_id = simpledialog.askinteger("Input", "Enter the ID of the record to edit:", initialvalue=self.selected_record_id())
+        record = self.db.get_by_id(record_id) if record_id is not None else None  # Get the record to edit
+        if record is None:
+            messagebox.showwarning("Warning", "Invalid record ID.")
             return
 
-        record = self.records[record_index]  # Get the record to edit
-
         for field in fields.keys():
             # Prompt user for new value, using the current value as a hint
             new_value = simpledialog.askstring("Edit Value", f"Edit value for '{field}' (current: '{record[field]}'):")
@@ -190,42 +196,98 @@ class SimpleDBMS:
                     return
                 record[field] = new_value  # Update the record with the new value
 
-        # Save the updated records back to the data file
-        fm.save_data_file(self.current_db_name, self.records)
+        # Save the updated record back to the data file
+        try:
+            self.db.update_by_id(record_id, record)
+        except (ValueError, IndexError) as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        self.refresh_records()
+        messagebox.showinfo("Success", "Record edited successfully.")
+
+    def open_record_by_key(self, fields):
+        """Finds a record through the primary-key index and offers to edit it."""
+        primary_key = self.db.options["primary_key"]
+        if primary_key is None:
+            messagebox.showwarning("Warning", f"Database '{self.current_db_name}' has no primary key.")
+            return
+
+        key = simpledialog.askstring("Input", f"Enter the {primary_key} of the record to open:")
+        if not key:
+            return
+        record_index, record = fm.find_record(self.current_db_name, key)
+        if record is None:
+            messagebox.showinfo("Info", f"No record found with {primary_key} '{key}'.")
+            return
+        # Hold on to the ID, which stays put while the dialogs below are open even if a vacuum moves the record
+        record_id = self.db.record_id(record_index)
+
+        record_str = "\n".join(f"{field}: {record.get(field, '')}" for field in fields)
+        if not messagebox.askyesno("Record Found", f"{record_str}\n\nDo you want to edit this record?"):
+            return
+
+        for field in fields.keys():
+            new_value = simpledialog.askstring("Edit Value", f"Edit value for '{field}' (current: '{record.get(field, '')}'):")
+            if new_value is not None:
+                if len(new_value) > fields[field]:
+                    messagebox.showwarning("Warning", f"Value for '{field}' exceeds maximum length of {fields[field]} characters.")
+                    return
+                record[field] = new_value
+
+        # Write back just this record
+        try:
+            self.db.update_by_id(record_id, record)
+        except (ValueError, IndexError) as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        self.refresh_records()
         messagebox.showinfo("Success", "Record edited successfully.")
 
     def delete_record(self):
         """Deletes a record from the opened database."""
-        if not self.records:  # Check if records are available
+        if next(self.db.iter_records(), None) is None:  # Check if records are available
             messagebox.showwarning("Warning", "No records available to delete.")
             return
 
-        record_index = simpledialog.askinteger("Input", f"Enter the index of the record to delete (0 to {len(self.records) - 1}):")
-        if record_index is None or record_index < 0 or record_index >= len(self.records):
-            messagebox.showwarning("Warning", "Invalid record index.")
+        record_id = simpledialog.askinteger("Input", "Enter the ID of the record to delete:", initialvalue=self.selected_record_id())
+        if record_id is None or self.db.get_by_id(record_id) is None:
+            messagebox.showwarning("Warning", "Invalid record ID.")
             return
 
         # Confirm deletion
-        confirm = messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete the record at index {record_index}?")
+        confirm = messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete record {record_id}?")
         if confirm:
-            del self.records[record_index]  # Delete the record
-            # Save the updated records back to the data file
-            fm.save_data_file(self.current_db_name, self.records)
+            self.db.remove_by_id(record_id)  # Delete the record
+            self.refresh_records()
             messagebox.showinfo("Success", "Record deleted successfully.")
 
     def display_all_records(self, fields):
-        """Displays all records in a new window."""
-        if not self.records:  # Check if there are records to display
+        """
+        Displays the records in a new window as a scrolling grid. Only the rows on screen are
+        drawn and records are read as they scroll into view, so even a huge table opens at once.
+        """
+        if not query.record_total(self.db.name):  # Check if there are records to display
             messagebox.showinfo("Info", "No records available to display.")
             return
 
+        if self.record_grid_open():
+            self.record_grid.frame.winfo_toplevel().destroy()  # One records window at a time
         display_window = tk.Toplevel(self.master)
-        display_window.title("All Records")
+        display_window.title(f"Records in '{self.db.name}'")
+        self.record_grid = record_grid.RecordGrid(display_window, self.db.name, fields)
+        self.record_grid.frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+    def record_grid_open(self):
+        return self.record_grid is not None and self.record_grid.frame.winfo_exists()
+
+    def refresh_records(self):
+        """Redraws the records window, if it is open, after a change."""
+        if self.record_grid_open():
+            self.record_grid.refresh()
 
-        for idx, record in enumerate(self.records):
-            record_str = f"Record {idx}: " + ", ".join(f"{field}: {record[field]}" for field in fields)
-            record_label = tk.Label(display_window, text=record_str)
-            record_label.pack()
+    def selected_record_id(self):
+        """Returns the ID of the record selected in the records window, or None."""
+        return self.record_grid.selected_id() if self.record_grid_open() else None
 
 def main():
     root = tk.Tk()
@@ -1,16 +1,1013 @@
+import contextlib
+import heapq
+import itertools
 import json
 import os
+import shutil
+import threading
+import time
+import catalog
+import columnar_storage
+import compressed_storage
+import fixed_storage
+import indexes
+import locking
+import wal
+
+# Key in the system file holding storage options; everything else in that file is a field
+SYSTEM_OPTIONS_KEY = "__options__"
+STORAGE_FORMATS = ("json", "fixed", "columnar", "compressed")
+# Formats that keep each record in a numbered slot, by the module implementing them
+SLOT_STORAGES = {"fixed": fixed_storage, "columnar": columnar_storage, "compressed": compressed_storage}
+READ_CHUNK_SIZE = 64 * 1024  # Characters read at a time when streaming a JSON data file
+SCAN_CHUNK_SLOTS = 1024  # Slots read under one read lock when scanning slot-based storage
+CHECKPOINT_MIN_BYTES = 1024 * 1024  # Fold the log into the data file once it is this big and larger than the data file
+VACUUM_DEAD_RATIO = 0.5  # Default share of deleted slots that triggers a background vacuum
+VACUUM_MIN_DEAD_ROWS = 1000  # Never vacuum automatically for fewer deleted slots than this
+
+def file_signature(path):
+    """
+    Returns a cheap fingerprint of a file (modification time, size and inode), or None if it
+    does not exist. A changed fingerprint means the file must be read again.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+class Database:
+    """
+    Open handle on one database.
+    The schema, options, indexes and (for JSON storage) records are kept in memory after the
+    first read. Before each use they are revalidated with a stat of the underlying files, so
+    repeated operations skip re-parsing unless another process has changed the files.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.system_file = f"{name}_system.json"
+        self.log_file = f"{name}_data.log"
+        self.signatures = {}    # cache key -> file signatures the cached value was read from
+        self.system = None      # parsed system file
+        self.records_cache = None  # JSON storage only: every record, including the log
+        self.index_cache = {}   # ("pk",) or ("sorted", field) -> loaded index
+        self.wal = wal.WriteAheadLog(self.log_file)
+        self.lock = threading.RLock()  # Held while changing the records, the log or the data file
+        self.file_lock = locking.ReadWriteLock(locking.lock_file_path(name))  # Shared with other processes
+        self.generation = 0     # Bumped whenever the data file is replaced
+        self.checkpoint_thread = None
+        self.vacuum_thread = None
+        self.last_vacuum = None  # Report of the most recent vacuum
+
+    # ----- cache bookkeeping -----
+
+    def is_fresh(self, key, paths):
+        """Returns True if the cached value under `key` was read from the files as they are now."""
+        return self.signatures.get(key) == [file_signature(path) for path in paths]
+
+    def remember(self, key, paths):
+        """Records the current signatures of `paths` as the version cached under `key`."""
+        self.signatures[key] = [file_signature(path) for path in paths]
+
+    def invalidate(self):
+        """Drops everything cached for this database."""
+        self.signatures.clear()
+        self.system = None
+        self.records_cache = None
+        self.index_cache.clear()
+
+    # ----- locking -----
+
+    @contextlib.contextmanager
+    def writing(self):
+        """
+        Holds the database for a change: other threads and other processes neither read nor
+        write until it is done. Cached data is checked against the files afterwards as usual,
+        so changes made by another process before the lock was taken are picked up.
+        """
+        with self.lock, self.file_lock.exclusive():
+            yield
+
+    def reading(self):
+        """Holds the database for a read; other readers carry on, writers wait."""
+        return self.file_lock.shared()
+
+    # ----- schema and options -----
+
+    def load_system(self):
+        """Returns the parsed system file, re-reading it only if it changed on disk."""
+        if self.system is None or not self.is_fresh("system", [self.system_file]):
+            if not os.path.exists(self.system_file):
+                self.system = None
+                return None
+            with open(self.system_file, 'r') as f:
+                self.system = json.load(f)
+            self.remember("system", [self.system_file])
+        return self.system
+
+    @property
+    def fields(self):
+        """The field names and maximum lengths, or None if the system file is missing."""
+        system = self.load_system()
+        if system is None:
+            return None
+        return {field: max_length for field, max_length in system.items() if field != SYSTEM_OPTIONS_KEY}
+
+    @property
+    def options(self):
+        """
+        The storage options, with JSON storage, no primary key, no indexes and the default
+        vacuum threshold as defaults. A `vacuum_ratio` of None turns automatic vacuuming off.
+        """
+        options = {"storage": "json", "primary_key": None, "indexes": [], "vacuum_ratio": VACUUM_DEAD_RATIO}
+        system = self.load_system() or {}
+        stored = system.get(SYSTEM_OPTIONS_KEY, {})
+        options.update(stored)
+        options["indexes"] = list(options["indexes"])
+        return options
+
+    def save_options(self, options):
+        """Stores the given options in the system file, keeping the fields untouched."""
+        with self.writing():
+            system = dict(self.load_system())
+            system[SYSTEM_OPTIONS_KEY] = options
+            with open(self.system_file, 'w') as f:
+                json.dump(system, f, indent=4)
+            self.system = system
+            self.remember("system", [self.system_file])
+
+    @property
+    def storage(self):
+        return self.options["storage"]
+
+    @property
+    def slot_store(self):
+        """The module storing the records in slots (fixed-width, columnar or compressed), or None for JSON."""
+        return SLOT_STORAGES.get(self.storage)
+
+    @property
+    def data_file(self):
+        """Path of the data file (a directory for columnar and compressed storage), based on the storage format."""
+        if self.slot_store is not None:
+            return self.slot_store.data_file_path(self.name)
+        return f"{self.name}_data.json"
+
+    # ----- records -----
+
+    def cached_records(self):
+        """Returns the in-memory JSON records if they still match the files, otherwise None."""
+        if self.records_cache is not None and self.is_fresh("records", [self.data_file, self.log_file]):
+            return self.records_cache
+        self.records_cache = None
+        return None
+
+    def record_list(self):
+        """
+        Returns the cached list of JSON records, parsing the data file and log only if they changed.
+        The list is shared with the cache, so callers must not modify it.
+        """
+        with self.lock, self.reading():
+            records = self.cached_records()
+            if records is None:
+                signatures = [file_signature(path) for path in (self.data_file, self.log_file)]
+                with open(self.data_file, 'r') as f:
+                    records = json.load(f)
+                replay_log(self.name, records)
+                self.records_cache = records
+                self.signatures["records"] = signatures
+            return records
+
+    def load_records(self):
+        """
+        Returns every live record as a new list that the caller may change freely.
+        Deleted slots are left out, so positions in this list are not record indexes.
+        """
+        if self.slot_store is not None:
+            return [record for _, record in self.iter_records()]
+        return [dict(record) for record in self.record_list() if record is not None]
+
+    def slot_records(self):
+        """
+        Returns every slot as a new list, with None for deleted ones, so positions in the
+        list are record indexes.
+        """
+        if self.slot_store is not None:
+            with self.reading():
+                return self.slot_store.read_slots(self.name, self.fields)
+        return [None if record is None else dict(record) for record in self.record_list()]
+
+    def save_records(self, records):
+        """
+        Rewrites the data file with the given records.
+        The full list already contains everything in the log, so the log is cleared afterwards.
+        The indexes are rebuilt first so duplicate primary keys are rejected before writing.
+        """
+        with self.writing():
+            rebuilt_indexes = self.build_indexes(records)
+
+            if self.slot_store is not None:
+                self.slot_store.write_all(self.name, self.fields, records)
+            else:
+                temp_file = f"{self.data_file}.tmp"
+                write_json_file(temp_file, records)
+                self.swap_data_file(temp_file, b"")
+                self.records_cache = [None if record is None else dict(record) for record in records]
+                self.remember("records", [self.data_file, self.log_file])
+
+            for index in rebuilt_indexes:
+                index.save()
+                self.remember_index(index)
+            self.renumber_records([position for position, record in enumerate(records) if record is not None], len(records))
+
+    # ----- write-ahead log -----
+
+    def recover(self):
+        """Repairs the data file and log after a crash; called when the database is opened."""
+        # Leftovers only mean a crash while no other process is in the middle of a write
+        with self.writing():
+            if self.slot_store is not None:
+                self.slot_store.recover(self.name, self.fields)
+            else:
+                wal.recover(self.data_file, self.log_file)
+
+    def log_changes(self, entries):
+        """
+        Appends entries to the write-ahead log and returns the ticket to wait on for durability.
+        The caller holds the lock and updates the cached records itself.
+        """
+        ticket = self.wal.append(entries)
+        if self.records_cache is not None:
+            self.remember("records", [self.data_file, self.log_file])
+        return ticket
+
+    def commit(self, ticket):
+        """Waits until the logged changes are on disk, then checkpoints the log if it has grown large."""
+        self.wal.wait(ticket)
+        self.maybe_checkpoint()
+
+    def swap_data_file(self, temp_file, log_tail):
+        """
+        Replaces the data file with `temp_file` and the log with `log_tail` (the entries not in it).
+        The new log is written as <log>.next before either rename so a crash in between can be
+        recovered; see wal.recover().
+        """
+        next_log = f"{self.log_file}.next"
+        with open(next_log, 'wb') as f:
+            f.write(log_tail)
+            f.flush()
+            os.fsync(f.fileno())
+        self.wal.close()
+        os.replace(temp_file, self.data_file)
+        os.replace(next_log, self.log_file)
+        if not log_tail:
+            os.remove(self.log_file)
+        wal.fsync_directory(self.data_file)
+        self.generation += 1
+
+    def checkpoint(self):
+        """
+        Folds the log into the data file. The records are written out without holding the lock,
+        so writers carry on meanwhile; whatever they log in the meantime is kept as the new log.
+        The new data file is written under a name private to this process and thread and only
+        renamed to <data>.tmp once the swap holds the lock, so two checkpoints cannot collide,
+        not even a background and an explicit one in the same process.
+        """
+        with self.lock, self.reading():
+            if self.storage != "json" or not os.path.exists(self.log_file):
+                return
+            records = list(self.record_list())
+            log_offset = self.wal.size()
+            generation = self.generation
+            files = [file_signature(self.data_file)[2], file_signature(self.log_file)[2]]
+        private_file = f"{self.data_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        write_json_file(private_file, records)
+        with self.writing():
+            current = [file_signature(path) for path in (self.data_file, self.log_file)]
+            if generation != self.generation or None in current or [sig[2] for sig in current] != files:
+                # The data file was rewritten, here or in another process, while this checkpoint was running
+                os.remove(private_file)
+                return
+            with open(self.log_file, 'rb') as f:
+                f.seek(log_offset)
+                log_tail = f.read()
+            temp_file = f"{self.data_file}.tmp"
+            os.replace(private_file, temp_file)
+            self.swap_data_file(temp_file, log_tail)
+            self.remember("records", [self.data_file, self.log_file])
+
+    def maybe_checkpoint(self):
+        """Starts a background checkpoint once the log is bigger than the data file (and than a minimum)."""
+        if self.storage != "json":
+            return
+        log_size = self.wal.size()
+        if log_size < CHECKPOINT_MIN_BYTES or log_size < os.path.getsize(self.data_file):
+            return
+        with self.lock:
+            if self.checkpoint_thread is not None and self.checkpoint_thread.is_alive():
+                return
+            self.checkpoint_thread = threading.Thread(target=self.run_checkpoint, daemon=True)
+            self.checkpoint_thread.start()
+
+    def run_checkpoint(self):
+        try:
+            self.checkpoint()
+        except OSError as e:
+            print(f"Checkpoint of database '{self.name}' failed: {e}")
+
+    def wait_for_checkpoint(self):
+        """Waits for a running background checkpoint to finish."""
+        thread = self.checkpoint_thread
+        if thread is not None:
+            thread.join()
+
+    # ----- record access -----
+
+    def iter_records(self):
+        """
+        Yields (index, record) for every record.
+        JSON data files are streamed rather than loaded whole, unless the records are already
+        cached: the log is read first, and its edits and deletes are applied to the records as
+        they stream past, followed by the records it appends.
+        """
+        if self.slot_store is not None:
+            # Read a chunk of slots at a time, each under the read lock
+            start = 0
+            while True:
+                with self.reading():
+                    end = min(start + SCAN_CHUNK_SLOTS, self.slot_store.record_count(self.name, self.fields))
+                    rows = list(self.slot_store.read_many(self.name, self.fields, range(start, end)))
+                if start >= end:
+                    return
+                yield from rows
+                start = end
+
+        records = self.cached_records()
+        if records is not None:
+            for index, record in enumerate(records):
+                if record is not None:
+                    yield index, dict(record)
+            return
+
+        if not os.path.exists(self.data_file):
+            print(f"Data file for database '{self.name}' not found.")
+            return
+        # Open the data file and read the log together, so a checkpoint cannot swap one without the other
+        with self.lock, self.reading():
+            appended, changes = split_log_entries(iter_log_entries(self.name))
+            f = open(self.data_file, 'r')
+        with f:
+            index = -1
+            for index, record in enumerate(iter_json_elements(f, self.data_file)):
+                record = changes.get(index, record)
+                if record is not None:  # Deleted records are kept as null
+                    yield index, record
+            for index, record in enumerate(appended, index + 1):
+                record = changes.get(index, record)
+                if record is not None:
+                    yield index, record
+
+    def get(self, index):
+        """
+        Returns the record at the given index, or None if there is no such record.
+        Fixed-width and columnar databases read just that one slot through a memory mapping;
+        JSON databases use the cached records or stream the data file only as far as that record.
+        """
+        if self.slot_store is not None:
+            with self.reading():
+                return self.slot_store.read_record(self.name, self.fields, index)
+        if index < 0:
+            return None
+        records = self.cached_records()
+        if records is not None:
+            if index < len(records) and records[index] is not None:
+                return dict(records[index])
+            return None
+        for position, record in self.iter_records():
+            if position == index:
+                return record
+        return None
+
+    def get_many(self, positions):
+        """
+        Yields (index, record) for each of the given record indexes, in the order given.
+        The data file is opened once, so this is the way to fetch the results of an index search.
+        JSON databases whose records are not cached stream the data file once and keep only the
+        records asked for, so fetching a page of a large table does not load the whole table.
+        """
+        if self.slot_store is not None:
+            positions = iter(positions)
+            while True:
+                chunk = list(itertools.islice(positions, SCAN_CHUNK_SLOTS))
+                if not chunk:
+                    return
+                with self.reading():
+                    rows = list(self.slot_store.read_many(self.name, self.fields, chunk))
+                yield from rows
+        records = self.cached_records()
+        if records is None:
+            positions = list(positions)
+            wanted = set(positions)
+            found = {}
+            for position, record in self.iter_records():
+                if position in wanted:
+                    found[position] = record
+                    if len(found) == len(wanted):
+                        break
+            for position in positions:
+                if position in found:
+                    yield position, dict(found[position])
+            return
+        for position in positions:
+            if 0 <= position < len(records) and records[position] is not None:
+                yield position, dict(records[position])
+
+    def add(self, record):
+        """
+        Appends a single record to the write-ahead log (one JSON object per line).
+        Only the new record is written, so inserts no longer re-serialize the whole data file.
+        Fixed-width databases write the record straight into a new slot instead.
+        Returns the new record's ID.
+        Raises ValueError if the record's primary key is missing or already taken.
+        """
+        return self.add_many([record])[0]
+
+    def add_many(self, records):
+        """
+        Stores a batch of records with a single write to the log (or the fixed-width data
+        file), then updates each index once. Deleted slots listed in the free-space map are
+        filled first and only the remaining records are appended, so the file does not keep
+        growing while records are deleted and added. Nothing is written if any record is rejected.
+        Returns the IDs given to the new records, in order.
+        Raises ValueError if a primary key is missing, already taken or repeated in the batch.
+        """
+        records = list(records)
+        if not records:
+            return []
+        ticket = None
+        with self.writing():
+            open_indexes = self.load_indexes()
+            for index in open_indexes:
+                index.check_many(records)
+
+            id_map = self.record_ids()
+            free_map = self.free_space()
+            # A slot that still has a record ID holds a live record, whatever the free-space map says
+            holes = free_map.take(len(records), lambda position: id_map.id_at(position) is None)
+            self.remember_index(free_map)
+            filled, appended = records[:len(holes)], records[len(holes):]
+
+            if self.slot_store is not None:
+                if holes:
+                    self.slot_store.write_records(self.name, self.fields, zip(holes, filled))
+                first = self.slot_store.append_records(self.name, self.fields, appended) if appended else None
+            else:
+                # The appended records land after every slot there is now, live or deleted
+                first = id_map.slots
+                cached = self.cached_records()
+                entries = [{"op": "set", "index": position, "record": record} for position, record in zip(holes, filled)]
+                entries += [{"op": "add", "record": record} for record in appended]
+                ticket = self.log_changes(entries)
+                if cached is not None:
+                    for position, record in zip(holes, filled):
+                        cached[position] = dict(record)
+                    cached.extend(dict(record) for record in appended)
+
+            rows = list(zip(holes, filled)) + list(enumerate(appended, first if first is not None else 0))
+            for index in open_indexes:
+                if len(rows) == 1:
+                    index.add(rows[0][1], rows[0][0])
+                else:
+                    index.add_many(rows)
+                self.remember_index(index)
+            if len(rows) == 1:
+                record_ids = [id_map.assign(rows[0][0])]
+            else:
+                record_ids = id_map.assign_many([position for position, _ in rows])
+            self.remember_index(id_map)
+        if ticket is not None:
+            self.commit(ticket)
+        return record_ids
+
+    def update(self, index, record):
+        """
+        Replaces the record at the given index. Fixed-width databases rewrite just that one slot;
+        JSON databases log the new version instead of rewriting the data file. The old record is
+        never read: the record ID map tells whether there is one and the indexes know its values.
+        Raises ValueError if the new primary key is missing or belongs to another record,
+        and IndexError if there is no record at that index.
+        """
+        ticket = None
+        with self.writing():
+            open_indexes = self.load_indexes()
+            for open_index in open_indexes:
+                open_index.check(record, index)
+            if not self.holds_record(index):
+                raise IndexError(f"Record index {index} is out of range.")
+            if self.slot_store is not None:
+                self.slot_store.write_record(self.name, self.fields, index, record)
+            else:
+                cached = self.cached_records()
+                ticket = self.log_changes([{"op": "set", "index": index, "record": record}])
+                if cached is not None:
+                    cached[index] = dict(record)
+            for open_index in open_indexes:
+                open_index.replace(record, index)
+                self.remember_index(open_index)
+        if ticket is not None:
+            self.commit(ticket)
+
+    def remove(self, index):
+        """
+        Deletes the record at the given index by leaving a tombstone in its slot: fixed-width
+        databases flip the slot's status byte and JSON databases log the delete (the slot
+        becomes null). Nothing else is rewritten and no other record changes index. The slot
+        goes into the free-space map for the next insert to reuse, and vacuum() gives the space
+        back for good; it also runs in the background once enough slots are dead. As with
+        update(), the record itself is not read.
+        Raises IndexError if there is no record at that index.
+        """
+        ticket = None
+        with self.writing():
+            if not self.holds_record(index):
+                raise IndexError(f"Record index {index} is out of range.")
+            open_indexes = self.load_indexes()
+            if self.slot_store is not None:
+                self.slot_store.delete_record(self.name, self.fields, index)
+            else:
+                cached = self.cached_records()
+                ticket = self.log_changes([{"op": "del", "index": index}])
+                if cached is not None:
+                    cached[index] = None
+            for open_index in open_indexes:
+                open_index.remove(index)
+                self.remember_index(open_index)
+            # Only list the slot as free once the delete itself has been written
+            free_map = self.free_space()
+            free_map.release(index)
+            self.remember_index(free_map)
+            id_map = self.record_ids()
+            id_map.release(index)
+            self.remember_index(id_map)
+        if ticket is not None:
+            self.commit(ticket)
+        self.maybe_vacuum()
+
+    # ----- stable record IDs -----
+
+    def record_ids(self):
+        """
+        Returns the record ID map. If its files are missing it is rebuilt from the data, giving
+        each record the ID of its slot number plus one.
+        """
+        id_map = self.cached_index(("ids",), None, indexes.record_id_paths(self.name))
+        if id_map is None:
+            with self.reading():
+                id_map = indexes.RecordIdMap.load(self.name)
+            if id_map is None:
+                with self.writing():
+                    positions = [position for position, _ in self.iter_records()]
+                    id_map = self.rebuild_index(indexes.RecordIdMap.build(self.name, positions, self.stored_slot_count()))
+            self.remember_index(id_map)
+        return id_map
+
+    def renumber_records(self, live_positions, slots):
+        """
+        Brings the record ID map up to date after the data was rewritten as `slots` slots with
+        records in `live_positions`. If those are the slots the map already knows, the records are
+        taken to be the same ones and keep their IDs; otherwise every record gets a new ID.
+        """
+        id_map = self.record_ids()
+        if sorted(id_map.ids) != live_positions:
+            id_map = indexes.RecordIdMap.build(self.name, [], slots, id_map.next_id)
+            for position in live_positions:
+                id_map.claim(position)
+        id_map.slots = slots
+        self.rebuild_index(id_map)
+
+    def holds_record(self, index):
+        """Returns True if there is a live record at the given index, going by the record ID map."""
+        return self.record_ids().id_at(index) is not None
+
+    def record_id(self, index):
+        """Returns the ID of the record at the given index, or None if there is no record there."""
+        with self.lock:
+            return self.record_ids().id_at(index)
+
+    def locate(self, record_id):
+        """Returns the index of the record with the given ID. Raises IndexError if there is none."""
+        index = self.record_ids().location(record_id)
+        if index is None:
+            raise IndexError(f"Record ID {record_id} does not exist.")
+        return index
+
+    def get_by_id(self, record_id):
+        """Returns the record with the given ID, or None if there is no such record."""
+        with self.lock:
+            index = self.record_ids().location(record_id)
+            return None if index is None else self.get(index)
+
+    def update_by_id(self, record_id, record):
+        """
+        Replaces the record with the given ID; it keeps its ID.
+        Raises IndexError if there is no such record, and ValueError as update() does.
+        """
+        with self.writing():
+            self.update(self.locate(record_id), record)
+
+    def remove_by_id(self, record_id):
+        """Deletes the record with the given ID. Raises IndexError if there is no such record."""
+        with self.writing():
+            self.remove(self.locate(record_id))
+
+    # ----- deleted slots and vacuum -----
+
+    def deleted_slots(self):
+        """Returns the positions of the deleted slots, read from the data itself."""
+        if self.slot_store is not None:
+            with self.reading():
+                return self.slot_store.deleted_slots(self.name, self.fields)
+        return [position for position, record in enumerate(self.record_list()) if record is None]
+
+    def free_space(self):
+        """Returns the free-space map, rebuilding it from the data if its files are missing."""
+        free_map = self.cached_index(("free",), None, indexes.free_space_paths(self.name))
+        if free_map is None:
+            with self.reading():
+                free_map = indexes.FreeSpaceMap.load(self.name)
+            if free_map is None:
+                with self.writing():
+                    free_map = self.rebuild_index(indexes.FreeSpaceMap.build(self.name, self.deleted_slots()))
+            self.remember_index(free_map)
+        return free_map
+
+    def dead_count(self):
+        """Returns the number of deleted slots waiting to be reused or vacuumed."""
+        with self.lock:
+            return self.free_space().size()
+
+    def vacuum(self):
+        """
+        Rewrites the live records into a fresh data file, swaps it in atomically and rebuilds the
+        indexes, dropping every deleted slot. Later records move up, so record indexes change,
+        but every record keeps its ID. Returns a report with the deleted slots removed, the file
+        sizes before and after, the bytes reclaimed and the seconds taken.
+        """
+        start = time.perf_counter()
+        with self.writing():
+            bytes_before = self.storage_size()
+            removed = self.dead_count()
+            deleted = set(self.deleted_slots())
+            live_positions = [position for position in range(self.stored_slot_count()) if position not in deleted]
+            id_map = self.record_ids()
+            if self.slot_store is not None:
+                # Stream the live slots out of the old file into the new one
+                live = (record for _, record in self.slot_store.iter_records(self.name, self.fields))
+                self.slot_store.write_all(self.name, self.fields, live)
+            else:
+                live = [record for record in self.record_list() if record is not None]
+                temp_file = f"{self.data_file}.tmp"
+                write_json_file(temp_file, live)
+                self.swap_data_file(temp_file, b"")
+                self.records_cache = live
+                self.remember("records", [self.data_file, self.log_file])
+            self.rebuild_indexes()
+            id_map.remap(live_positions)
+            self.remember_index(id_map)
+            bytes_after = self.storage_size()
+        self.last_vacuum = {
+            "removed": removed,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_reclaimed": bytes_before - bytes_after,
+            "seconds": time.perf_counter() - start,
+        }
+        refresh_catalog_entry(self.name)
+        return self.last_vacuum
+
+    def storage_size(self):
+        """Bytes used by the data file and its log."""
+        if self.slot_store is not None:
+            return self.slot_store.storage_size(self.name)
+        return sum(os.path.getsize(path) for path in (self.data_file, self.log_file) if os.path.exists(path))
+
+    def maybe_vacuum(self):
+        """Starts a background vacuum once the share of deleted slots reaches the `vacuum_ratio` option."""
+        ratio = self.options["vacuum_ratio"]
+        if ratio is None:
+            return
+        dead = self.dead_count()
+        if dead < VACUUM_MIN_DEAD_ROWS or dead < ratio * self.slot_count():
+            return
+        with self.lock:
+            if self.vacuum_thread is not None and self.vacuum_thread.is_alive():
+                return
+            self.vacuum_thread = threading.Thread(target=self.run_vacuum, daemon=True)
+            self.vacuum_thread.start()
+
+    def run_vacuum(self):
+        try:
+            self.vacuum()
+        except OSError as e:
+            print(f"Vacuum of database '{self.name}' failed: {e}")
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Collects several changes and stores them together when the block ends:
+
+            with db.batch() as batch:
+                batch.add(record)
+                batch.update(3, record)
+                batch.remove(7)
+
+        Each change is checked against the schema as it is made. On leaving the block the whole
+        batch is written at once (a single log entry for JSON databases, one atomic rewrite for
+        fixed-width ones), so either every change is stored or none is. If the block raises, or
+        the batch breaks the primary key, nothing is written. Other writers wait until the batch
+        is done; use the batch's own methods inside the block, not the database's.
+        """
+        ticket = None
+        with self.writing():
+            batch = Batch(self)
+            yield batch
+            ticket = self.apply_batch(batch)
+        if ticket is not None:
+            self.commit(ticket)
+
+    def apply_batch(self, batch):
+        """Stores the changes collected by a batch. Returns the log ticket to wait on, if any."""
+        if not batch.entries:
+            return None
+        # Building the indexes first also rejects duplicate primary keys before anything is written
+        rebuilt_indexes = self.build_indexes(batch.records)
+        ticket = None
+        if self.slot_store is not None:
+            self.slot_store.write_all(self.name, self.fields, batch.records)
+        else:
+            # One log line holds the whole batch, so a crash cannot leave half of it applied
+            self.records_cache = batch.records
+            ticket = self.log_changes([{"op": "batch", "entries": batch.entries}])
+        for index in rebuilt_indexes:
+            index.save()
+            self.remember_index(index)
+        batch.ids.save()
+        self.remember_index(batch.ids)
+        return ticket
+
+    def slot_count(self):
+        """
+        Number of record slots, including deleted ones. For JSON databases this comes from the
+        record ID map, which keeps count, so the data file is not read.
+        """
+        if self.slot_store is not None:
+            return self.stored_slot_count()
+        return self.record_ids().slots
+
+    def stored_slot_count(self):
+        """Number of record slots, including deleted ones, counted in the data itself."""
+        if self.slot_store is not None:
+            with self.reading():
+                return self.slot_store.record_count(self.name, self.fields)
+        return len(self.record_list())
+
+    # ----- indexes -----
+
+    def remember_index(self, index):
+        """Marks a loaded index (or the free-space or ID map) as matching its files after it has written them itself."""
+        if isinstance(index, indexes.FreeSpaceMap):
+            key = ("free",)
+        elif isinstance(index, indexes.RecordIdMap):
+            key = ("ids",)
+        elif isinstance(index, indexes.SortedIndex):
+            key = ("sorted", index.field)
+        else:
+            key = ("pk",)
+        self.index_cache[key] = index
+        self.remember(key, index.paths())
+
+    def cached_index(self, key, field, paths):
+        """Returns the loaded index under `key` if it is on `field` and its files are unchanged."""
+        index = self.index_cache.get(key)
+        if index is not None and index.field == field and self.is_fresh(key, paths):
+            return index
+        return None
+
+    def key_index(self):
+        """Returns the primary-key index, or None if the database has no primary key."""
+        primary_key = self.options["primary_key"]
+        if primary_key is None:
+            return None
+        key_index = self.cached_index(("pk",), primary_key, indexes.key_index_paths(self.name))
+        if key_index is None:
+            with self.reading():
+                key_index = indexes.KeyIndex.load(self.name, primary_key)
+            if key_index is None:
+                # The index files went missing; rebuild them from the records
+                with self.writing():
+                    key_index = self.rebuild_index(indexes.KeyIndex.build(self.name, primary_key, self.iter_records()))
+            self.remember_index(key_index)
+        return key_index
+
+    def sorted_index(self, field):
+        """Returns the sorted index on `field`, or None if that field is not indexed."""
+        if field not in self.options["indexes"]:
+            return None
+        sorted_index = self.cached_index(("sorted", field), field, indexes.sorted_index_paths(self.name, field))
+        if sorted_index is None:
+            with self.reading():
+                sorted_index = indexes.SortedIndex.load(self.name, field)
+            if sorted_index is None:
+                with self.writing():
+                    sorted_index = self.rebuild_index(indexes.SortedIndex.build(self.name, field, self.iter_records()))
+            self.remember_index(sorted_index)
+        return sorted_index
+
+    def load_indexes(self):
+        """Returns every index maintained for the database, primary-key index first."""
+        open_indexes = []
+        key_index = self.key_index()
+        if key_index is not None:
+            open_indexes.append(key_index)
+        for field in self.options["indexes"]:
+            open_indexes.append(self.sorted_index(field))
+        return open_indexes
+
+    def build_indexes(self, records):
+        """
+        Builds fresh copies of every index, and of the free-space map, over a full list of
+        records without saving them. Raises ValueError if the records break the primary key.
+        """
+        options = self.options
+        # Deleted fixed-width slots appear as None and are left out
+        rows = [(position, record) for position, record in enumerate(records) if record is not None]
+        built = []
+        if options["primary_key"] is not None:
+            built.append(indexes.KeyIndex.build(self.name, options["primary_key"], rows))
+        for field in options["indexes"]:
+            built.append(indexes.SortedIndex.build(self.name, field, rows))
+        built.append(indexes.FreeSpaceMap.build(self.name, [position for position, record in enumerate(records) if record is None]))
+        return built
+
+    def rebuild_indexes(self):
+        """Rebuilds and saves every index, and the free-space map, from the stored records."""
+        self.rebuild_index(indexes.FreeSpaceMap.build(self.name, self.deleted_slots()))
+        options = self.options
+        if options["primary_key"] is not None:
+            self.rebuild_index(indexes.KeyIndex.build(self.name, options["primary_key"], self.iter_records()))
+        for field in options["indexes"]:
+            self.rebuild_index(indexes.SortedIndex.build(self.name, field, self.iter_records()))
+
+    def rebuild_index(self, index):
+        """Saves a freshly built index and keeps it as the loaded one."""
+        index.save()
+        self.remember_index(index)
+        return index
+
+class Batch:
+    """
+    Changes collected by Database.batch(). They are applied to a private copy of the records,
+    so reads through the batch see them, and stored only when the batch block ends.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.fields = db.fields
+        self.records = db.slot_records()
+        self.entries = []  # The changes, as write-ahead log entries
+        self.ids = db.record_ids().copy()  # Record IDs as the batch sees them, saved with the batch
+        # Deleted slots, as a heap, so adds fill them lowest first like Database.add_many()
+        self.free = [position for position, record in enumerate(self.records) if record is None]
+
+    def check_index(self, index):
+        if not 0 <= index < len(self.records) or self.records[index] is None:
+            raise IndexError(f"Record index {index} is out of range.")
+
+    def get(self, index):
+        """Returns the record at the given index as the batch sees it, or None."""
+        if 0 <= index < len(self.records) and self.records[index] is not None:
+            return dict(self.records[index])
+        return None
+
+    def add(self, record):
+        """
+        Adds a record, reusing a deleted slot if there is one, and returns its index.
+        Raises ValueError if it does not fit the schema.
+        """
+        record = validate_record(record, self.fields)
+        if self.free:
+            index = heapq.heappop(self.free)
+            self.records[index] = record
+            self.entries.append({"op": "set", "index": index, "record": record})
+        else:
+            index = len(self.records)
+            self.records.append(record)
+            self.entries.append({"op": "add", "record": record})
+        self.ids.claim(index)
+        return index
+
+    def update(self, index, record):
+        """Replaces the record at the given index. Raises ValueError if it does not fit the schema."""
+        self.check_index(index)
+        record = validate_record(record, self.fields)
+        self.records[index] = record
+        self.entries.append({"op": "set", "index": index, "record": record})
+
+    def remove(self, index):
+        """Deletes the record at the given index, leaving a tombstone as Database.remove() does."""
+        self.check_index(index)
+        self.records[index] = None
+        self.entries.append({"op": "del", "index": index})
+        heapq.heappush(self.free, index)
+        self.ids.discard(index)
+
+    def record_id(self, index):
+        """Returns the ID of the record at the given index as the batch sees it, or None."""
+        return self.ids.id_at(index)
+
+    def locate(self, record_id):
+        """Returns the index of the record with the given ID. Raises IndexError if there is none."""
+        index = self.ids.location(record_id)
+        if index is None:
+            raise IndexError(f"Record ID {record_id} does not exist.")
+        return index
+
+_open_databases = {}  # Database handles shared by everything running in this process
+
+def open_database(db_name):
+    """
+    Returns the shared handle for the specified database, creating it on first use.
+    The CLI, the Tk front ends and the module-level functions below all go through it.
+    """
+    db = _open_databases.get(db_name)
+    if db is None:
+        db = _open_databases[db_name] = Database(db_name)
+        db.recover()
+    return db
+
+def close_database(db_name):
+    """Forgets the cached handle for the specified database, after any running checkpoint has finished."""
+    db = _open_databases.pop(db_name, None)
+    if db is not None:
+        for thread in (db.vacuum_thread, db.checkpoint_thread):
+            if thread is not None:
+                thread.join()
+        db.wal.close()
+        db.file_lock.close()
+
+def validate_record(record, fields):
+    """
+    Returns a copy of `record` holding exactly the schema's fields as text.
+    Raises ValueError if it has an unknown field or a value longer than the field allows.
+    """
+    for field in record:
+        if field not in fields:
+            raise ValueError(f"Unknown field '{field}'.")
+    checked = {}
+    for field, max_length in fields.items():
+        value = record.get(field)
+        value = "" if value is None else str(value)
+        if len(value) > max_length:
+            raise ValueError(f"Value for '{field}' exceeds maximum length of {max_length}.")
+        checked[field] = value
+    return checked
+
+def remove_data_file(path):
+    """Removes a data file, or the directory of a columnar or compressed database."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+def write_json_file(path, records):
+    """Writes the records to `path` as a JSON array and syncs the file to disk."""
+    with open(path, 'w') as f:
+        json.dump(records, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
 
 def delete_database(db_name):
     """
     Deletes the specified database by removing its associated files.
     """
-    data_file = f"{db_name}_data.json"
+    data_file = data_file_path(db_name)
     system_file = f"{db_name}_system.json"
+    log_file = f"{db_name}_data.log"
+
+    # Remove the append-only log and the indexes quietly; they are optional
+    close_database(db_name)
+    for path in (log_file, f"{log_file}.next", f"{data_file}.tmp"):
+        if os.path.exists(path):
+            os.remove(path)
+    indexes.delete_key_index(db_name)
+    indexes.delete_free_space_map(db_name)
+    indexes.delete_record_id_map(db_name)
+    for field in load_system_options(db_name)["indexes"]:
+        indexes.delete_sorted_index(db_name, field)
 
     # Remove the data file if it exists
     if os.path.exists(data_file):
-        os.remove(data_file)
+        remove_data_file(data_file)
         print(f"Deleted data file: {data_file}")
     else:
         print(f"Data file '{data_file}' not found.")
@@ -22,55 +1019,485 @@ def delete_database(db_name):
     else:
         print(f"System file '{system_file}' not found.")
 
+    close_database(db_name)
+    locking.remove_lock_file(db_name)
+    catalog.remove_entry(db_name)
     print(f"Database '{db_name}' has been deleted successfully.")
 
-def create_database_files(db_name, fields):
+def create_database_files(db_name, fields, storage="json", primary_key=None):
     """
     Creates the necessary files for a new database, including data and system files.
+    `storage` selects the data file format: "json" (the default), "fixed" width binary,
+    "columnar" (one file per field) or "compressed" (compressed blocks of records).
+    `primary_key` optionally names a field whose values must be unique and can be looked up directly.
     """
-    data_file = f"{db_name}_data.json"
+    if storage not in STORAGE_FORMATS:
+        print(f"Unknown storage format '{storage}'.")
+        return False
+    if primary_key is not None and primary_key not in fields:
+        print(f"Primary key '{primary_key}' is not one of the fields.")
+        return False
+
     system_file = f"{db_name}_system.json"
+    close_database(db_name)
 
     # Create the data file and system file
     try:
+        system = dict(fields)
+        options = {}
+        if storage != "json":
+            options["storage"] = storage
+        if primary_key is not None:
+            options["primary_key"] = primary_key
+        if options:
+            system[SYSTEM_OPTIONS_KEY] = options
         with open(system_file, 'w') as f:
-            json.dump(fields, f, indent=4)  # Save the fields (metadata)
-        with open(data_file, 'w') as f:
-            json.dump([], f, indent=4)  # Initialize with an empty list of records
+            json.dump(system, f, indent=4)  # Save the fields (metadata)
+        if storage in SLOT_STORAGES:
+            SLOT_STORAGES[storage].write_all(db_name, fields, [])  # No slots yet
+        else:
+            with open(f"{db_name}_data.json", 'w') as f:
+                json.dump([], f, indent=4)  # Initialize with an empty list of records
+        # Drop any log left behind by an older database with the same name
+        log_file = f"{db_name}_data.log"
+        if os.path.exists(log_file):
+            os.remove(log_file)
+        indexes.delete_key_index(db_name)
+        indexes.FreeSpaceMap(db_name).save()
+        indexes.RecordIdMap(db_name).save()
+        if primary_key is not None:
+            indexes.KeyIndex(db_name, primary_key).save()
+        refresh_catalog_entry(db_name)
         return True  # Indicate success
     except Exception as e:
         print(f"Error creating database files: {e}")
         return False  # Indicate failure
 
 def load_system_file(db_name):
-    """Loads the system file for the specified database."""
-    system_file = f"{db_name}_system.json"
-    if not os.path.exists(system_file):
+    """Loads the system file for the specified database and returns its fields."""
+    fields = open_database(db_name).fields
+    if fields is None:
         print(f"System file for database '{db_name}' not found.")
-        return None
-    with open(system_file, 'r') as f:
-        return json.load(f)
+    return fields
+
+def load_system_options(db_name):
+    """Loads the storage options kept in the system file. Plain schemas use the JSON defaults."""
+    return open_database(db_name).options
+
+def save_system_options(db_name, options):
+    """Stores the given storage options in the system file, keeping the fields untouched."""
+    open_database(db_name).save_options(options)
+
+def get_storage(db_name):
+    """Returns the storage format of the specified database."""
+    return open_database(db_name).storage
+
+def data_file_path(db_name):
+    """Returns the path of the data file for the specified database, based on its storage format."""
+    return open_database(db_name).data_file
 
 def load_data_file(db_name):
-    """Loads the data file for the specified database."""
-    data_file = f"{db_name}_data.json"
-    if not os.path.exists(data_file):
+    """
+    Loads the data file for the specified database and replays any records
+    appended to its log since the data file was last written.
+    """
+    db = open_database(db_name)
+    if not os.path.exists(db.data_file):
         print(f"Data file for database '{db_name}' not found.")
         return None
-    with open(data_file, 'r') as f:
-        return json.load(f)
+    return db.load_records()
 
 def save_data_file(db_name, records):
     """Saves the records to the data file for the specified database."""
-    data_file = f"{db_name}_data.json"
-    with open(data_file, 'w') as f:
-        json.dump(records, f, indent=4)
+    open_database(db_name).save_records(records)
+
+def append_record(db_name, record):
+    """
+    Appends a single record to the specified database without rewriting its data file.
+    Raises ValueError if the record's primary key is missing or already taken.
+    """
+    open_database(db_name).add(record)
+
+def append_records(db_name, records):
+    """
+    Appends a batch of records to the specified database with a single write.
+    Raises ValueError, and writes nothing, if any primary key is missing or already taken.
+    """
+    open_database(db_name).add_many(records)
+
+def iter_log_entries(db_name):
+    """Yields the entries of the append-only log in the order they were written."""
+    log_file = f"{db_name}_data.log"
+    if not os.path.exists(log_file):
+        return
+    with open(log_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted append; everything before it is intact
+                print(f"Ignoring incomplete log entry in '{log_file}'.")
+                break
+            yield entry
+
+def apply_log_entry(records, entry):
+    """Applies one log entry (an add, edit or delete) to a list of records."""
+    op = entry.get("op")
+    if op == "add":
+        records.append(entry["record"])
+    elif op == "set":
+        records[entry["index"]] = entry["record"]
+    elif op == "del":
+        records[entry["index"]] = None  # Tombstone; the slot keeps its place until a vacuum
+    elif op == "batch":
+        for batch_entry in entry["entries"]:
+            apply_log_entry(records, batch_entry)
+
+def split_log_entries(entries):
+    """
+    Sorts log entries into the records they append, in order, and the latest change to each
+    record index ({index: record}, None for a delete), so the log can be applied to records
+    streamed from the data file. An edit of an appended record always follows its append.
+    """
+    appended = []
+    changes = {}
+    for entry in entries:
+        op = entry.get("op")
+        if op == "add":
+            appended.append(entry["record"])
+        elif op == "set":
+            changes[entry["index"]] = entry["record"]
+        elif op == "del":
+            changes[entry["index"]] = None
+        elif op == "batch":
+            batch_appended, batch_changes = split_log_entries(entry["entries"])
+            appended.extend(batch_appended)
+            changes.update(batch_changes)
+    return appended, changes
+
+def replay_log(db_name, records):
+    """Applies the entries of the append-only log, in order, to the records loaded from the data file."""
+    for entry in iter_log_entries(db_name):
+        apply_log_entry(records, entry)
+    return records
+
+def iter_json_array(path):
+    """
+    Yields the elements of a JSON array file one at a time.
+    The file is read in chunks and each element is decoded as soon as it is complete, so memory
+    use stays at about one chunk plus one record however large the file is.
+    """
+    with open(path, 'r') as f:
+        yield from iter_json_elements(f, path)
+
+def iter_json_elements(f, path):
+    """Yields the elements of the JSON array in the open file `f`; `path` is only used in error messages."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        # Drop what has been consumed and read the next chunk; returns False at end of file
+        nonlocal buffer, pos, eof
+        chunk = f.read(READ_CHUNK_SIZE)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+        return bool(chunk)
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError(f"'{path}' does not contain a JSON array.")
+    pos += 1
+
+    expect_comma = False
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError(f"'{path}' ends before its JSON array is closed.")
+        if buffer[pos] == "]":
+            return
+        if expect_comma:
+            if buffer[pos] != ",":
+                raise ValueError(f"Expected ',' in '{path}'.")
+            pos += 1
+            skip_whitespace()
+
+        # Decode the next element, reading more of the file until it is complete
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise
+                continue
+            if end == len(buffer) and not eof and fill():
+                continue  # A bare number may continue into the next chunk
+            break
+        pos = end
+        expect_comma = True
+        yield element
+
+def checkpoint_log(db_name):
+    """Folds the append-only log into the data file so the next load has nothing to replay."""
+    db = open_database(db_name)
+    if not os.path.exists(db.data_file):
+        print(f"Data file for database '{db_name}' not found.")
+        return False
+    db.checkpoint()
+    return True
+
+def iter_records(db_name):
+    """Yields (index, record) for every record in the specified database."""
+    return open_database(db_name).iter_records()
+
+def get_record(db_name, index):
+    """Returns the record at the given index, or None if there is no such record."""
+    return open_database(db_name).get(index)
+
+def update_record(db_name, index, record):
+    """
+    Replaces the record at the given index.
+    Raises ValueError if the new primary key is missing or belongs to another record.
+    """
+    open_database(db_name).update(index, record)
+
+def remove_record(db_name, index):
+    """
+    Deletes the record at the given index, leaving a tombstone so no other record changes index.
+    """
+    open_database(db_name).remove(index)
+
+def get_record_by_id(db_name, record_id):
+    """Returns the record with the given ID, or None if there is no such record."""
+    return open_database(db_name).get_by_id(record_id)
+
+def update_record_by_id(db_name, record_id, record):
+    """
+    Replaces the record with the given ID.
+    Raises IndexError if there is no such record, and ValueError if the new primary key is
+    missing or belongs to another record.
+    """
+    open_database(db_name).update_by_id(record_id, record)
+
+def remove_record_by_id(db_name, record_id):
+    """Deletes the record with the given ID. Raises IndexError if there is no such record."""
+    open_database(db_name).remove_by_id(record_id)
+
+def record_id_map(db_name):
+    """Returns the map between record IDs and record indexes of the specified database."""
+    return open_database(db_name).record_ids()
+
+def vacuum_database(db_name):
+    """
+    Drops the deleted slots of the specified database by rewriting its live records into a
+    fresh data file. Record indexes after a deleted slot move up; record IDs stay the same.
+    Returns the vacuum report.
+    """
+    return open_database(db_name).vacuum()
+
+def load_key_index(db_name):
+    """Loads the primary-key index of the specified database, or returns None if it has no primary key."""
+    return open_database(db_name).key_index()
+
+def load_sorted_index(db_name, field):
+    """Loads the sorted index on `field`, or returns None if that field is not indexed."""
+    return open_database(db_name).sorted_index(field)
+
+def load_indexes(db_name):
+    """Loads every index maintained for the specified database, primary-key index first."""
+    return open_database(db_name).load_indexes()
+
+def set_primary_key(db_name, field):
+    """
+    Declares `field` as the primary key of an existing database and builds its index.
+    Passing None removes the primary key. Returns False if the existing records do not allow it.
+    """
+    db = open_database(db_name)
+    if field is not None and field not in db.fields:
+        print(f"Field '{field}' does not exist in database '{db_name}'.")
+        return False
+
+    try:
+        key_index = None
+        if field is not None:
+            key_index = indexes.KeyIndex.build(db_name, field, db.iter_records())
+    except ValueError as e:
+        print(f"Cannot use '{field}' as the primary key: {e}")
+        return False
+
+    options = db.options
+    options["primary_key"] = field
+    db.save_options(options)
+    if key_index is None:
+        indexes.delete_key_index(db_name)
+    else:
+        db.rebuild_index(key_index)
+    return True
+
+def find_record(db_name, key):
+    """
+    Looks up a record by its primary-key value through the hash index.
+    Returns (index, record), or (None, None) if no record has that key.
+    """
+    db = open_database(db_name)
+    key_index = db.key_index()
+    if key_index is None:
+        print(f"Database '{db_name}' has no primary key.")
+        return None, None
+    index = key_index.lookup(key)
+    if index is None:
+        return None, None
+    return index, db.get(index)
+
+def create_index(db_name, field):
+    """
+    Creates a persisted sorted index on `field` for range, prefix and ordered queries.
+    Numbers are ordered by value and come before text values.
+    """
+    db = open_database(db_name)
+    if field not in db.fields:
+        print(f"Field '{field}' does not exist in database '{db_name}'.")
+        return False
+    with db.writing():
+        options = db.options
+        if field not in options["indexes"]:
+            options["indexes"].append(field)
+            db.save_options(options)
+        indexes.delete_sorted_index(db_name, field)
+        db.rebuild_index(indexes.SortedIndex.build(db_name, field, db.iter_records()))
+    return True
+
+def drop_index(db_name, field):
+    """Removes the sorted index on `field`."""
+    db = open_database(db_name)
+    with db.writing():
+        options = db.options
+        if field not in options["indexes"]:
+            print(f"Field '{field}' is not indexed.")
+            return False
+        options["indexes"].remove(field)
+        db.save_options(options)
+        indexes.delete_sorted_index(db_name, field)
+    return True
+
+def get_records(db_name, positions):
+    """Yields (index, record) for each of the given record indexes, in the order given."""
+    return open_database(db_name).get_many(positions)
+
+def range_query(db_name, field, low=None, high=None, prefix=None, reverse=False):
+    """
+    Yields (index, record) pairs from the sorted index on `field` without scanning the table:
+    values between `low` and `high` (inclusive, either may be None), or starting with `prefix`.
+    With no bounds, every record is returned in field order.
+    """
+    sorted_index = load_sorted_index(db_name, field)
+    if sorted_index is None:
+        print(f"Field '{field}' is not indexed.")
+        return
+    if prefix is not None:
+        positions = sorted_index.startswith(prefix)
+    elif low is None and high is None:
+        positions = sorted_index.ordered(reverse)
+    else:
+        positions = sorted_index.between(low, high)
+    yield from get_records(db_name, positions)
+
+def convert_database(db_name, storage, codec=None):
+    """
+    Rewrites an existing database in another storage format.
+    `codec` picks the compression ("zlib" or "lzma") when converting to compressed storage.
+    """
+    if storage not in STORAGE_FORMATS:
+        print(f"Unknown storage format '{storage}'.")
+        return False
+    if codec is not None and codec not in compressed_storage.CODECS:
+        print(f"Unknown compression codec '{codec}'.")
+        return False
+    db = open_database(db_name)
+    with db.writing():
+        if db.fields is None or not os.path.exists(db.data_file):
+            print(f"Database '{db_name}' could not be loaded.")
+            return False
+        # Deleted slots are carried over, so every record keeps its index and its ID
+        records = db.slot_records()
+        old_data_file = db.data_file
+
+        options = db.options
+        options["storage"] = storage
+        db.save_options(options)
+        if storage == "compressed" and codec is not None:
+            compressed_storage.write_all(db_name, db.fields, [], codec)  # Later rewrites keep the codec
+        db.save_records(records)
+
+        if old_data_file != db.data_file:
+            remove_data_file(old_data_file)
+        # The log has been folded into the new data file
+        log_file = f"{db_name}_data.log"
+        if os.path.exists(log_file):
+            os.remove(log_file)
+    refresh_catalog_entry(db_name)
+    return True
+
+def catalog_entry(db_name):
+    """Describes the specified database for the catalog."""
+    db = open_database(db_name)
+    paths = {"system": db.system_file, "data": db.data_file}
+    if db.storage == "json":
+        paths["log"] = db.log_file
+    with db.lock:
+        record_count = db.slot_count() - db.dead_count()
+        size = db.storage_size()
+    return catalog.make_entry(db.fields, db.storage, paths, record_count, size)
+
+def refresh_catalog_entry(db_name):
+    """
+    Stores the current schema, record count and size of the specified database in the catalog.
+    If there is no catalog yet, it is built from the files instead, so no database is left out.
+    """
+    if catalog.load_catalog() is None:
+        rebuild_catalog()
+        return
+    catalog.update_entry(db_name, catalog_entry(db_name))
+
+def rebuild_catalog():
+    """
+    Rebuilds the catalog by scanning the working directory for system files, for when the
+    catalog is missing or no longer matches the files. Returns the new catalog.
+    """
+    entries = {}
+    for file in os.listdir():
+        if not file.endswith("_system.json"):
+            continue
+        db_name = file[:-len("_system.json")]
+        if database_exists(db_name):
+            entries[db_name] = catalog_entry(db_name)
+    catalog.save_catalog(entries)
+    return entries
+
+def list_databases():
+    """Returns the catalog ({name: entry}) of every database, building it on first use."""
+    entries = catalog.load_catalog()
+    if entries is None:
+        entries = rebuild_catalog()
+    return entries
 
 def database_exists(db_name):
     """Checks if the database files for the specified database exist."""
     system_file = f"{db_name}_system.json"
-    data_file = f"{db_name}_data.json"
-    return os.path.exists(system_file) and os.path.exists(data_file)
+    return os.path.exists(system_file) and os.path.exists(data_file_path(db_name))
 
 def load_database_files(db_name):
     """Loads both the system and data files for the specified database."""
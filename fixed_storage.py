@@ -0,0 +1,213 @@
+import mmap
+import os
+import struct
+
+# Fixed-width binary storage.
+# Every record occupies one slot whose size is derived from the schema's maximum lengths,
+# so record N lives at byte offset N * slot_size and can be read or rewritten on its own.
+# Each slot starts with a status byte followed by one null-padded UTF-8 column per field.
+
+BYTES_PER_CHAR = 4  # Worst-case UTF-8 width, so any value within max_length always fits
+SLOT_LIVE = 1
+SLOT_DELETED = 0
+
+def data_file_path(db_name):
+    """Returns the path of the binary data file for the specified database."""
+    return f"{db_name}_data.bin"
+
+def record_struct(fields):
+    """Builds the struct describing one slot: a status byte followed by one column per field."""
+    return struct.Struct("<B" + "".join(f"{max_length * BYTES_PER_CHAR}s" for max_length in fields.values()))
+
+def pack_record(layout, fields, record):
+    """Packs a record dict into a slot. Passing None produces an empty, deleted slot."""
+    if record is None:
+        return layout.pack(SLOT_DELETED, *(b"" for _ in fields))
+    values = []
+    for field, max_length in fields.items():
+        value = record.get(field)
+        encoded = b"" if value is None else str(value).encode("utf-8")
+        if len(encoded) > max_length * BYTES_PER_CHAR:
+            raise ValueError(f"Value for '{field}' exceeds maximum length of {max_length}.")
+        values.append(encoded)
+    return layout.pack(SLOT_LIVE, *values)
+
+def unpack_record(layout, fields, buffer, offset=0):
+    """Unpacks the slot at `offset` in `buffer` into a record dict, or returns None if it has been deleted."""
+    status, *values = layout.unpack_from(buffer, offset)
+    if status != SLOT_LIVE:
+        return None
+    return {field: value.rstrip(b"\0").decode("utf-8") for field, value in zip(fields, values)}
+
+class MappedTable:
+    """
+    Memory-mapped view over a fixed-width data file.
+    Slots are read and patched directly in the mapping, so opening a large file costs nothing
+    up front and touching one record only pages in that record's slot.
+    """
+
+    def __init__(self, db_name, fields, writable=False):
+        self.fields = fields
+        self.layout = record_struct(fields)
+        self.file = open(data_file_path(db_name), 'r+b' if writable else 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        # An empty file cannot be mapped; it simply has no slots
+        self.map = None
+        if size:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self.map = mmap.mmap(self.file.fileno(), 0, access=access)
+        self.slot_count = size // self.layout.size
+
+    def __len__(self):
+        return self.slot_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def slot(self, index):
+        """Returns a zero-copy memoryview of the raw bytes of slot `index`."""
+        offset = index * self.layout.size
+        return memoryview(self.map)[offset:offset + self.layout.size]
+
+    def read(self, index):
+        """Returns the record in slot `index`, or None if it is out of range or deleted."""
+        if index < 0 or index >= self.slot_count:
+            return None
+        return unpack_record(self.layout, self.fields, self.map, index * self.layout.size)
+
+    def check_index(self, index):
+        if index < 0 or index >= self.slot_count:
+            raise IndexError(f"Record index {index} is out of range.")
+
+    def write(self, index, record):
+        """Patches slot `index` in place with the given record."""
+        self.check_index(index)
+        offset = index * self.layout.size
+        self.map[offset:offset + self.layout.size] = pack_record(self.layout, self.fields, record)
+
+    def delete(self, index):
+        """Marks slot `index` as deleted by flipping its status byte; nothing else is rewritten."""
+        self.check_index(index)
+        self.map[index * self.layout.size] = SLOT_DELETED
+
+    def __iter__(self):
+        """Walks the mapping lazily, yielding (index, record) for every live slot."""
+        for index in range(self.slot_count):
+            record = self.read(index)
+            if record is not None:
+                yield index, record
+
+def create_data_file(db_name):
+    """Creates an empty binary data file."""
+    with open(data_file_path(db_name), 'wb'):
+        pass
+
+def record_count(db_name, fields):
+    """Returns the number of slots (live or deleted) in the data file."""
+    return os.path.getsize(data_file_path(db_name)) // record_struct(fields).size
+
+def deleted_slots(db_name, fields):
+    """Returns the positions of the deleted slots, reading only the status byte of each slot."""
+    with MappedTable(db_name, fields) as table:
+        if table.map is None:
+            return []
+        status_bytes = table.map[0:table.slot_count * table.layout.size:table.layout.size]
+        return [index for index, status in enumerate(status_bytes) if status != SLOT_LIVE]
+
+def write_records(db_name, fields, records_by_index):
+    """Overwrites several existing slots in place through one memory mapping."""
+    with MappedTable(db_name, fields, writable=True) as table:
+        for index, record in records_by_index:
+            table.write(index, record)
+        table.map.flush()
+
+def read_record(db_name, fields, index):
+    """Reads the record in slot `index`; returns None if the slot is out of range or deleted."""
+    with MappedTable(db_name, fields) as table:
+        return table.read(index)
+
+def read_many(db_name, fields, positions):
+    """Yields (index, record) for each live slot among `positions`, in the order given."""
+    with MappedTable(db_name, fields) as table:
+        for position in positions:
+            record = table.read(position)
+            if record is not None:
+                yield position, record
+
+def read_slots(db_name, fields):
+    """Returns every slot as a list, with None for deleted slots."""
+    with MappedTable(db_name, fields) as table:
+        return [table.read(index) for index in range(len(table))]
+
+def write_record(db_name, fields, index, record):
+    """Overwrites slot `index` in place through the memory mapping."""
+    with MappedTable(db_name, fields, writable=True) as table:
+        table.write(index, record)
+        table.map.flush()
+
+def delete_record(db_name, fields, index):
+    """Marks slot `index` as deleted by rewriting its status byte only."""
+    with MappedTable(db_name, fields, writable=True) as table:
+        table.delete(index)
+        table.map.flush()
+
+def append_record(db_name, fields, record):
+    """Appends a record in a new slot at the end of the file and returns its index."""
+    return append_records(db_name, fields, [record])
+
+def append_records(db_name, fields, records):
+    """
+    Appends several records in one write and returns the index of the first new slot.
+    They are written just past the last whole slot, so the partial slot left by an append that
+    crashed halfway is overwritten instead of shifting every later record.
+    """
+    layout = record_struct(fields)
+    data = b"".join(pack_record(layout, fields, record) for record in records)
+    with open(data_file_path(db_name), 'r+b') as f:
+        index = os.fstat(f.fileno()).st_size // layout.size
+        f.seek(index * layout.size)
+        f.write(data)
+    return index
+
+def iter_records(db_name, fields):
+    """Yields (index, record) for every live slot, walking the memory mapping lazily."""
+    with MappedTable(db_name, fields) as table:
+        yield from table
+
+def write_all(db_name, fields, records):
+    """Rewrites the whole data file with the given records, one slot each."""
+    layout = record_struct(fields)
+    data_file = data_file_path(db_name)
+    temp_file = f"{data_file}.tmp"
+    with open(temp_file, 'wb') as f:
+        for record in records:
+            f.write(pack_record(layout, fields, record))
+    os.replace(temp_file, data_file)
+
+def storage_size(db_name):
+    """Bytes used by the data file."""
+    return os.path.getsize(data_file_path(db_name))
+
+def recover(db_name, fields):
+    """
+    Removes a half-written replacement left by an interrupted write_all(), and cuts off the
+    partial slot an interrupted append may have left at the end of the data file.
+    """
+    data_file = data_file_path(db_name)
+    temp_file = f"{data_file}.tmp"
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    if os.path.exists(data_file):
+        slot_size = record_struct(fields).size
+        size = os.path.getsize(data_file)
+        if size % slot_size:
+            os.truncate(data_file, size - size % slot_size)
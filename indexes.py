@@ -0,0 +1,627 @@
+import bisect
+import heapq
+import json
+import math
+import os
+from urllib.parse import quote
+
+# Persisted indexes over a database's records.
+# Every index maps field values to record indexes and is kept as a JSON snapshot plus an
+# append-only log of changes, the same way records are kept, so an insert or edit only
+# appends one line instead of rewriting the whole index.
+#
+#   KeyIndex     hash index on the primary key (<db>_pk.json / <db>_pk.log)
+#   SortedIndex  ordered index on any field (<db>_idx_<field>.json / .log) for range,
+#                prefix and sorted queries; the field name is percent-encoded in the file
+#                name, so a field such as "a/b" still gets a file of its own
+#   FreeSpaceMap deleted record slots that inserts can reuse (<db>_free.json / .log)
+#   RecordIdMap  stable record ID -> record slot (<db>_ids.json / .log)
+
+LOG_COMPACT_MIN_ENTRIES = 1000  # Fold a log into its snapshot once it is at least this long
+
+def value_order_key(value):
+    """
+    Returns a key that orders values numerically when they are finite numbers and as text
+    otherwise, with every number sorting before every non-number.
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is not None and math.isfinite(number):
+        return (0, number, "")
+    return (1, 0.0, str(value))
+
+def key_index_paths(db_name):
+    """Returns the snapshot and log paths of the primary-key index."""
+    return f"{db_name}_pk.json", f"{db_name}_pk.log"
+
+def sorted_index_paths(db_name, field):
+    """Returns the snapshot and log paths of the sorted index on `field`."""
+    name = quote(field, safe="")
+    return f"{db_name}_idx_{name}.json", f"{db_name}_idx_{name}.log"
+
+def free_space_paths(db_name):
+    """Returns the snapshot and log paths of the free-space map."""
+    return f"{db_name}_free.json", f"{db_name}_free.log"
+
+def record_id_paths(db_name):
+    """Returns the snapshot and log paths of the record ID map."""
+    return f"{db_name}_ids.json", f"{db_name}_ids.log"
+
+def remove_index_files(paths):
+    """Removes the given index files, if they exist."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def delete_key_index(db_name):
+    """Removes the primary-key index files, if any."""
+    remove_index_files(key_index_paths(db_name))
+
+def delete_sorted_index(db_name, field):
+    """Removes the sorted index files on `field`, if any."""
+    remove_index_files(sorted_index_paths(db_name, field))
+
+def delete_free_space_map(db_name):
+    """Removes the free-space map files, if any."""
+    remove_index_files(free_space_paths(db_name))
+
+def delete_record_id_map(db_name):
+    """Removes the record ID map files, if any."""
+    remove_index_files(record_id_paths(db_name))
+
+class LoggedIndex:
+    """
+    Base class for an index persisted as a snapshot plus a change log.
+    Subclasses describe their snapshot contents and how a log entry is applied.
+    """
+
+    def __init__(self, db_name, field):
+        self.db_name = db_name
+        self.field = field
+        self.log_entries = 0
+
+    def paths(self):
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+    def restore(self, snapshot):
+        raise NotImplementedError
+
+    def apply(self, entry):
+        raise NotImplementedError
+
+    def size(self):
+        raise NotImplementedError
+
+    @classmethod
+    def open(cls, db_name, field, paths):
+        """Loads a snapshot and replays its log. Returns None if the index has not been built."""
+        snapshot_file, log_file = paths
+        if not os.path.exists(snapshot_file):
+            return None
+        with open(snapshot_file, 'r') as f:
+            snapshot = json.load(f)
+        index = cls(db_name, field)
+        index.restore(snapshot)
+        if os.path.exists(log_file):
+            with open(log_file, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Torn final line from an interrupted write
+                    index.apply(entry)
+                    index.log_entries += 1
+        return index
+
+    def log(self, entry):
+        """Applies an entry and appends it to the log, compacting the log when it grows long."""
+        self.apply(entry)
+        self.log_entries += 1
+        if self.log_entries >= max(LOG_COMPACT_MIN_ENTRIES, self.size()):
+            self.save()
+            return
+        with open(self.paths()[1], 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def save(self):
+        """Writes a fresh snapshot of the index and clears its log."""
+        snapshot_file, log_file = self.paths()
+        snapshot = self.snapshot()
+        temp_file = f"{snapshot_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_file, snapshot_file)
+        if os.path.exists(log_file):
+            os.remove(log_file)
+        self.log_entries = 0
+
+    def check(self, record, position=None):
+        """Raises ValueError if storing `record` at `position` would violate the index."""
+
+    def check_many(self, records):
+        """Raises ValueError if appending all of `records` would violate the index."""
+        for record in records:
+            self.check(record)
+
+    def extend(self, rows):
+        """Adds (record index, record) pairs to the in-memory index without logging them."""
+        raise NotImplementedError
+
+    def add_many(self, rows):
+        """Indexes a batch of newly stored records and writes one snapshot instead of a log entry each."""
+        self.extend(rows)
+        self.save()
+
+class KeyIndex(LoggedIndex):
+    """In-memory view of the persisted primary-key index of one database."""
+
+    def __init__(self, db_name, field):
+        super().__init__(db_name, field)
+        self.keys = {}
+        self.positions = {}  # record index -> key, used to find a record's key when it changes or is deleted
+
+    @classmethod
+    def load(cls, db_name, field):
+        return cls.open(db_name, field, key_index_paths(db_name))
+
+    @classmethod
+    def build(cls, db_name, field, rows):
+        """
+        Builds an index from (record index, record) pairs.
+        Raises ValueError if a key is missing or appears more than once.
+        """
+        index = cls(db_name, field)
+        index.extend(rows)
+        return index
+
+    def extend(self, rows):
+        for position, record in rows:
+            self.check(record)
+            key = self.key_of(record)
+            self.keys[key] = position
+            self.positions[position] = key
+
+    def paths(self):
+        return key_index_paths(self.db_name)
+
+    def snapshot(self):
+        return {"field": self.field, "keys": self.keys}
+
+    def restore(self, snapshot):
+        self.keys = snapshot["keys"]
+        self.positions = {position: key for key, position in self.keys.items()}
+
+    def size(self):
+        return len(self.keys)
+
+    def key_of(self, record):
+        """Returns the normalised key of a record, rejecting records without one."""
+        key = record.get(self.field)
+        if key is None or str(key) == "":
+            raise ValueError(f"Primary key '{self.field}' cannot be empty.")
+        return str(key)
+
+    def lookup(self, key):
+        """Returns the record index for the given key, or None if the key is not present."""
+        return self.keys.get(str(key))
+
+    def check(self, record, position=None):
+        """Raises ValueError if the record's key is empty or already belongs to a record other than `position`."""
+        key = self.key_of(record)
+        existing = self.keys.get(key)
+        if existing is not None and existing != position:
+            raise ValueError(f"A record with {self.field} '{key}' already exists.")
+
+    def check_many(self, records):
+        """Like check(), for a batch of new records, which must also not repeat a key among themselves."""
+        seen = set()
+        for record in records:
+            self.check(record)
+            key = self.key_of(record)
+            if key in seen:
+                raise ValueError(f"A record with {self.field} '{key}' appears more than once.")
+            seen.add(key)
+
+    def apply(self, entry):
+        """Applies one log entry to the in-memory index."""
+        if entry["op"] == "set":
+            self.forget(entry["key"])
+            self.keys[entry["key"]] = entry["index"]
+            self.positions[entry["index"]] = entry["key"]
+        elif entry["op"] == "del":
+            self.forget(entry["key"])
+
+    def forget(self, key):
+        """Removes `key` from the in-memory index, if present."""
+        position = self.keys.pop(key, None)
+        if position is not None and self.positions.get(position) == key:
+            del self.positions[position]
+
+    def add(self, record, position):
+        """Indexes a newly stored record."""
+        self.check(record)
+        self.log({"op": "set", "key": self.key_of(record), "index": position})
+
+    def replace(self, record, position):
+        """Re-indexes the record at `position`, whose key may have changed."""
+        old_key = self.positions.get(position)
+        new_key = self.key_of(record)
+        self.check(record, position)
+        if old_key is not None and old_key != new_key:
+            self.log({"op": "del", "key": old_key})
+        if old_key != new_key:
+            self.log({"op": "set", "key": new_key, "index": position})
+
+    def remove(self, position):
+        """Drops the deleted record at `position` from the index."""
+        key = self.positions.get(position)
+        if key is not None:
+            self.log({"op": "del", "key": key})
+
+class SortedIndex(LoggedIndex):
+    """
+    Ordered index on one field: a list of (value, record index) pairs kept sorted, searched with bisect.
+    Values are ordered by value_order_key, so numbers compare by value ("9" before "10") and
+    come before text, which compares as strings.
+    """
+
+    def __init__(self, db_name, field):
+        super().__init__(db_name, field)
+        self.entries = []  # Sorted (sort key, record index) pairs
+        self.values = {}   # record index -> stored value, used to find an entry when it changes
+
+    @classmethod
+    def load(cls, db_name, field):
+        return cls.open(db_name, field, sorted_index_paths(db_name, field))
+
+    @classmethod
+    def build(cls, db_name, field, rows):
+        """Builds an index from (record index, record) pairs."""
+        index = cls(db_name, field)
+        index.extend(rows)
+        return index
+
+    def extend(self, rows):
+        # Append everything, then sort once; this is much cheaper than one insort per record
+        for position, record in rows:
+            value = self.value_of(record)
+            self.values[position] = value
+            self.entries.append((self.sort_key(value), position))
+        self.entries.sort()
+
+    def paths(self):
+        return sorted_index_paths(self.db_name, self.field)
+
+    def snapshot(self):
+        return {"field": self.field,
+                "entries": [[self.values[position], position] for _, position in self.entries]}
+
+    def restore(self, snapshot):
+        self.values = {position: value for value, position in snapshot["entries"]}
+        # The snapshot is stored in order, so no re-sort is needed
+        self.entries = [(self.sort_key(value), position) for value, position in snapshot["entries"]]
+
+    def size(self):
+        return len(self.entries)
+
+    def value_of(self, record):
+        value = record.get(self.field)
+        return "" if value is None else str(value)
+
+    def sort_key(self, value):
+        """Returns the key used to order `value` in this index."""
+        return value_order_key(value)
+
+    def apply(self, entry):
+        """Applies one log entry to the in-memory index."""
+        position = entry["index"]
+        if entry["op"] == "set":
+            self.discard(position)
+            self.values[position] = entry["value"]
+            bisect.insort(self.entries, (self.sort_key(entry["value"]), position))
+        elif entry["op"] == "del":
+            self.discard(position)
+
+    def discard(self, position):
+        """Removes the entry for record `position` from the in-memory list, if present."""
+        if position not in self.values:
+            return
+        item = (self.sort_key(self.values.pop(position)), position)
+        i = bisect.bisect_left(self.entries, item)
+        if i < len(self.entries) and self.entries[i] == item:
+            del self.entries[i]
+
+    def add(self, record, position):
+        self.log({"op": "set", "value": self.value_of(record), "index": position})
+
+    def replace(self, record, position):
+        if self.values.get(position) != self.value_of(record):
+            self.log({"op": "set", "value": self.value_of(record), "index": position})
+
+    def remove(self, position):
+        self.log({"op": "del", "index": position})
+
+    def ordered(self, reverse=False):
+        """Yields record indexes in field order."""
+        entries = reversed(self.entries) if reverse else self.entries
+        for _, position in entries:
+            yield position
+
+    def entries_from(self, value=None, reverse=False):
+        """
+        Yields (sort key, record index) pairs in field order, starting with the first entry whose
+        value sorts equal to `value` (from the start if None); with `reverse`, in reverse order
+        starting with the last such entry.
+        """
+        if reverse:
+            end = len(self.entries) if value is None else bisect.bisect_right(self.entries, (self.sort_key(value), math.inf))
+            for i in range(end - 1, -1, -1):
+                yield self.entries[i]
+        else:
+            start = 0 if value is None else bisect.bisect_left(self.entries, (self.sort_key(value),))
+            for i in range(start, len(self.entries)):
+                yield self.entries[i]
+
+    def between(self, low=None, high=None):
+        """Yields record indexes whose value lies in [low, high], in order. Either bound may be None."""
+        start = 0 if low is None else bisect.bisect_left(self.entries, (self.sort_key(str(low)),))
+        high_key = None if high is None else self.sort_key(str(high))
+        for i in range(start, len(self.entries)):
+            key, position = self.entries[i]
+            if high_key is not None and key > high_key:
+                break
+            yield position
+
+    def at_least(self, low):
+        """Yields record indexes whose value is >= low, in order."""
+        return self.between(low, None)
+
+    def startswith(self, prefix):
+        """Yields record indexes whose value starts with `prefix`, in order."""
+        prefix = str(prefix)
+        text_start = bisect.bisect_left(self.entries, ((1, 0.0, ""),))
+        # Numbers are ordered by value, so a shared prefix does not keep them together;
+        # check them one by one unless the prefix cannot start a number at all
+        if not prefix[:1].isalpha():
+            for i in range(text_start):
+                position = self.entries[i][1]
+                if self.values[position].startswith(prefix):
+                    yield position
+        # Text values sharing a prefix sit next to each other
+        start = bisect.bisect_left(self.entries, ((1, 0.0, prefix),), text_start)
+        for i in range(start, len(self.entries)):
+            (_, _, value), position = self.entries[i]
+            if not value.startswith(prefix):
+                break
+            yield position
+
+class FreeSpaceMap(LoggedIndex):
+    """
+    The deleted record slots of one database, which inserts fill before growing the file.
+    Slots are handed out lowest first, so live records stay packed towards the start of the file.
+    """
+
+    def __init__(self, db_name, field=None):
+        super().__init__(db_name, field)
+        self.free = set()
+        self.heap = []  # The free slots as a heap; may hold stale entries that are skipped
+
+    @classmethod
+    def load(cls, db_name):
+        return cls.open(db_name, None, free_space_paths(db_name))
+
+    @classmethod
+    def build(cls, db_name, positions):
+        """Builds a map from the positions of the deleted slots."""
+        free_map = cls(db_name)
+        free_map.free = set(positions)
+        free_map.heap = sorted(free_map.free)
+        return free_map
+
+    def paths(self):
+        return free_space_paths(self.db_name)
+
+    def snapshot(self):
+        return {"free": sorted(self.free)}
+
+    def restore(self, snapshot):
+        self.free = set(snapshot["free"])
+        self.heap = list(snapshot["free"])
+
+    def size(self):
+        return len(self.free)
+
+    def apply(self, entry):
+        """Applies one log entry to the in-memory map."""
+        position = entry["index"]
+        if entry["op"] == "free":
+            if position not in self.free:
+                self.free.add(position)
+                heapq.heappush(self.heap, position)
+        elif entry["op"] == "use":
+            self.free.discard(position)
+
+    def release(self, position):
+        """Records that the slot at `position` has been deleted."""
+        self.log({"op": "free", "index": position})
+
+    def take(self, count, is_free=None):
+        """
+        Claims up to `count` free slots, lowest first, and returns their positions.
+        `is_free(position)` double-checks each slot (against the record ID map), so a map that
+        has fallen behind the data after a crash can never hand out a live record's slot.
+        """
+        taken = []
+        while len(taken) < count and self.heap:
+            position = heapq.heappop(self.heap)
+            if position not in self.free:
+                continue
+            self.log({"op": "use", "index": position})
+            if is_free is None or is_free(position):
+                taken.append(position)
+        return taken
+
+class RecordIdMap(LoggedIndex):
+    """
+    The stable ID of every record and the slot it is stored in.
+    IDs are handed out in increasing order and never reused, and a record keeps its ID when
+    other records are deleted or the data file is compacted, so an ID shown to the user keeps
+    naming the same record. Looking a record up by ID is one dictionary lookup.
+    The map also counts the data file's slots, live or deleted, so an insert knows where the
+    records it appends land without reading the data.
+    """
+
+    def __init__(self, db_name, field=None):
+        super().__init__(db_name, field)
+        self.locations = {}  # record ID -> slot
+        self.ids = {}        # slot -> record ID
+        self.order = []      # The live IDs, sorted, for reading records a page at a time
+        self.next_id = 1
+        self.slots = 0       # Number of record slots, including deleted ones
+
+    @classmethod
+    def load(cls, db_name):
+        return cls.open(db_name, None, record_id_paths(db_name))
+
+    @classmethod
+    def build(cls, db_name, positions, slots, first_id=1):
+        """
+        Builds a map of a data file with `slots` slots, giving the record in each of the given
+        slots the ID `first_id + slot`, so a database that had no map yet keeps the numbers its
+        records were shown with.
+        """
+        id_map = cls(db_name)
+        id_map.next_id = first_id
+        id_map.slots = slots
+        for position in positions:
+            id_map.apply({"op": "set", "id": first_id + position, "index": position})
+        return id_map
+
+    def paths(self):
+        return record_id_paths(self.db_name)
+
+    def snapshot(self):
+        return {"next_id": self.next_id, "slots": self.slots, "ids": sorted(self.locations.items())}
+
+    def restore(self, snapshot):
+        self.next_id = snapshot["next_id"]
+        self.slots = snapshot["slots"]
+        for record_id, position in snapshot["ids"]:
+            self.locations[record_id] = position
+            self.ids[position] = record_id
+        self.order = sorted(self.locations)
+
+    def size(self):
+        return len(self.locations)
+
+    def copy(self):
+        """Returns an unsaved copy, for a batch to change before it is stored."""
+        id_map = type(self)(self.db_name)
+        id_map.locations = dict(self.locations)
+        id_map.ids = dict(self.ids)
+        id_map.order = list(self.order)
+        id_map.next_id = self.next_id
+        id_map.slots = self.slots
+        return id_map
+
+    def apply(self, entry):
+        """Applies one log entry to the in-memory map."""
+        if entry["op"] == "set":
+            record_id, position = entry["id"], entry["index"]
+            # A slot holds one record, so whatever ID it had before is gone
+            self.discard(position)
+            if record_id in self.locations:
+                del self.ids[self.locations[record_id]]
+            elif self.order and record_id < self.order[-1]:
+                bisect.insort(self.order, record_id)
+            else:
+                self.order.append(record_id)  # New IDs are the largest, so this is the usual case
+            self.locations[record_id] = position
+            self.ids[position] = record_id
+            self.next_id = max(self.next_id, record_id + 1)
+            self.slots = max(self.slots, position + 1)
+        elif entry["op"] == "del":
+            position = self.locations.pop(entry["id"], None)
+            if position is not None:
+                self.ids.pop(position, None)
+                self.drop_from_order(entry["id"])
+
+    def discard(self, position):
+        record_id = self.ids.pop(position, None)
+        if record_id is not None:
+            del self.locations[record_id]
+            self.drop_from_order(record_id)
+
+    def drop_from_order(self, record_id):
+        i = bisect.bisect_left(self.order, record_id)
+        if i < len(self.order) and self.order[i] == record_id:
+            del self.order[i]
+
+    def ids_after(self, record_id, count):
+        """Returns up to `count` live IDs greater than `record_id` (from the first if None), in order."""
+        start = 0 if record_id is None else bisect.bisect_right(self.order, record_id)
+        return self.order[start:start + count]
+
+    def ids_from(self, start, count):
+        """Returns up to `count` live IDs in order, starting with the `start`-th smallest (from 0)."""
+        return self.order[start:start + count]
+
+    def ids_before(self, record_id, count):
+        """Returns up to `count` live IDs smaller than `record_id`, closest last."""
+        end = bisect.bisect_left(self.order, record_id)
+        return self.order[max(0, end - count):end]
+
+    def location(self, record_id):
+        """Returns the slot of the record with the given ID, or None if there is no such record."""
+        return self.locations.get(record_id)
+
+    def id_at(self, position):
+        """Returns the ID of the record in the given slot, or None."""
+        return self.ids.get(position)
+
+    def claim(self, position):
+        """Gives the record in `position` the next ID, in memory only, and returns the ID."""
+        record_id = self.next_id
+        self.apply({"op": "set", "id": record_id, "index": position})
+        return record_id
+
+    def assign(self, position):
+        """Gives a newly stored record the next ID and returns the ID."""
+        record_id = self.next_id
+        self.log({"op": "set", "id": record_id, "index": position})
+        return record_id
+
+    def assign_many(self, positions):
+        """Gives a batch of newly stored records their IDs with one snapshot. Returns the IDs."""
+        record_ids = [self.claim(position) for position in positions]
+        self.save()
+        return record_ids
+
+    def release(self, position):
+        """Records that the record in `position` has been deleted; its ID is not used again."""
+        record_id = self.ids.get(position)
+        if record_id is not None:
+            self.log({"op": "del", "id": record_id})
+
+    def remap(self, live_positions):
+        """
+        Moves every record to its new slot after a compaction that packed the records in
+        `live_positions` (their old slots, in order) into slots 0, 1, 2, ... Records keep their
+        IDs; one the map did not know gets a new ID. The map is saved.
+        """
+        old_ids = self.ids
+        self.locations = {}
+        self.ids = {}
+        self.order = []
+        self.slots = 0
+        for new_position, old_position in enumerate(live_positions):
+            record_id = old_ids.get(old_position)
+            if record_id is None:
+                record_id = self.next_id
+            self.apply({"op": "set", "id": record_id, "index": new_position})
+        self.save()
@@ -0,0 +1,109 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import file_manager as fm
+
+# Stress test for multi-process access.
+# N writer processes each add records with their own keys and increment a shared counter
+# record inside a batch (a read-modify-write that loses updates without locking), while M
+# reader processes keep scanning the table and checking that every record they see is whole.
+# At the end every added record and every increment must be there.
+#
+#   python lock_stress.py --writers 4 --readers 4 --operations 200 --storage json
+
+DB_NAME = "stress"
+FIELDS = {"key": 20, "count": 10}
+
+def writer(number, operations):
+    """Adds `operations` records and increments the counter as many times."""
+    db = fm.open_database(DB_NAME)
+    for i in range(operations):
+        db.add({"key": f"w{number}-{i}", "count": "0"})
+        with db.batch() as batch:
+            counter = batch.get(0)
+            counter["count"] = str(int(counter["count"]) + 1)
+            batch.update(0, counter)
+
+def reader(stop, results):
+    """Scans the table until told to stop. Reports (scans, problems found)."""
+    db = fm.open_database(DB_NAME)
+    scans = 0
+    problems = []
+    last_count = 0
+    while not stop.is_set():
+        for index, record in db.iter_records():
+            if set(record) != set(FIELDS) or not record["count"].isdigit():
+                problems.append(f"torn record {index}: {record}")
+            elif index == 0:
+                if int(record["count"]) < last_count:
+                    problems.append(f"counter went back from {last_count} to {record['count']}")
+                last_count = int(record["count"])
+        scans += 1
+    results.put((scans, problems))
+
+def run(writers, readers, operations, storage):
+    """Runs the test in the current directory. Returns True if nothing was lost or torn."""
+    fm.create_database_files(DB_NAME, FIELDS, storage, primary_key="key")
+    fm.open_database(DB_NAME).add({"key": "counter", "count": "0"})
+    fm.close_database(DB_NAME)
+
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    results = context.Queue()
+    reader_processes = [context.Process(target=reader, args=(stop, results)) for _ in range(readers)]
+    writer_processes = [context.Process(target=writer, args=(number, operations)) for number in range(writers)]
+    for process in reader_processes:
+        process.start()
+    start = time.perf_counter()
+    for process in writer_processes:
+        process.start()
+    for process in writer_processes:
+        process.join()
+    seconds = time.perf_counter() - start
+    stop.set()
+    reports = [results.get() for _ in reader_processes]
+    for process in reader_processes:
+        process.join()
+
+    db = fm.open_database(DB_NAME)
+    records = dict(db.iter_records())
+    keys = {record["key"] for record in records.values()}
+    expected_keys = {f"w{number}-{i}" for number in range(writers) for i in range(operations)}
+    counter = int(db.get(0)["count"])
+    missing = expected_keys - keys
+    problems = [problem for _, found in reports for problem in found]
+
+    changes = writers * operations * 2
+    print(f"{writers} writers x {operations} operations, {readers} readers, {storage} storage")
+    print(f"Writes: {changes} changes in {seconds:.2f} seconds ({changes / seconds:.0f} per second)")
+    print(f"Reads: {sum(scans for scans, _ in reports)} full scans")
+    print(f"Records: {len(records) - 1} of {len(expected_keys)} added, counter {counter} of {writers * operations}")
+    for problem in problems[:10]:
+        print(f"Problem: {problem}")
+    ok = not missing and counter == writers * operations and not problems
+    print("OK: no lost updates" if ok else "FAILED: updates were lost or records torn")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that concurrent processes do not lose updates.")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=200, help="records added (and counter increments) per writer")
+    parser.add_argument("--storage", choices=fm.STORAGE_FORMATS, default="json")
+    args = parser.parse_args(argv)
+
+    # Work in a scratch directory so no real database is touched
+    with tempfile.TemporaryDirectory(prefix="dbms_stress_") as directory:
+        previous = os.getcwd()
+        os.chdir(directory)
+        try:
+            ok = run(args.writers, args.readers, args.operations, args.storage)
+        finally:
+            os.chdir(previous)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
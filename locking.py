@@ -0,0 +1,128 @@
+import contextlib
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; locking then only covers threads of one process
+    fcntl = None
+
+# Reader/writer locking for one database, across threads and processes.
+# Inside a process a reader count and a writer flag let any number of reading threads in at
+# once, or one writing thread. Across processes the same is done with advisory fcntl locks on
+# <db>.lock: the first reader in a process takes a shared lock, the last one drops it, and a
+# writer holds an exclusive lock for as long as it writes.
+#
+# Byte 1 of the lock file is the lock itself. Byte 0 is a turnstile that every process passes
+# through exclusively on its way in; a waiting writer keeps holding it, so a steady stream of
+# readers cannot keep the shared lock held forever and starve the writers.
+#
+# A writing thread may read (and write again) while it holds the lock. A reading thread must
+# not start writing before it lets go of its read lock, or it would wait for itself forever,
+# so locks are only held around short steps and never across a `yield` to the caller.
+
+def lock_file_path(db_name):
+    """Returns the path of the file that processes lock to share the specified database."""
+    return f"{db_name}.lock"
+
+class ReadWriteLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.mutex = threading.Lock()
+        self.changed = threading.Condition(self.mutex)
+        self.readers = 0         # Threads of this process reading right now
+        self.writer = None       # Thread of this process writing right now
+        self.writer_depth = 0    # Nested write (and read) sections of that thread
+
+    def lock_file(self, exclusive):
+        """Takes the advisory lock on the lock file, waiting for other processes as needed."""
+        if fcntl is None:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'a+')
+        fd = self.file.fileno()
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)  # Turnstile
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, 1, 1)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+
+    def unlock_file(self):
+        if fcntl is not None and self.file is not None:
+            fcntl.lockf(self.file.fileno(), fcntl.LOCK_UN, 1, 1)
+
+    @contextlib.contextmanager
+    def shared(self):
+        """Holds the lock for reading; other readers may hold it at the same time."""
+        me = threading.current_thread()
+        with self.mutex:
+            if self.writer is me:
+                self.writer_depth += 1
+                nested = True
+            else:
+                nested = False
+                while self.writer is not None:
+                    self.changed.wait()
+                if self.readers == 0:
+                    self.lock_file(exclusive=False)
+                self.readers += 1
+        try:
+            yield
+        finally:
+            with self.mutex:
+                if nested:
+                    self.writer_depth -= 1
+                else:
+                    self.readers -= 1
+                    if self.readers == 0:
+                        self.unlock_file()
+                        self.changed.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Holds the lock for writing; nobody else, in this process or another, reads or writes meanwhile."""
+        me = threading.current_thread()
+        with self.mutex:
+            nested = self.writer is me
+            if nested:
+                self.writer_depth += 1
+            else:
+                while self.writer is not None or self.readers:
+                    self.changed.wait()
+                self.writer = me
+                self.writer_depth = 1
+        if not nested:
+            # Wait for other processes outside the mutex; local threads already wait for self.writer
+            try:
+                self.lock_file(exclusive=True)
+            except BaseException:
+                self.release_writer()
+                raise
+        try:
+            yield
+        finally:
+            with self.mutex:
+                self.writer_depth -= 1
+                last = self.writer_depth == 0
+            if last:
+                self.unlock_file()
+                self.release_writer()
+
+    def release_writer(self):
+        with self.mutex:
+            self.writer = None
+            self.writer_depth = 0
+            self.changed.notify_all()
+
+    def close(self):
+        with self.mutex:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+def remove_lock_file(db_name):
+    """Deletes the lock file of a database that is being deleted."""
+    path = lock_file_path(db_name)
+    if os.path.exists(path):
+        os.remove(path)
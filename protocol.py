@@ -0,0 +1,76 @@
+import asyncio
+import json
+import struct
+
+# Wire format shared by server.py and client.py.
+# Every message is a frame: a 4-byte big-endian length followed by that many bytes of UTF-8
+# JSON. Requests carry an "id" chosen by the client, an "op" and its arguments; the response
+# to a request carries the same "id", so a client may send many requests before reading any
+# response (pipelining) and match the responses up as they arrive:
+#
+#   {"id": 7, "op": "get", "db": "students", "index": 3}
+#   {"id": 7, "ok": true, "result": {"fname": "Ali", "roll": "7"}}
+#   {"id": 8, "ok": false, "error": "IndexError", "message": "Record index 9 is out of range."}
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7878
+HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 16 * 1024 * 1024  # Larger frames are refused rather than buffered
+ERRORS = {"ValueError": ValueError, "IndexError": IndexError, "KeyError": KeyError}
+
+def encode_frame(message):
+    """Returns the frame holding one message."""
+    body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    if len(body) > MAX_FRAME_BYTES:
+        raise ValueError(f"Message of {len(body)} bytes is larger than the {MAX_FRAME_BYTES} byte limit.")
+    return HEADER.pack(len(body)) + body
+
+def decode_body(body):
+    message = json.loads(body.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("A message must be a JSON object.")
+    return message
+
+def check_length(length):
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {length} bytes is larger than the {MAX_FRAME_BYTES} byte limit.")
+
+def read_exactly(sock, size):
+    """Reads `size` bytes from a blocking socket. Raises ConnectionError if it closes first."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by the server.")
+        data += chunk
+    return bytes(data)
+
+def read_frame(sock):
+    """Reads one message from a blocking socket."""
+    (length,) = HEADER.unpack(read_exactly(sock, HEADER.size))
+    check_length(length)
+    return decode_body(read_exactly(sock, length))
+
+async def read_frame_async(reader):
+    """
+    Reads one message from an asyncio stream. Returns None if the peer closed the connection
+    between messages.
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    (length,) = HEADER.unpack(header)
+    check_length(length)
+    return decode_body(await reader.readexactly(length))
+
+def error_response(request_id, error):
+    """The response reporting that a request failed with `error`."""
+    return {"id": request_id, "ok": False, "error": type(error).__name__, "message": str(error)}
+
+def raise_error(response):
+    """Raises the exception described by a failed response."""
+    error = ERRORS.get(response.get("error"), RuntimeError)
+    raise error(response.get("message", "Request failed."))
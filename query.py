@@ -0,0 +1,374 @@
+import base64
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import file_manager as fm
+from indexes import value_order_key
+
+# Streaming query engine.
+# A query is a generator pipeline over the storage layer:
+#
+#   source (index lookup, index range, index order or full scan)
+#     -> filter (every condition) -> order (only if the source is not already ordered)
+#     -> limit (stops pulling from the source early) -> project
+#
+# Conditions are (field, operator, value) tuples. Comparisons order values numerically when
+# both sides are numbers and as text otherwise, the same way the sorted indexes order them.
+#
+# Ordering without an index is an external merge sort: rows are sorted in memory-sized chunks,
+# every full chunk is written to a temporary run file, and the runs are merged lazily with
+# heapq.merge, so a table larger than memory can still be read in order.
+#
+# Tables are browsed a page at a time with read_page(). Each page comes with opaque cursors
+# for the pages before and after it, which hold the sort key of the row at the edge of the
+# page (keyset pagination) rather than an offset. In record ID order, or in the order of an
+# indexed field, a page reads only its own records however deep into the table it is.
+
+OPERATORS = ("=", "!=", "<", "<=", ">", ">=", "between", "startswith", "contains")
+SORT_MEMORY_LIMIT = 100000  # Rows sorted in memory at once; larger inputs are sorted in runs on disk
+PAGE_SIZE = 20  # Records per page when browsing a table
+
+def parse_condition(text):
+    """
+    Parses a condition such as "roll >= 5", "lname startswith k" or "roll between 3 7".
+    Returns a (field, operator, value) tuple; `between` takes a (low, high) pair as its value.
+    Raises ValueError if the text is not a valid condition.
+    """
+    parts = text.split()
+    if len(parts) < 3 or parts[1].lower() not in OPERATORS:
+        raise ValueError(f"Invalid condition '{text}'. Use: <field> <operator> <value>, operators: {', '.join(OPERATORS)}")
+    field, operator = parts[0], parts[1].lower()
+    if operator == "between":
+        if len(parts) != 4:
+            raise ValueError(f"Invalid condition '{text}'. Use: <field> between <low> <high>")
+        return field, operator, (parts[2], parts[3])
+    return field, operator, " ".join(parts[2:])
+
+def matches(record, conditions):
+    """Returns True if the record satisfies every condition."""
+    for field, operator, value in conditions:
+        actual = record.get(field)
+        actual = "" if actual is None else str(actual)
+        if operator == "=":
+            ok = actual == str(value)
+        elif operator == "!=":
+            ok = actual != str(value)
+        elif operator == "startswith":
+            ok = actual.startswith(str(value))
+        elif operator == "contains":
+            ok = str(value) in actual
+        elif operator == "between":
+            low, high = value
+            ok = value_order_key(low) <= value_order_key(actual) <= value_order_key(high)
+        else:
+            left, right = value_order_key(actual), value_order_key(value)
+            ok = {"<": left < right, "<=": left <= right, ">": left > right, ">=": left >= right}[operator]
+        if not ok:
+            return False
+    return True
+
+def index_positions(sorted_index, operator, value):
+    """
+    Returns the record indexes a sorted index can supply for one condition, or None if the
+    index cannot serve it. The index orders values exactly like the comparisons above, so
+    every range is served directly; the conditions are still checked on each record afterwards.
+    """
+    if operator == "=":
+        return sorted_index.between(value, value)
+    if operator == "startswith":
+        return sorted_index.startswith(value)
+    if operator in ("<", "<="):
+        return sorted_index.between(None, value)
+    if operator in (">", ">="):
+        return sorted_index.at_least(value)
+    if operator == "between":
+        return sorted_index.between(*value)
+    return None
+
+def plan(db_name, conditions=(), order_by=None, descending=False):
+    """
+    Chooses where a query reads its records from.
+    Returns (description, positions, ordered): `positions` is an iterator of record indexes,
+    or None for a full scan, and `ordered` tells whether they already come in `order_by` order.
+    """
+    options = fm.load_system_options(db_name)
+
+    # A primary-key match is a single hash lookup
+    for field, operator, value in conditions:
+        if operator == "=" and field == options["primary_key"]:
+            position = fm.load_key_index(db_name).lookup(value)
+            return f"primary-key lookup on '{field}'", iter([] if position is None else [position]), True
+
+    # A condition on an indexed field narrows the scan to a slice of that index,
+    # which also comes out sorted on that field
+    for field, operator, value in conditions:
+        if field not in options["indexes"]:
+            continue
+        positions = index_positions(fm.load_sorted_index(db_name, field), operator, value)
+        if positions is not None:
+            ordered = order_by is None or (order_by == field and not descending)
+            return f"index range on '{field}'", positions, ordered
+
+    # An indexed ORDER BY field lets the scan come out sorted, so a limit can stop it early
+    if order_by is not None and order_by in options["indexes"]:
+        sorted_index = fm.load_sorted_index(db_name, order_by)
+        return f"index order on '{order_by}'", sorted_index.ordered(descending), True
+
+    return "full scan", None, order_by is None
+
+def order_key(field):
+    """Sort key for (index, record) rows on one field, in the order sorted indexes use."""
+    return lambda row: value_order_key(row[1].get(field, ""))
+
+def write_run(rows, directory, run_number):
+    """Writes sorted (index, record) rows to a run file and returns its path."""
+    path = os.path.join(directory, f"run{run_number}.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        for index, record in rows:
+            f.write(json.dumps([index, record]) + "\n")
+    return path
+
+def read_run(path):
+    """Yields (index, record) rows from a run file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            index, record = json.loads(line)
+            yield index, record
+
+class SortedRuns:
+    """
+    (index, record) rows sorted within a memory budget.
+    At most `memory_limit` rows are held at once: each full chunk is sorted and spilled to a run
+    file, and the last chunk stays in memory. Iterating merges the runs lazily and can be done
+    more than once, e.g. to measure a table and then print it. close() removes the run files.
+    """
+
+    def __init__(self, rows, key, descending=False, memory_limit=SORT_MEMORY_LIMIT):
+        self.key = key
+        self.descending = descending
+        self.directory = None
+        self.runs = []
+        self.rows = []
+        for chunk in iter_chunks(rows, memory_limit):
+            chunk.sort(key=key, reverse=descending)
+            if self.rows:
+                if self.directory is None:
+                    self.directory = tempfile.TemporaryDirectory(prefix="dbms_sort_")
+                self.runs.append(write_run(self.rows, self.directory.name, len(self.runs)))
+            self.rows = chunk
+
+    def __iter__(self):
+        if not self.runs:
+            return iter(self.rows)
+        # Runs come before the in-memory chunk, so equal keys keep their original order
+        sources = [read_run(path) for path in self.runs] + [iter(self.rows)]
+        return heapq.merge(*sources, key=self.key, reverse=self.descending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.directory is not None:
+            self.directory.cleanup()
+            self.directory = None
+        self.runs = []
+        self.rows = []
+
+def iter_chunks(rows, size):
+    """Groups an iterator into lists of at most `size` items."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def external_sort(rows, key, descending=False, memory_limit=SORT_MEMORY_LIMIT):
+    """Yields the rows in order, sorting within `memory_limit` rows (see SortedRuns)."""
+    with SortedRuns(rows, key, descending, memory_limit) as sorted_rows:
+        yield from sorted_rows
+
+def select(db_name, conditions=(), fields=None, order_by=None, descending=False, limit=None,
+           memory_limit=SORT_MEMORY_LIMIT):
+    """
+    Runs a query and yields (index, record) pairs.
+    `conditions` are (field, operator, value) tuples that must all hold, `fields` projects each
+    record onto a subset of fields, `order_by` sorts on one field and `limit` caps the number of
+    results. Records are read lazily, so a limit stops reading the database as soon as it is met.
+    Sorting without an index holds at most `memory_limit` records in memory.
+    """
+    conditions = list(conditions)
+    _, positions, ordered = plan(db_name, conditions, order_by, descending)
+
+    # Source: the records chosen by the plan, decoded one at a time
+    if positions is None:
+        rows = fm.iter_records(db_name)
+    else:
+        rows = fm.get_records(db_name, positions)
+
+    # Filter
+    if conditions:
+        rows = (row for row in rows if matches(row[1], conditions))
+
+    # Order, unless the source already delivers the rows in order
+    if not ordered:
+        sort_key = order_key(order_by)
+        if limit is not None and limit <= memory_limit:
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            rows = iter(pick(limit, rows, key=sort_key))
+        else:
+            rows = external_sort(rows, sort_key, descending, memory_limit)
+
+    # Limit
+    if limit is not None:
+        rows = itertools.islice(rows, limit)
+
+    # Project
+    if fields:
+        rows = ((index, {field: record.get(field, "") for field in fields}) for index, record in rows)
+
+    return rows
+
+def encode_cursor(state):
+    """Packs a page position into an opaque cursor string."""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """Unpacks a cursor made by encode_cursor(). Raises ValueError if it is not one."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, AttributeError):
+        raise ValueError("Invalid page cursor.") from None
+    if not isinstance(state, dict):
+        raise ValueError("Invalid page cursor.")
+    return state
+
+def ties_by_id(entries, id_map, reverse=False):
+    """
+    Yields (sort key, record ID, record index) for (sort key, record index) index entries in
+    field order. An index orders equal values by record index, so each run of them is put in
+    record ID order instead (descending with `reverse`); records without an ID are skipped.
+    """
+    for sort_key, group in itertools.groupby(entries, key=lambda entry: entry[0]):
+        tied = [(id_map.id_at(position), position) for _, position in group]
+        tied = sorted((row for row in tied if row[0] is not None), reverse=reverse)
+        for record_id, position in tied:
+            yield sort_key, record_id, position
+
+def page_source(db_name, order_by, descending, key, backward, count):
+    """
+    Yields (key, record index, record) for up to `count` rows past `key` in the direction of travel:
+    forward through the page order, or backward from `key` towards the start. Keys are record
+    IDs, or [value, record ID] pairs when ordering on a field. Record IDs, unlike record
+    indexes, survive a vacuum, so a cursor still points at the same place afterwards.
+    """
+    id_map = fm.record_id_map(db_name)
+    if order_by is None:
+        while True:
+            # IDs whose record cannot be read are skipped, so fetch more until there are enough
+            if backward:
+                record_ids = id_map.ids_before(key, count)[::-1]
+            else:
+                record_ids = id_map.ids_after(key, count)
+            if not record_ids:
+                return
+            positions = [id_map.location(record_id) for record_id in record_ids]
+            records = dict(fm.get_records(db_name, positions))
+            for record_id, position in zip(record_ids, positions):
+                if position in records:
+                    yield record_id, position, records[position]
+            key = record_ids[-1]
+
+    reverse = descending != backward  # Walking the field order from high to low
+    edge = None if key is None else (value_order_key(key[0]), key[1])
+    sorted_index = fm.load_sorted_index(db_name, order_by) if order_by in fm.load_system_options(db_name)["indexes"] else None
+    if sorted_index is not None:
+        entries = sorted_index.entries_from(None if key is None else key[0], reverse)
+        rows = ties_by_id(entries, id_map, reverse)
+        if edge is not None:
+            rows = (row for row in rows if (row[:2] < edge if reverse else row[:2] > edge))
+        while True:
+            # Read the records a page-sized chunk of the index at a time
+            chunk = list(itertools.islice(rows, count))
+            if not chunk:
+                return
+            records = dict(fm.get_records(db_name, [position for _, _, position in chunk]))
+            for _, record_id, position in chunk:
+                if position in records:
+                    yield [records[position].get(order_by, ""), record_id], position, records[position]
+
+    # No index: one pass over the table keeps the page-sized run of rows nearest the cursor
+    def sort_key(row):
+        return value_order_key(row[1].get(order_by, "")), id_map.id_at(row[0])
+    rows = (row for row in fm.iter_records(db_name) if id_map.id_at(row[0]) is not None)
+    if edge is not None:
+        rows = (row for row in rows if (sort_key(row) < edge if reverse else sort_key(row) > edge))
+    pick = heapq.nlargest if reverse else heapq.nsmallest
+    for position, record in pick(count, rows, key=sort_key):
+        yield [record.get(order_by, ""), id_map.id_at(position)], position, record
+
+def read_page(db_name, cursor=None, page_size=PAGE_SIZE, order_by=None, descending=False):
+    """
+    Returns one page of records as {"rows": [(record ID, record), ...], "next": cursor,
+    "prev": cursor}. Without a cursor this is the first page; pass the "next" or "prev" cursor
+    of a page to move from it. A cursor is None when there is no page that way.
+    Records come in record ID order, or sorted on `order_by` (equal values in record ID
+    order). A cursor carries the order it was made with, so `order_by` and `descending` only
+    matter for the first page. Raises ValueError for a bad cursor or an unknown field.
+    """
+    state = {"order_by": order_by, "desc": descending} if cursor is None else decode_cursor(cursor)
+    order_by, descending = state.get("order_by"), bool(state.get("desc"))
+    key, backward = state.get("key"), bool(state.get("back"))
+    if order_by is not None and order_by not in fm.load_system_file(db_name):
+        raise ValueError(f"Field '{order_by}' does not exist.")
+    if page_size < 1:
+        raise ValueError("The page size must be at least 1.")
+
+    # Read one row more than fits, to tell whether there is another page that way
+    source = page_source(db_name, order_by, descending, key, backward, page_size + 1)
+    rows = list(itertools.islice(source, page_size + 1))
+    source.close()
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        if not more:
+            # Went back to the start of the table; show a full first page instead
+            return read_page(db_name, None, page_size, order_by, descending)
+        rows.reverse()
+
+    def make_cursor(edge_key, back):
+        return encode_cursor({"order_by": order_by, "desc": descending, "key": edge_key, "back": back})
+
+    id_map = fm.record_id_map(db_name)
+    page = {"rows": [(id_map.id_at(position), record) for _, position, record in rows], "next": None, "prev": None}
+    if rows:
+        if more or backward:
+            page["next"] = make_cursor(rows[-1][0], False)
+        if key is not None:
+            page["prev"] = make_cursor(rows[0][0], True)
+    elif key is not None:
+        page["prev"] = make_cursor(key, True)  # Past the end, e.g. after the last rows were deleted
+    return page
+
+def record_total(db_name):
+    """Returns the number of live records, from the record ID map."""
+    return fm.record_id_map(db_name).size()
+
+def read_window(db_name, start, count):
+    """
+    Returns (record ID, record) pairs for the `start`-th to the (`start` + `count` - 1)-th
+    record in record ID order, counting from 0. The sorted IDs are kept in memory, so any
+    window, e.g. where a scrollbar was dragged to, is found without reading the records before it.
+    """
+    id_map = fm.record_id_map(db_name)
+    record_ids = id_map.ids_from(start, count)
+    positions = [id_map.location(record_id) for record_id in record_ids]
+    records = dict(fm.get_records(db_name, positions))
+    return [(record_id, records[position]) for record_id, position in zip(record_ids, positions) if position in records]
@@ -0,0 +1,135 @@
+import collections
+import tkinter as tk
+from tkinter import font, ttk
+import query
+
+# Scrolling record grid for the Tk front ends.
+# The ttk.Treeview only ever holds the rows that fit on screen. The scrollbar is driven by
+# hand: its position stands for the first visible row out of every record in the table, and
+# scrolling refills the same few rows with the records at the new position. Records are read
+# from storage in blocks of FETCH_BLOCK rows as they come into view, and only the most recent
+# CACHED_BLOCKS blocks are kept, so memory use and drawing time do not grow with the table.
+#
+#   grid = RecordGrid(window, "students", fields)
+#   grid.frame.pack(fill=tk.BOTH, expand=True)
+
+FETCH_BLOCK = 200  # Records read from storage at a time
+CACHED_BLOCKS = 8  # Blocks kept in memory for scrolling back and forth
+VISIBLE_ROWS = 20  # Rows shown at once
+MAX_COLUMN_CHARS = 40  # Wider fields are cut to this many characters on screen
+
+class RecordGrid:
+    """A grid showing the records of one database in record ID order."""
+
+    def __init__(self, parent, db_name, fields, visible_rows=VISIBLE_ROWS):
+        self.db_name = db_name
+        self.fields = list(fields)
+        self.visible_rows = visible_rows
+        self.top = 0      # Position of the first visible record
+        self.total = 0    # Number of records in the table
+        self.blocks = collections.OrderedDict()  # block number -> rows, least recently used first
+
+        self.frame = ttk.Frame(parent)
+        columns = ["ID"] + self.fields
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=visible_rows, selectmode="browse")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scroll)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.frame.columnconfigure(0, weight=1)
+
+        # Columns are as wide as the schema allows, so nothing has to be read to size them
+        char_width = font.nametofont("TkDefaultFont").measure("0")
+        self.tree.heading("ID", text="ID")
+        self.tree.column("ID", width=8 * char_width, stretch=False, anchor=tk.E)
+        for field, max_length in fields.items():
+            self.tree.heading(field, text=field)
+            self.tree.column(field, width=max(len(field), min(max_length, MAX_COLUMN_CHARS)) * char_width + 10)
+
+        # The Treeview never has anything to scroll itself, so wheel and keys move the window instead
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_by(-1 if event.delta > 0 else 1, "units", 3))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-1, "units", 3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(1, "units", 3))
+        self.tree.bind("<Prior>", lambda event: self.scroll_by(-1, "pages"))
+        self.tree.bind("<Next>", lambda event: self.scroll_by(1, "pages"))
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0))
+        self.tree.bind("<End>", lambda event: self.scroll_to(self.total))
+        self.tree.bind("<Up>", lambda event: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda event: self.move_selection(1))
+
+        self.refresh()
+
+    def refresh(self):
+        """Re-reads the table, e.g. after records were added, edited or deleted."""
+        self.blocks.clear()
+        self.total = query.record_total(self.db_name)
+        self.scroll_to(self.top)
+
+    def rows(self, start, count):
+        """Returns the (record ID, record) rows at positions start .. start + count - 1."""
+        rows = []
+        for block in range(start // FETCH_BLOCK, (start + count - 1) // FETCH_BLOCK + 1):
+            rows.extend((block * FETCH_BLOCK + i, row) for i, row in enumerate(self.block(block)))
+        return [row for position, row in rows if start <= position < start + count]
+
+    def block(self, number):
+        """Returns one block of rows, reading it from storage unless it is cached."""
+        if number in self.blocks:
+            self.blocks.move_to_end(number)
+            return self.blocks[number]
+        rows = query.read_window(self.db_name, number * FETCH_BLOCK, FETCH_BLOCK)
+        self.blocks[number] = rows
+        if len(self.blocks) > CACHED_BLOCKS:
+            self.blocks.popitem(last=False)
+        return rows
+
+    def scroll_to(self, top):
+        """Shows the records from position `top` on and moves the scrollbar to match."""
+        self.top = max(0, min(top, self.total - self.visible_rows))
+        selected = self.selected_id()
+        self.tree.delete(*self.tree.get_children())
+        rows = self.rows(self.top, self.visible_rows) if self.total else []
+        for record_id, record in rows:
+            values = [record_id] + [str(record.get(field, ""))[:MAX_COLUMN_CHARS] for field in self.fields]
+            self.tree.insert("", tk.END, iid=str(record_id), values=values)
+        if selected is not None and self.tree.exists(str(selected)):
+            self.tree.selection_set(str(selected))
+        if self.total:
+            self.scrollbar.set(self.top / self.total, (self.top + len(rows)) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_by(self, amount, what, step=1):
+        """Scrolls by `amount` rows (times `step`) or by `amount` screenfuls."""
+        rows = self.visible_rows if what.startswith("page") else step
+        self.scroll_to(self.top + int(amount) * rows)
+        return "break"
+
+    def on_scroll(self, action, amount, what=None):
+        """Called by the scrollbar when it is dragged ("moveto") or its arrows are used ("scroll")."""
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        else:
+            self.scroll_by(amount, what)
+
+    def move_selection(self, step):
+        """Moves the selection one row up or down, scrolling when it leaves the screen."""
+        items = self.tree.get_children()
+        selection = self.tree.selection()
+        if not items:
+            return "break"
+        row = items.index(selection[0]) + step if selection else 0
+        if row < 0:
+            self.scroll_to(self.top - 1)
+            row = 0
+        elif row >= len(items):
+            self.scroll_to(self.top + 1)
+            row = len(self.tree.get_children()) - 1
+        items = self.tree.get_children()
+        self.tree.selection_set(items[row])
+        self.tree.see(items[row])
+        return "break"
+
+    def selected_id(self):
+        """Returns the ID of the selected record, or None."""
+        selection = self.tree.selection()
+        return int(selection[0]) if selection else None
@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import tempfile
+import file_manager as fm
+
+# Regression check for stable record IDs.
+# Records are added one at a time to a database with no primary key or sorted index (where
+# an earlier bug gave every new record the ID of slot 0), one is deleted by ID, the data file
+# is vacuumed and more records are added. Every ID must keep leading to its own record, also
+# after the database is reopened, and no ID may ever be handed out twice.
+#
+#   python record_id_check.py --storage json
+
+DB_NAME = "ids"
+FIELDS = {"name": 10}
+
+def check_ids(db, expected):
+    """Returns the problems found reading each {record ID: name} in `expected` back by ID."""
+    problems = []
+    for record_id, name in expected.items():
+        record = db.get_by_id(record_id)
+        if record != {"name": name}:
+            problems.append(f"ID {record_id} reads {record}, not {name}")
+    names = sorted(record["name"] for _, record in db.iter_records())
+    if names != sorted(expected.values()):
+        problems.append(f"the table holds {names}, not {sorted(expected.values())}")
+    return problems
+
+def run(storage):
+    """Runs the check in the current directory. Returns the problems found."""
+    fm.create_database_files(DB_NAME, FIELDS, storage)
+    db = fm.open_database(DB_NAME)
+    expected = {db.add({"name": name}): name for name in ("ann", "bob", "cat", "dan")}
+    problems = check_ids(db, expected)
+
+    deleted = next(record_id for record_id, name in expected.items() if name == "cat")
+    try:
+        db.remove_by_id(deleted)
+    except IndexError as e:
+        problems.append(f"deleting ID {deleted}: {e}")
+    del expected[deleted]
+    problems += check_ids(db, expected)
+
+    db.vacuum()
+    problems += check_ids(db, expected)
+    issued = set(expected) | {deleted}
+    new_ids = [db.add({"name": "eve"})] + db.add_many([{"name": "fay"}, {"name": "gus"}])
+    for record_id in new_ids:
+        if record_id in issued or record_id < max(issued):
+            problems.append(f"new ID {record_id} reuses or precedes an earlier ID ({sorted(issued)})")
+        issued.add(record_id)
+    expected.update(zip(new_ids, ("eve", "fay", "gus")))
+    problems += check_ids(db, expected)
+
+    fm.close_database(DB_NAME)
+    problems += [f"after reopening: {problem}" for problem in check_ids(fm.open_database(DB_NAME), expected)]
+    fm.close_database(DB_NAME)
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that record IDs stay with their records and are never reused.")
+    parser.add_argument("--storage", choices=fm.STORAGE_FORMATS, action="append",
+                        help="storage format to check; repeat for several (default: all of them)")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for storage in args.storage or fm.STORAGE_FORMATS:
+        # Work in a scratch directory so no real database is touched
+        with tempfile.TemporaryDirectory(prefix="dbms_ids_") as directory:
+            previous = os.getcwd()
+            os.chdir(directory)
+            try:
+                problems = run(storage)
+            finally:
+                os.chdir(previous)
+        for problem in problems:
+            print(f"Problem ({storage}): {problem}")
+        print(f"{storage}: {'OK' if not problems else 'FAILED'}")
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
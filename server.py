@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import sys
+import async_api
+import protocol
+import query
+from protocol import DEFAULT_HOST, DEFAULT_PORT
+
+# Database server.
+# One process keeps every database it has been asked about open, with its schema, indexes and
+# records cached, and serves requests from local clients over TCP using the framed protocol in
+# protocol.py. Each request runs as its own task, so reads a client pipelines on one connection
+# are worked on together (and their point reads coalesced) and answered as soon as each is done.
+# A change waits for the requests sent before it and holds back the ones sent after it, so a
+# connection sees its own changes in the order it sent them.
+#
+#   python server.py --port 7878
+#
+# Operations (arguments besides "id", "op" and "db"):
+#   ping                                     -> "pong" (needs no "db")
+#   add       record                         -> ID of the new record
+#   add_many  records                        -> list of IDs
+#   get       index or record_id             -> record or null
+#   get_many  indexes                        -> list of records or nulls
+#   edit      index or record_id, record     -> null
+#   delete    index or record_id             -> null
+#   query     conditions, fields, order_by, descending, limit
+#                                            -> list of [index, record]
+#   count                                    -> number of records
+#
+# Conditions are [field, operator, value] lists, or strings such as "roll >= 5".
+
+READ_OPERATIONS = ("ping", "get", "get_many", "count", "query")
+
+def record_argument(request, name):
+    """Returns the record sent under `name`. Raises ValueError if it is not an object."""
+    record = request.get(name)
+    if not isinstance(record, dict):
+        raise ValueError(f"'{name}' must be an object of field values.")
+    return record
+
+class DatabaseServer:
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.databases = {}  # name -> task opening its AsyncDatabase, kept open for the life of the server
+        self.requests = 0
+
+    async def database(self, db_name):
+        """
+        Returns the handle on the specified database, opening it on first use. The opening task
+        is cached before it is awaited, so connections asking at the same time share one handle.
+        """
+        opening = self.databases.get(db_name)
+        if opening is None:
+            opening = self.databases[db_name] = asyncio.ensure_future(async_api.open_database(db_name, self.executor))
+        try:
+            return await asyncio.shield(opening)
+        except Exception:
+            if self.databases.get(db_name) is opening:
+                del self.databases[db_name]  # A database created later can still be opened
+            raise
+
+    async def handle(self, request):
+        """Carries out one request and returns its result. Raises on a bad request."""
+        op = request.get("op")
+        if op == "ping":
+            return "pong"
+        if not isinstance(request.get("db"), str):
+            raise ValueError("Missing database name.")
+        db = await self.database(request["db"])
+        if op == "add":
+            return await db.insert(record_argument(request, "record"))
+        if op == "add_many":
+            records = request.get("records")
+            if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+                raise ValueError("'records' must be a list of objects of field values.")
+            return await db.insert_many(records)
+        if op == "get" and "record_id" in request:
+            return await db.get_by_id(int(request["record_id"]))
+        if op == "get":
+            return await db.get(int(request["index"]))
+        if op == "get_many":
+            return await db.get_many([int(index) for index in request["indexes"]])
+        if op == "edit" and "record_id" in request:
+            return await db.update_by_id(int(request["record_id"]), record_argument(request, "record"))
+        if op == "edit":
+            return await db.update(int(request["index"]), record_argument(request, "record"))
+        if op == "delete" and "record_id" in request:
+            return await db.delete_by_id(int(request["record_id"]))
+        if op == "delete":
+            return await db.delete(int(request["index"]))
+        if op == "count":
+            return await db.count()
+        if op == "query":
+            conditions = [query.parse_condition(condition) if isinstance(condition, str) else tuple(condition)
+                          for condition in request.get("conditions", [])]
+            conditions = [(field, operator, tuple(value) if operator == "between" else value)
+                          for field, operator, value in conditions]
+            rows = db.scan(conditions, request.get("fields"), request.get("order_by"),
+                           bool(request.get("descending")), request.get("limit"))
+            return [[index, record] async for index, record in rows]
+        raise ValueError(f"Unknown operation '{op}'.")
+
+    async def respond(self, request, writer, after=()):
+        """Answers one request once the tasks in `after` have finished."""
+        if after:
+            await asyncio.gather(*after, return_exceptions=True)
+        request_id = request.get("id")
+        # Every request gets a response, even when it fails unexpectedly, or its client would wait forever
+        try:
+            frame = protocol.encode_frame({"id": request_id, "ok": True, "result": await self.handle(request)})
+        except Exception as e:
+            frame = protocol.encode_frame(protocol.error_response(request_id, e))
+        self.requests += 1
+        # A frame is written in one call, so responses of concurrent requests never interleave
+        writer.write(frame)
+        await writer.drain()
+
+    async def serve_connection(self, reader, writer):
+        """Reads requests until the client disconnects, answering each in its own task."""
+        last_change = None  # The latest change request, which later requests wait for
+        reads = []          # Reads sent since then, which the next change waits for
+        try:
+            while True:
+                try:
+                    request = await protocol.read_frame_async(reader)
+                except (ValueError, asyncio.IncompleteReadError):
+                    break  # Not our protocol, or cut off mid-frame
+                if request is None:
+                    break
+                if request.get("op") in READ_OPERATIONS:
+                    after = [last_change] if last_change is not None else []
+                    reads = [task for task in reads if not task.done()]
+                    reads.append(asyncio.ensure_future(self.respond(request, writer, after)))
+                else:
+                    after = reads + ([last_change] if last_change is not None else [])
+                    last_change = asyncio.ensure_future(self.respond(request, writer, after))
+                    reads = []
+            pending = reads + ([last_change] if last_change is not None else [])
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Starts listening and returns the asyncio server."""
+        return await asyncio.start_server(self.serve_connection, host, port)
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    server = await DatabaseServer().start(host, port)
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    print(f"Serving databases on {addresses}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve databases in the current directory to local clients.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+
+# Write-ahead log for JSON databases.
+# Every add, edit and delete is appended to <db>_data.log as one JSON line before it counts as
+# done, and the data file itself is only rewritten when the log is checkpointed into it.
+#
+# Group commit: appending only hands the entry to the operating system; durability comes from
+# wait(), which fsyncs the log. Writers that wait while another fsync is running are covered
+# by the next one together, so many concurrent changes share a single fsync.
+#
+# Checkpoints replace the data file and the log with two renames. The new log is written to
+# <log>.next first, so after a crash recover() can tell from the leftover files whether the new
+# data file was swapped in, and finish or undo the checkpoint accordingly.
+
+def fsync_directory(path):
+    """Makes renames in the directory holding `path` durable, where the platform allows it."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def truncate_torn_tail(log_file):
+    """Cuts off a final log entry left incomplete by a crash, so later appends are not lost behind it."""
+    if not os.path.exists(log_file):
+        return
+    good_size = 0
+    with open(log_file, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            good_size += len(line)
+    if good_size != os.path.getsize(log_file):
+        with open(log_file, 'r+b') as f:
+            f.truncate(good_size)
+            os.fsync(f.fileno())
+
+def recover(data_file, log_file):
+    """
+    Brings the data file and log back to a consistent pair after a crash.
+    A leftover <log>.next means a checkpoint was interrupted: if the new data file is still
+    waiting as <data>.tmp the old pair is intact and the checkpoint is dropped; otherwise the
+    data file was already replaced and the new log is moved into place.
+    """
+    temp_file = f"{data_file}.tmp"
+    next_log = f"{log_file}.next"
+    if os.path.exists(next_log):
+        if os.path.exists(temp_file):
+            os.remove(next_log)
+        else:
+            os.replace(next_log, log_file)
+            if os.path.getsize(log_file) == 0:
+                os.remove(log_file)
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    truncate_torn_tail(log_file)
+
+class WriteAheadLog:
+    """Append-only log file with group commit. Callers serialise append() themselves."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+        self.synced = threading.Condition(self.lock)
+        self.written = 0    # tickets handed out by append()
+        self.durable = 0    # highest ticket known to be on disk
+        self.syncing = False
+        self.sync_count = 0  # fsyncs issued, to see how well commits are grouped
+
+    def open_file(self):
+        # Reopen the log if it was replaced or removed since it was opened
+        if self.file is not None:
+            try:
+                same = os.fstat(self.file.fileno()).st_ino == os.stat(self.path).st_ino
+            except FileNotFoundError:
+                same = False
+            if not same:
+                self.file.close()
+                self.file = None
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        return self.file
+
+    def append(self, entries):
+        """
+        Writes the entries at the end of the log and returns a ticket to pass to wait().
+        The entries are visible to readers straight away but not yet safe from a power failure.
+        """
+        data = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with self.lock:
+            f = self.open_file()
+            f.write(data)
+            f.flush()
+            self.written += 1
+            return self.written
+
+    def wait(self, ticket):
+        """Blocks until everything up to `ticket` is on disk. Waiters arriving together share one fsync."""
+        with self.lock:
+            while self.durable < ticket:
+                if self.syncing:
+                    self.synced.wait()
+                    continue
+                # Become the leader: sync everything written so far on behalf of every waiter
+                self.syncing = True
+                target = self.written
+                fd = os.dup(self.file.fileno())
+                self.lock.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                    self.lock.acquire()
+                    self.syncing = False
+                    self.synced.notify_all()
+                self.durable = max(self.durable, target)
+                self.sync_count += 1
+
+    def size(self):
+        """Current size of the log file in bytes."""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def close(self):
+        """Syncs and closes the log file, e.g. before it is replaced by a checkpoint."""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+            self.durable = self.written
+            self.synced.notify_all()
@@ -1,6 +1,21 @@
 import tkinter as tk
 from tkinter import simpledialog, messagebox
 import file_manager as fm  # Assuming this contains your file handling functions
+import query
+import record_grid
+
+def show_record_grid(master, db_name, fields):
+    """
+    Opens a window with the records of a database in a scrolling grid. Only the visible rows
+    are drawn, and records are read as they scroll into view, however many there are.
+    """
+    if not query.record_total(db_name):
+        messagebox.showinfo("Info", "No records found.")
+        return
+    window = tk.Toplevel(master)
+    window.title(f"Records in '{db_name}'")
+    grid = record_grid.RecordGrid(window, db_name, fields)
+    grid.frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
 class SimpleDBMS:
     def __init__(self, master):
@@ -35,7 +50,7 @@ class SimpleDBMS:
 
         # Record Management Buttons
         self.record_buttons = []  # Store the record management buttons
-        self.records = []  # Initialize records
+        self.db = None  # Shared handle on the open database
         self.current_db_name = None  # Keep track of the current database name
 
     def create_database(self):
@@ -100,8 +115,9 @@ class SimpleDBMS:
             messagebox.showwarning("Warning", f"Database '{db_name}' does not exist.")
             return
 
-        fields, self.records = fm.load_database_files(db_name)  # Assuming this function exists
-        self.display_records(db_name, fields, self.records)
+        self.db = fm.open_database(db_name)  # Shared handle; reopening the same database reuses its cache
+        fields = self.db.fields
+        self.display_all_records(fields)
 
         # Inform the user that they are now working in this database
         messagebox.showinfo("Database Opened", f"You are now working with the database '{db_name}'.")
@@ -158,8 +174,8 @@ class SimpleDBMS:
         pass
 
     def display_all_records(self, fields):
-        # Implement your display all records logic here
-        pass
+        """Shows the records of the open database in a scrolling grid window."""
+        show_record_grid(self.master, self.db.name, fields)
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -276,8 +292,9 @@ class SimpleDBMS:
             messagebox.showwarning("Warning", f"Database '{db_name}' does not exist.")
             return
 
-        fields, records = fm.load_database_files(db_name)
-        self.display_records(db_name, fields, records)
+        db = fm.open_database(db_name)
+        fields = db.fields
+        self.display_records(db_name, fields)
 
         # Add a button to add records
         add_record_button = tk.Button(self.master, text="Add Record", command=lambda: self.add_record(db_name, fields), bg="#FFC107")
@@ -293,24 +310,17 @@ class SimpleDBMS:
                 return
             record[field] = value
 
-        # Load existing records
-        records = fm.load_data_file(db_name) or []
-        
-        # Append the new record to the list of records
-        records.append(record)
-        
-        # Save the updated records back to the data file
-        fm.save_data_file(db_name, records)
+        # Append only the new record to the log instead of rewriting the data file
+        try:
+            fm.open_database(db_name).add(record)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
         messagebox.showinfo("Success", "Record added successfully.")
 
-    def display_records(self, db_name, fields, records):
-        """Displays all records in the specified database."""
-        if not records:
-            messagebox.showinfo("Info", "No records found.")
-            return
-        
-        records_display = "\n".join([f"{index + 1}: {record}" for index, record in enumerate(records)])
-        messagebox.showinfo("Records", f"Records in '{db_name}':\n{records_display}")
+    def display_records(self, db_name, fields):
+        """Displays the records in the specified database in a scrolling grid."""
+        show_record_grid(self.master, db_name, fields)
 
     def delete_database(self):
         """Deletes the entire database."""